@@ -2,6 +2,7 @@ from .core import operators
 from .core.data_block import DataBlock
 from .core.environment import Environment, current_env, produce, run_graph, run_node
 from .core.execution import PipeContext
+from .core.gc import RetentionPolicy
 from .core.graph import DeclaredGraph, Graph, graph
 from .core.module import SnapflowModule
 from .core.node import DeclaredNode, Node, node
@@ -9,11 +9,17 @@ import requests
 from loguru import logger
 from snapflow.core.data_block import DataBlockMetadata
 from snapflow.core.environment import Environment, current_env
+from snapflow.core.metadata.migrations import get_metadata_version
 from snapflow.core.metadata.orm import SNAPFLOW_METADATA_TABLE_PREFIX
 from snapflow.core.node import DataBlockLog, PipeLog
 from snapflow.core.typing.inference import dict_to_rough_schema
 from snapflow.project.project import SNAPFLOW_PROJECT_FILE_NAME, init_project_in_dir
 from snapflow.schema.base import schema_to_yaml
+from snapflow.storage.data_copy.calibration import (
+    DEFAULT_CALIBRATION_RECORD_COUNT,
+    calibrate_copiers,
+    save_calibration,
+)
 from snapflow.utils import common
 from snapflow.utils.common import cf
 from sqlalchemy import func
@@ -192,10 +198,51 @@ def list_nodes(env: Environment):
     echo_table(headers, rows)
 
 
+def list_timings(env: Environment):
+    with env.session_scope() as sess:
+        query = (
+            sess.query(PipeLog)
+            .filter(PipeLog.timings.isnot(None))
+            .order_by(PipeLog.started_at.desc())
+        )
+        rows = []
+        for pl in query:
+            for phase, t in sorted(
+                pl.timings.items(), key=lambda kv: kv[1]["seconds"], reverse=True
+            ):
+                rows.append(
+                    [
+                        pl.started_at.strftime("%F %T"),
+                        pl.node_key,
+                        phase,
+                        f"{t['seconds']:.4f}",
+                        t["calls"],
+                        t.get("records", "-"),
+                        t.get("records_per_second", "-"),
+                    ]
+                )
+        headers = [
+            "Started",
+            "Node",
+            "Phase",
+            "Seconds",
+            "Calls",
+            "Records",
+            "Records/s",
+        ]
+        echo_table(headers, rows)
+
+
 @click.command("logs")
+@click.option(
+    "-t", "--timings", is_flag=True, help="Show time spent per phase of each run"
+)
 @click.pass_obj
-def logs(env: Environment):
+def logs(env: Environment, timings: bool = False):
     """Show log of Pipes on DataBlocks"""
+    if timings:
+        list_timings(env)
+        return
     with env.session_scope() as sess:
         query = sess.query(PipeLog).order_by(PipeLog.updated_at.desc())
         drls = []
@@ -265,6 +312,48 @@ def reset_metadata(env: Environment):
         )
 
 
+@click.command("migrate")
+@click.pass_obj
+def migrate(env: Environment):
+    """Upgrade metadata database to the latest version"""
+    applied = env.upgrade_metadata()
+    for m in applied:
+        click.echo(f"Applied migration {m.version}: {m.description}")
+    with env.session_scope() as sess:
+        version = get_metadata_version(sess.connection())
+    click.echo(f"Metadata at version {version}")
+
+
+@click.command("calibrate")
+@click.option("-o", "--output", default="copy_calibration.json", help="Path to save to")
+@click.option(
+    "-n",
+    "--record-count",
+    default=DEFAULT_CALIBRATION_RECORD_COUNT,
+    help="Sample records per run",
+)
+def calibrate(output: str, record_count: int):
+    """Benchmark data copiers, for size-aware copy costs"""
+    calibrations, cost_per_second = calibrate_copiers(record_count=record_count)
+    save_calibration(output, calibrations, cost_per_second)
+    echo_table(
+        ["Copier", "Fixed (s)", "Per record (s)", "Per byte (s)"],
+        [
+            [
+                k,
+                f"{c.fixed_seconds:.2e}",
+                f"{c.per_record_seconds:.2e}",
+                f"{c.per_byte_seconds:.2e}",
+            ]
+            for k, c in calibrations.items()
+        ],
+    )
+    click.echo(
+        f"Saved calibration of {len(calibrations)} copiers to {output}, "
+        "use it with `Environment(copy_calibration_path=...)`"
+    )
+
+
 @click.command("init")
 @click.pass_context
 def init_project(ctx: click.Context):
@@ -305,5 +394,7 @@ app.add_command(blocks)
 app.add_command(nodes)
 # app.add_command(search)
 app.add_command(reset_metadata)
+app.add_command(migrate)
+app.add_command(calibrate)
 app.add_command(test)
 app.add_command(init_project)
@@ -6,7 +6,12 @@ from typing import TYPE_CHECKING, Any, Generic, Iterator, Optional, Tuple, Type
 from loguru import logger
 from pandas import DataFrame
 from snapflow.core.environment import Environment
-from snapflow.core.metadata.orm import BaseModel, timestamp_increment_key
+from snapflow.core.metadata.orm import (
+    SNAPFLOW_METADATA_TABLE_PREFIX,
+    BaseModel,
+    timestamp_increment_key,
+)
+from snapflow.core.profiling import timed
 from snapflow.core.typing.casting import cast_to_realized_schema
 from snapflow.core.typing.inference import infer_schema_from_db_table
 from snapflow.schema import Schema, SchemaKey, SchemaLike, SchemaTranslation
@@ -36,7 +41,16 @@ from snapflow.storage.storage import PythonStorageClass
 from snapflow.utils.common import as_identifier, rand_str
 from snapflow.utils.registry import ClassBasedEnumSqlalchemyType
 from snapflow.utils.typing import T
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, event, or_
+from sqlalchemy import (
+    Boolean,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    event,
+    or_,
+)
 from sqlalchemy.orm import RelationshipProperty, Session, relationship
 
 if TYPE_CHECKING:
@@ -60,6 +74,13 @@ class DataBlockMetadata(BaseModel):  # , Generic[DT]):
     # NOTE on block ids: we generate them dynamically so we don't have to hit a central db for a sequence
     # BUT we MUST ensure they are monotonically ordered -- the logic of selecting the correct (most recent)
     # block relies on strict monotonic IDs in some scenarios
+    __table_args__ = (
+        # Stream schema filters
+        Index(
+            f"ix_{SNAPFLOW_METADATA_TABLE_PREFIX}block_nominal_schema",
+            "nominal_schema_key",
+        ),
+    )
     id = Column(String(128), primary_key=True, default=get_datablock_id)
     # id = Column(Integer, primary_key=True, autoincrement=True)
     inferred_schema_key: SchemaKey = Column(String(128), nullable=True)  # type: ignore
@@ -183,6 +204,14 @@ DataBlock = ManagedDataBlock
 
 
 class StoredDataBlockMetadata(BaseModel):
+    __table_args__ = (
+        # `ensure_data_block_on_storage` and stream storage filters
+        Index(
+            f"ix_{SNAPFLOW_METADATA_TABLE_PREFIX}sdb_block_storage",
+            "data_block_id",
+            "storage_url",
+        ),
+    )
     id = Column(String(128), primary_key=True, default=get_datablock_id)
     # id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(128), nullable=True)
@@ -466,12 +495,17 @@ def create_data_block_from_records(
     if not nominal_schema:
         nominal_schema = env.get_schema("Any", sess)
     if not inferred_schema:
-        inferred_schema = dro.data_format.infer_schema_from_records(dro.records_object)
-        env.add_new_generated_schema(inferred_schema, sess)
+        with timed("infer_schema"):
+            inferred_schema = dro.data_format.infer_schema_from_records(
+                dro.records_object
+            )
+            env.add_new_generated_schema(inferred_schema, sess)
     realized_schema = cast_to_realized_schema(
         env, sess, inferred_schema, nominal_schema
     )
-    dro = dro.conform_to_schema(realized_schema)
+    with timed("conform_to_schema") as span:
+        dro = dro.conform_to_schema(realized_schema)
+        span.records = dro.record_count
     block = DataBlockMetadata(
         id=get_datablock_id(),
         inferred_schema_key=inferred_schema.key if inferred_schema else None,
@@ -502,50 +536,56 @@ def create_data_block_from_sql(
     nominal_schema: Schema = None,
     inferred_schema: Schema = None,
     created_by_node_key: str = None,
+    as_view: bool = False,
 ) -> Tuple[DataBlockMetadata, StoredDataBlockMetadata]:
     # TODO: we are special casing sql right now, but could create another DataFormat (SqlQueryFormat, non-storable).
     #       but, not sure how well it fits paradigm (it's a fundamentally non-python operation, the only one for now --
     #       if we had an R runtime or any other shell command, they would also be in this bucket)
     #       fine here for now, but there is a generalization that might make the sql pipe less awkward (returning sdb)
     logger.debug("CREATING DATA BLOCK from sql")
-    tmp_name = f"_tmp_{rand_str(10)}".lower()
-    sql = db_api.clean_sub_sql(sql)
-    create_sql = f"""
-    create table {tmp_name} as
-    select
-    *
-    from (
-    {sql}
-    ) as __sub
-    """
-    db_api.execute_sql(create_sql)
-    cnt = db_api.count(tmp_name)
-    if not nominal_schema:
-        nominal_schema = env.get_schema("Any", sess)
-    if not inferred_schema:
-        inferred_schema = infer_schema_from_db_table(db_api, tmp_name)
-        env.add_new_generated_schema(inferred_schema, sess)
-    realized_schema = cast_to_realized_schema(
-        env, sess, inferred_schema, nominal_schema
-    )
     block = DataBlockMetadata(
         id=get_datablock_id(),
-        inferred_schema_key=inferred_schema.key if inferred_schema else None,
-        nominal_schema_key=nominal_schema.key,
-        realized_schema_key=realized_schema.key,
-        record_count=cnt,
         created_by_node_key=created_by_node_key,
     )
-    storage_url = db_api.url
     sdb = StoredDataBlockMetadata(
         id=get_datablock_id(),
         data_block_id=block.id,
         data_block=block,
-        storage_url=storage_url,
+        storage_url=db_api.url,
         data_format=DatabaseTableFormat,
     )
+    sql = db_api.clean_sub_sql(sql)
+    if as_view:
+        # Views can't be renamed on all databases, so create under the final name.
+        # They are not counted either, that would run the query.
+        name = sdb.get_name()
+        db_api.execute_sql(f"create view {name} as {sql}")
+    else:
+        name = f"_tmp_{rand_str(10)}".lower()
+        create_sql = f"""
+        create table {name} as
+        select
+        *
+        from (
+        {sql}
+        ) as __sub
+        """
+        db_api.execute_sql(create_sql)
+        block.record_count = db_api.count(name)
+    if not nominal_schema:
+        nominal_schema = env.get_schema("Any", sess)
+    if not inferred_schema:
+        inferred_schema = infer_schema_from_db_table(db_api, name)
+        env.add_new_generated_schema(inferred_schema, sess)
+    realized_schema = cast_to_realized_schema(
+        env, sess, inferred_schema, nominal_schema
+    )
+    block.inferred_schema_key = inferred_schema.key if inferred_schema else None
+    block.nominal_schema_key = nominal_schema.key
+    block.realized_schema_key = realized_schema.key
     sess.add(block)
     sess.add(sdb)
     # sess.flush([block, sdb])
-    db_api.rename_table(tmp_name, sdb.get_name())
+    if not as_view:
+        db_api.rename_table(name, sdb.get_name())
     return block, sdb
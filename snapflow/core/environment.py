@@ -5,15 +5,25 @@ import os
 from contextlib import contextmanager
 from dataclasses import asdict
 from importlib import import_module
-from typing import TYPE_CHECKING, Any, Iterator, List, Optional, Tuple, Union
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import strictyaml
 from loguru import logger
 from snapflow.core.component import ComponentLibrary
+from snapflow.core.metadata.listeners import (
+    apply_pending_cache_puts,
+    get_pending_put,
+    put_after_commit,
+)
+from snapflow.core.metadata.migrations import Migration, upgrade_metadata
 from snapflow.core.metadata.orm import BaseModel
 from snapflow.core.module import DEFAULT_LOCAL_MODULE, SnapflowModule
 from snapflow.schema.base import GeneratedSchema, Schema, SchemaLike
 from snapflow.storage.storage import DatabaseStorageClass, PythonStorageClass
+from snapflow.utils.common import LRUCache
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, sessionmaker
 
 if TYPE_CHECKING:
@@ -21,10 +31,13 @@ if TYPE_CHECKING:
     from snapflow.core.pipe import Pipe
     from snapflow.core.node import Node, NodeLike
     from snapflow.core.execution import RunContext, ExecutionManager
-    from snapflow.core.data_block import DataBlock
+    from snapflow.core.data_block import DataBlock, DataBlockMetadata
+    from snapflow.core.lineage import BlockLike
+    from snapflow.core.gc import GarbageCollectionResult, RetentionPolicy
     from snapflow.core.graph import Graph, DeclaredGraph, DEFAULT_GRAPH
 
 DEFAULT_METADATA_STORAGE_URL = "sqlite://"  # in-memory sqlite
+DEFAULT_SCHEMA_CACHE_SIZE = 1024
 
 
 class Environment:
@@ -38,9 +51,19 @@ class Environment:
         metadata_storage: Union["Storage", str] = None,
         add_default_python_runtime: bool = True,
         initial_modules: List[SnapflowModule] = None,  # Defaults to `core` module
+        auto_upgrade_metadata: bool = True,
+        schema_cache_size: int = DEFAULT_SCHEMA_CACHE_SIZE,
+        remove_dead_memory_blocks: bool = False,
+        memory_budget_bytes: Optional[int] = None,
+        copy_calibration_path: Optional[str] = None,
     ):
         from snapflow.core.runtime import Runtime, LocalPythonRuntimeEngine
-        from snapflow.storage.storage import Storage, new_local_python_storage
+        from snapflow.storage.data_copy.calibration import load_calibration
+        from snapflow.storage.storage import (
+            LOCAL_PYTHON_STORAGE,
+            Storage,
+            new_local_python_storage,
+        )
         from snapflow.modules import core
 
         self.name = name
@@ -54,12 +77,26 @@ class Environment:
         if metadata_storage is None:
             raise Exception("Must specify metadata_storage or allow default")
         self.metadata_storage = metadata_storage
+        self.auto_upgrade_metadata = auto_upgrade_metadata
+        if copy_calibration_path is not None:
+            # Process-wide, see `snapflow.storage.data_copy.calibration`
+            load_calibration(copy_calibration_path)
+        if memory_budget_bytes is not None:
+            # Process-wide, shared by all environments
+            LOCAL_PYTHON_STORAGE.budget_bytes = memory_budget_bytes
         self.initialize_metadata_database()
+        if remove_dead_memory_blocks:
+            self.remove_dead_memory_blocks()
         self._local_module = DEFAULT_LOCAL_MODULE
         self.library = ComponentLibrary()
         self.storages = []
         self.runtimes = []
         self._metadata_sessions: List[Session] = []
+        self.schema_cache: LRUCache[str, Schema] = LRUCache(schema_cache_size)
+        # Realized schema per (inferred, nominal, cast level), see `cast_to_realized_schema`
+        self.realized_schemas: LRUCache[Tuple[str, str, Any], Schema] = LRUCache(
+            schema_cache_size
+        )
         # if add_default_python_runtime:
         #     self.runtimes.append(
         #         Runtime(
@@ -83,9 +120,56 @@ class Environment:
             raise ValueError(
                 f"metadata storage expected a database, got {self.metadata_storage}"
             )
+        from snapflow.core.metadata.writer import (
+            clear_metadata_writer,
+            flush_metadata_writer,
+        )
+        from snapflow.core.node import index_new_data_block_logs
+
         conn = self.metadata_storage.get_api().get_engine()
         BaseModel.metadata.create_all(conn)
+        if self.auto_upgrade_metadata:
+            self.upgrade_metadata(conn)
         self.Session = sessionmaker(bind=conn)
+        event.listen(self.Session, "after_flush", index_new_data_block_logs)
+        event.listen(self.Session, "before_commit", flush_metadata_writer)
+        event.listen(self.Session, "after_soft_rollback", clear_metadata_writer)
+        event.listen(self.Session, "after_commit", apply_pending_cache_puts)
+
+    def remove_dead_memory_blocks(self) -> int:
+        """
+        Removes metadata of stored copies in python storage that this process
+        does not hold (eg left by earlier processes), see
+        `remove_dead_python_blocks`. Only safe when no other process is
+        using this metadata, their in-memory outputs would be dropped too.
+        """
+        from snapflow.core.gc import remove_dead_python_blocks
+
+        with self.session_scope() as sess:
+            removed = remove_dead_python_blocks(sess)
+        if removed:
+            logger.debug(f"Removed {removed} dead memory blocks")
+        return removed
+
+    def upgrade_metadata(self, engine: Optional[Engine] = None) -> List[Migration]:
+        """
+        Upgrades the metadata database in place to the latest version, see
+        `snapflow.core.metadata.migrations`.
+        """
+        if engine is None:
+            engine = self.Session.kw["bind"]
+        with engine.connect() as conn:
+            applied = upgrade_metadata(conn)
+        for m in applied:
+            logger.info(f"Applied metadata migration {m.version}: {m.description}")
+        return applied
+
+    def supports_concurrent_metadata_sessions(self) -> bool:
+        # In-memory sqlite dbs are per-connection, so can't be shared by worker threads
+        url = self.metadata_storage.url
+        return not (
+            url.startswith("sqlite") and (url.endswith("://") or ":memory:" in url)
+        )
 
     def _get_new_metadata_session(self) -> Session:
         sess = self.Session()
@@ -115,16 +199,28 @@ class Environment:
     def get_schema(self, schema_like: SchemaLike, sess: Session) -> Schema:
         if isinstance(schema_like, Schema):
             return schema_like
+        schema = self.schema_cache.get(schema_like)
+        if schema is not None:
+            return schema
+        if sess is not None:
+            schema = get_pending_put(sess, self.schema_cache, schema_like)
+            if schema is not None:
+                # Stored by this session, but not committed yet (no query, that
+                # would autoflush whatever the session has pending)
+                return schema
         try:
-            return self.library.get_schema(schema_like)
+            schema = self.library.get_schema(schema_like)
         except KeyError:
             schema = self.get_generated_schema(schema_like, sess=sess)
             if schema is None:
                 raise KeyError(schema_like)
-            return schema
+        self.schema_cache.put(schema_like, schema)
+        return schema
 
     def add_schema(self, schema: Schema):
         self.library.add_schema(schema)
+        # May change what a (module-less) schema name resolves to
+        self.schema_cache.clear()
 
     def get_generated_schema(
         self, schema_like: SchemaLike, sess: Session
@@ -141,14 +237,33 @@ class Environment:
         return got.as_schema()
 
     def add_new_generated_schema(self, schema: Schema, sess: Session):
-        logger.debug(f"Adding new generated schema {schema}")
-        if schema.key in self.library.schemas:
+        """
+        Stores a generated schema, unless one with the same key is already
+        stored. Generated schemas are named by fingerprint (see
+        `generate_auto_schema`), so identical schemas are only stored once.
+        The schema is only cached once `sess` commits.
+        """
+        if schema.key in self.library.schemas or schema.key in self.schema_cache:
             # Already exists
             return
-        got = GeneratedSchema(key=schema.key, definition=asdict(schema))
-        sess.add(got)
-        sess.flush([got])
-        self.library.add_schema(schema)
+        if sess.query(GeneratedSchema).get(schema.key) is None:
+            logger.debug(f"Adding new generated schema {schema}")
+            got = GeneratedSchema(key=schema.key, definition=asdict(schema))
+            if self.supports_concurrent_metadata_sessions():
+                # Another worker may be storing the same schema. Everything else
+                # pending is flushed first, so the savepoint only covers the schema
+                sess.flush()
+                try:
+                    with sess.begin_nested():
+                        sess.add(got)
+                except IntegrityError:
+                    if sess.query(GeneratedSchema).get(schema.key) is None:
+                        raise
+                    logger.debug(f"Generated schema {schema.key} already stored")
+            else:
+                sess.add(got)
+                sess.flush([got])
+        put_after_commit(sess, self.schema_cache, schema.key, schema)
 
     def all_schemas(self) -> List[Schema]:
         return self.library.all_schemas()
@@ -165,6 +280,7 @@ class Environment:
     def add_module(self, *modules: SnapflowModule):
         for module in modules:
             self.library.add_module(module)
+        self.schema_cache.clear()
 
     @contextmanager
     def session_scope(self, **kwargs):
@@ -272,6 +388,9 @@ class Environment:
         node_like: Optional[NodeLike] = None,
         graph: Union[Graph, DeclaredGraph] = None,
         to_exhaustion: bool = True,
+        max_workers: int = 1,
+        executor: str = "thread",
+        pipelined: bool = False,
         **execution_kwargs: Any,
     ) -> Optional[DataBlock]:
         node, graph = self._get_graph_and_node(node_like, graph)
@@ -279,14 +398,19 @@ class Environment:
             dependencies = graph.get_all_upstream_dependencies_in_execution_order(node)
         else:
             dependencies = graph.get_all_nodes_in_execution_order()
-        output = None
+        if not dependencies:
+            return None
         sess = self._get_new_metadata_session()  # hanging session
         with self.run(graph, **execution_kwargs) as em:
-            for dep in dependencies:
-                output = em.execute(
-                    dep, to_exhaustion=to_exhaustion, output_session=sess
-                )
-        return output
+            outputs = em.execute_many(
+                dependencies,
+                to_exhaustion=to_exhaustion,
+                max_workers=max_workers,
+                executor=executor,
+                pipelined=pipelined,
+            )
+            last = dependencies[-1]
+            return em.get_managed_output(last, outputs.get(last.key), sess)
 
     def run_node(
         self,
@@ -307,6 +431,9 @@ class Environment:
         self,
         graph: Union[Graph, DeclaredGraph],
         to_exhaustion: bool = True,
+        max_workers: int = 1,
+        executor: str = "thread",
+        pipelined: bool = False,
         **execution_kwargs: Any,
     ):
         from snapflow.core.graph import DeclaredGraph
@@ -315,8 +442,13 @@ class Environment:
             graph = graph.instantiate(self)
         nodes = graph.get_all_nodes_in_execution_order()
         with self.run(graph, **execution_kwargs) as em:
-            for node in nodes:
-                em.execute(node, to_exhaustion=to_exhaustion)
+            em.execute_many(
+                nodes,
+                to_exhaustion=to_exhaustion,
+                max_workers=max_workers,
+                executor=executor,
+                pipelined=pipelined,
+            )
 
     def latest_output(self, node: NodeLike) -> Optional[DataBlock]:
         sess = self._get_new_metadata_session()  # hanging session
@@ -324,6 +456,57 @@ class Environment:
         ctx = self.get_run_context(g)
         return n.latest_output(ctx, sess)
 
+    def block_ancestors(
+        self, block: BlockLike, max_depth: Optional[int] = None
+    ) -> List[DataBlockMetadata]:
+        """
+        Blocks that `block` was derived from (via any number of pipe runs, up
+        to `max_depth`), nearest first.
+        """
+        from snapflow.core.lineage import query_block_ancestors
+
+        sess = self._get_new_metadata_session()  # hanging session
+        return query_block_ancestors(sess, block, max_depth).all()
+
+    def block_descendants(
+        self, block: BlockLike, max_depth: Optional[int] = None
+    ) -> List[DataBlockMetadata]:
+        """
+        Blocks derived from `block` (via any number of pipe runs, up to
+        `max_depth`), nearest first.
+        """
+        from snapflow.core.lineage import query_block_descendants
+
+        sess = self._get_new_metadata_session()  # hanging session
+        return query_block_descendants(sess, block, max_depth).all()
+
+    def collect_garbage(
+        self,
+        graph: Union[Graph, DeclaredGraph] = None,
+        node_policies: Optional[Dict[str, RetentionPolicy]] = None,
+        schema_policies: Optional[Dict[str, RetentionPolicy]] = None,
+        default_policy: Optional[RetentionPolicy] = None,
+        dry_run: bool = False,
+        compact_logs: bool = True,
+    ) -> GarbageCollectionResult:
+        """
+        Deletes blocks (and their stored copies) that are outside their node's
+        or schema's retention policy, see `GarbageCollector`. `graph` must hold
+        every node run against this metadata, so that blocks still waiting to
+        be processed downstream are kept.
+        """
+        from snapflow.core.gc import GarbageCollector
+
+        _, graph = self._get_graph_and_node(None, graph)
+        gc = GarbageCollector(
+            self,
+            graph,
+            node_policies=node_policies,
+            schema_policies=schema_policies,
+            default_policy=default_policy,
+        )
+        return gc.collect(dry_run=dry_run, compact_logs=compact_logs)
+
     def add_storage(
         self, storage_like: Union[Storage, str], add_runtime: bool = True
     ) -> Storage:
@@ -1,11 +1,23 @@
 from __future__ import annotations
 
+import multiprocessing
 from collections import abc
+from concurrent.futures import Future, ProcessPoolExecutor
 from contextlib import contextmanager
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from enum import Enum
 from io import IOBase
-from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
+from threading import Lock
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
 import sqlalchemy
 from loguru import logger
@@ -18,14 +30,28 @@ from snapflow.core.data_block import (
     create_data_block_from_records,
 )
 from snapflow.core.environment import Environment
+from snapflow.core.memoization import (
+    get_cached_output,
+    get_output_cache_key,
+    set_cached_output,
+)
 from snapflow.core.metadata.orm import BaseModel
-from snapflow.core.node import DataBlockLog, Direction, Node, PipeLog, get_state
+from snapflow.core.metadata.writer import get_metadata_writer
+from snapflow.core.node import (
+    MATERIALIZE_EAGER,
+    MATERIALIZE_LAZY,
+    Direction,
+    Node,
+    PipeLog,
+    get_state,
+)
 from snapflow.core.pipe import DataInterfaceType, InputExhaustedException, Pipe
 from snapflow.core.pipe_interface import (
     BoundInterface,
     NodeInterfaceManager,
     StreamInput,
 )
+from snapflow.core.profiling import collect_timings, timed
 from snapflow.core.runtime import Runtime, RuntimeClass, RuntimeEngine
 from snapflow.core.storage import copy_lowest_cost
 from snapflow.storage.data_formats import DataFrameIterator, RecordsIterator
@@ -35,7 +61,13 @@ from snapflow.storage.data_records import (
     records_object_is_definitely_empty,
     wrap_records_object,
 )
-from snapflow.storage.storage import LocalPythonStorageEngine, PythonStorageApi, Storage
+from snapflow.storage.db.sqlite import retry_on_busy
+from snapflow.storage.storage import (
+    LOCAL_PYTHON_STORAGE,
+    LocalPythonStorageEngine,
+    PythonStorageApi,
+    Storage,
+)
 from snapflow.utils.common import cf, error_symbol, success_symbol, utcnow
 from snapflow.utils.data import SampleableIO
 from sqlalchemy.engine import ResultProxy
@@ -44,6 +76,7 @@ from sqlalchemy.orm import Session
 
 if TYPE_CHECKING:
     from snapflow.core.graph import Graph, GraphMetadata
+    from snapflow.core.execution_spec import ExecutionSpec
 
 
 class Language(Enum):
@@ -113,13 +146,8 @@ class ExecutionSession:
     metadata_session: Session  # Make this a URL or other jsonable and then runtime can connect
 
     def log(self, block: DataBlockMetadata, direction: Direction):
-        drl = DataBlockLog(  # type: ignore
-            pipe_log=self.pipe_log,
-            data_block=block,
-            direction=direction,
-            processed_at=utcnow(),
-        )
-        self.metadata_session.add(drl)
+        # Buffered, bulk inserted on commit
+        get_metadata_writer(self.metadata_session).log(self.pipe_log, block, direction)
 
     def log_input(self, block: DataBlockMetadata):
         logger.debug(f"Input logged: {block}")
@@ -129,6 +157,11 @@ class ExecutionSession:
         logger.debug(f"Output logged: {block}")
         self.log(block, Direction.OUTPUT)
 
+    def log_lineage_input(self, block: DataBlockMetadata):
+        get_metadata_writer(self.metadata_session).log_lineage_input(
+            self.pipe_log, block
+        )
+
 
 @dataclass
 class ExecutionResult:
@@ -136,6 +169,7 @@ class ExecutionResult:
     input_blocks_processed: Dict[str, int]
     output_block: Optional[DataBlockMetadata] = None
     output_stored_block: Optional[StoredDataBlockMetadata] = None
+    output_handed_off: bool = False  # Already passed to the worker's `on_output`
 
 
 class ImproperlyStoredDataBlockException(Exception):
@@ -156,6 +190,55 @@ def validate_data_blocks(sess: Session):
                     )
 
 
+def copy_to_target_storage(
+    ctx: RunContext,
+    sess: Session,
+    sdb: StoredDataBlockMetadata,
+    target_storage: Storage,
+) -> StoredDataBlockMetadata:
+    # check if existing storage_format is compatible with target storage,
+    # and it's storable, then use instead of natural (no need to convert)
+    target_format = target_storage.storage_engine.get_natural_format()
+    if target_storage.storage_engine.is_supported_format(sdb.data_format):
+        if sdb.data_format.is_storable():
+            target_format = sdb.data_format
+
+    assert target_format.is_storable()
+
+    return copy_lowest_cost(
+        ctx.env,
+        sess,
+        sdb=sdb,
+        target_storage=target_storage,
+        target_format=target_format,
+        eligible_storages=ctx.storages,
+    )
+
+
+class PendingMaterializations:
+    """
+    Stored (in memory) outputs of lazily materialized nodes still waiting to
+    be copied to their target storage. Shared by all clones of a RunContext.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._pending: Dict[str, Storage] = {}
+
+    def add(self, stored_data_block_id: str, target_storage: Storage):
+        with self._lock:
+            self._pending[stored_data_block_id] = target_storage
+
+    def pop_all(self) -> List[Tuple[str, Storage]]:
+        with self._lock:
+            pending = list(self._pending.items())
+            self._pending = {}
+        return pending
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
 @dataclass  # (frozen=True)
 class RunContext:
     env: Environment
@@ -171,6 +254,14 @@ class RunContext:
     ] = None  # TODO: this is a "soft" limit, could imagine a "hard" one too
     execution_timelimit_seconds: Optional[int] = None
     logger: Callable[[str], None] = lambda s: print(s, end="")
+    memoize_outputs: bool = False  # Reuse outputs of identical pure pipe runs
+    fuse_python_chains: bool = False  # Run linear chains of python pipes in one worker
+    fused_python_in_memory: bool = False  # Don't persist fused python intermediates
+    fuse_sql_chains: bool = False  # Compile chains of sql pipes into one statement
+    fused_sql_views: bool = False  # Expose intermediates of fused sql chains as views
+    pending_materializations: PendingMaterializations = field(
+        default_factory=PendingMaterializations
+    )
 
     def clone(self, **kwargs):
         args = dict(
@@ -185,39 +276,65 @@ class RunContext:
             node_timelimit_seconds=self.node_timelimit_seconds,
             execution_timelimit_seconds=self.execution_timelimit_seconds,
             logger=self.logger,
+            memoize_outputs=self.memoize_outputs,
+            fuse_python_chains=self.fuse_python_chains,
+            fused_python_in_memory=self.fused_python_in_memory,
+            fuse_sql_chains=self.fuse_sql_chains,
+            fused_sql_views=self.fused_sql_views,
+            pending_materializations=self.pending_materializations,
         )
         args.update(**kwargs)
         return RunContext(**args)  # type: ignore
 
-    @contextmanager
-    def start_pipe_run(self, node: Node) -> Iterator[ExecutionSession]:
+    def ensure_graph_metadata(self, sess: Optional[Session] = None) -> GraphMetadata:
         from snapflow.core.graph import GraphMetadata
 
+        if sess is None:
+            with self.env.session_scope() as sess:
+                return self.ensure_graph_metadata(sess)
+        new_graph_meta = self.graph.get_metadata_obj()
+        graph_meta = sess.query(GraphMetadata).get(new_graph_meta.hash)
+        if graph_meta is None:
+            sess.add(new_graph_meta)
+            sess.flush([new_graph_meta])
+            graph_meta = new_graph_meta
+        return graph_meta
+
+    @contextmanager
+    def start_pipe_run(self, node: Node) -> Iterator[ExecutionSession]:
         assert self.current_runtime is not None, "Runtime not set"
         with self.env.session_scope() as sess:
-            node_state = node.get_state(sess) or {}
-            new_graph_meta = node.graph.get_metadata_obj()
-            graph_meta = sess.query(GraphMetadata).get(new_graph_meta.hash)
-            if graph_meta is None:
-                sess.add(new_graph_meta)
-                sess.flush([new_graph_meta])
-                graph_meta = new_graph_meta
-
-            pl = PipeLog(  # type: ignore
-                graph_id=graph_meta.hash,
-                node_key=node.key,
-                node_start_state=node_state,
-                node_end_state=node_state,
-                pipe_key=node.pipe.key,
-                pipe_config=node.config,
-                runtime_url=self.current_runtime.url,
-                started_at=utcnow(),
-            )
+            with self.start_pipe_log(node, sess) as execution_session:
+                yield execution_session
 
+    @contextmanager
+    def start_pipe_log(self, node: Node, sess: Session) -> Iterator[ExecutionSession]:
+        """
+        Starts a single pipe run within an existing metadata session (so several
+        runs can share one transaction, see `Worker.execute_batch`).
+        """
+        assert self.current_runtime is not None, "Runtime not set"
+        node_state = node.get_state(sess) or {}
+        graph_meta = self.ensure_graph_metadata(sess)
+
+        pl = PipeLog(  # type: ignore
+            graph_id=graph_meta.hash,
+            node_key=node.key,
+            node_start_state=node_state,
+            node_end_state=node_state,
+            pipe_key=node.pipe.key,
+            pipe_config=node.config,
+            runtime_url=self.current_runtime.url,
+            started_at=utcnow(),
+        )
+
+        # Pin the run's inputs and outputs in memory storage until it is done
+        with collect_timings() as timings, LOCAL_PYTHON_STORAGE.run_scope():
             try:
                 yield ExecutionSession(pl, sess)
                 # Validate local memory objects: Did we leave any non-storeables hanging?
-                validate_data_blocks(sess)
+                with timed("validate"):
+                    validate_data_blocks(sess)
                 # Only persist state on successful run
                 pl.persist_state(sess)
 
@@ -226,32 +343,40 @@ class RunContext:
                 raise e
             finally:
                 pl.completed_at = utcnow()
+                pl.timings = timings.as_dict()
                 sess.add(pl)
 
+    def materialize_pending(self):
+        """
+        Copies the outputs of lazily materialized nodes to their target storage
+        (a no-op for any already copied there when a consumer needed them).
+        """
+        pending = self.pending_materializations.pop_all()
+        if not pending:
+            return
+        with self.env.session_scope() as sess:
+            for sdb_id, target_storage in pending:
+                sdb = sess.query(StoredDataBlockMetadata).get(sdb_id)
+                if sdb is None or sdb.data_block.deleted:
+                    continue
+                if any(
+                    s.storage_url == target_storage.url
+                    for s in sdb.data_block.stored_data_blocks
+                ):
+                    # Already copied for a consumer
+                    continue
+                logger.debug(f"Materializing {sdb} on {target_storage}")
+                copy_to_target_storage(self, sess, sdb, target_storage)
+
     @property
     def all_storages(self) -> List[Storage]:
         # TODO: should it be in the list of storages already?
         return [self.local_python_storage] + self.storages
 
-    # def to_json(self) -> str:
-    #     return json.dumps(
-    #         dict(
-    #             env=self.env,
-    #             storages=self.storages,
-    #             runtimes=self.runtimes,
-    #             target_storage=self.target_storage,
-    #         ),
-    #         cls=SnapflowJSONEncoder,
-    #     )
-    #
-    # @classmethod
-    # def from_json(cls, dct: Dict) -> ExecutionContext:
-    #     return ExecutionContext(
-    #         env=Environment.from_json(dct["env"]),
-    #         storages=dct["storages"],
-    #         runtimes=dct["runtimes"],
-    #         target_storage=dct["target_storage"],
-    #     )
+    def to_spec(self, node: Node, to_exhaustion: bool = False) -> ExecutionSpec:
+        from snapflow.core.execution_spec import ExecutionSpec
+
+        return ExecutionSpec.from_run_context(self, node, to_exhaustion=to_exhaustion)
 
 
 @dataclass(frozen=True)
@@ -337,9 +462,126 @@ class ExecutionManager:
         to_exhaustion: bool = False,
         output_session: Optional[Session] = None,
     ) -> Optional[DataBlock]:
+        try:
+            output = self.execute_to_output(node, to_exhaustion=to_exhaustion)
+        finally:
+            self.ctx.materialize_pending()
+        return self.get_managed_output(node, output, output_session)
+
+    def execute_many(
+        self,
+        nodes: List[Node],
+        to_exhaustion: bool = False,
+        max_workers: int = 1,
+        executor: str = "thread",
+        pipelined: bool = False,
+    ) -> Dict[str, Optional[DataBlockMetadata]]:
+        from snapflow.core.scheduler import GraphScheduler
+
+        try:
+            return GraphScheduler(
+                self, max_workers=max_workers, executor=executor, pipelined=pipelined
+            ).run(nodes, to_exhaustion=to_exhaustion)
+        finally:
+            # End of the run
+            self.ctx.materialize_pending()
+
+    def execute_chain(
+        self, nodes: List[Node], to_exhaustion: bool = False
+    ) -> Dict[str, Optional[DataBlockMetadata]]:
+        """
+        Executes a linear chain of nodes in order, in this worker. Each output
+        is persisted to the target storage as usual, but its local python copy
+        is still there for the next step, so each step is handed its input in
+        memory. With `RunContext.fused_python_in_memory`, outputs of all but
+        the last node are only kept in local python storage (still logged as
+        blocks, but lost when the process exits). Chains of sql nodes are
+        instead compiled into one statement, see `execute_sql_chain`.
+        """
+        from snapflow.core.sql.fusion import is_sql_pipe
+
+        if len(nodes) > 1 and is_sql_pipe(nodes[0].pipe):
+            return self.execute_sql_chain(nodes, to_exhaustion=to_exhaustion)
+        outputs: Dict[str, Optional[DataBlockMetadata]] = {}
+        intermediates = self
+        if self.ctx.fused_python_in_memory:
+            intermediates = ExecutionManager(
+                self.ctx.clone(target_storage=self.ctx.local_python_storage)
+            )
+        for node in nodes[:-1]:
+            outputs[node.key] = intermediates.execute_to_output(
+                node, to_exhaustion=to_exhaustion
+            )
+        last = nodes[-1]
+        outputs[last.key] = self.execute_to_output(last, to_exhaustion=to_exhaustion)
+        return outputs
+
+    def execute_sql_chain(
+        self, nodes: List[Node], to_exhaustion: bool = False
+    ) -> Dict[str, Optional[DataBlockMetadata]]:
+        """
+        Executes a linear chain of sql nodes as a single fused statement, only
+        materializing the tail's output (see `snapflow.core.sql.fusion`).
+        """
+        from snapflow.core.sql.fusion import run_fused_sql_chain
+
+        worker = Worker(self.ctx.clone(current_runtime=self.select_runtime(nodes[0])))
+        keys = " -> ".join(n.key for n in nodes)
+        self.ctx.logger(f"Running fused sql nodes {cf.bold(keys)}\n")
+        outputs: Dict[str, Optional[DataBlockMetadata]] = {n.key: None for n in nodes}
+        n_runs = 0
+        try:
+            while True:
+                results = run_fused_sql_chain(
+                    worker, nodes, expose_views=self.ctx.fused_sql_views
+                )
+                n_runs += 1
+                for key, result in results.items():
+                    if result.output_block is not None:
+                        outputs[key] = result.output_block
+                if not to_exhaustion or not results[nodes[0].key].inputs_bound:
+                    break
+            self.ctx.logger(INDENT + cf.success("Ok " + success_symbol + "\n"))  # type: ignore
+        except InputExhaustedException as e:
+            logger.debug(INDENT + cf.warning("Input Exhausted"))
+            if n_runs == 0:
+                self.ctx.logger(INDENT + "Inputs: No unprocessed upstream\n")
+            self.ctx.logger(INDENT + cf.success("Ok " + success_symbol + "\n"))  # type: ignore
+        except Exception as e:
+            self.ctx.logger(INDENT + cf.error("Error " + error_symbol) + str(e) + "\n")  # type: ignore
+            raise e
+        return outputs
+
+    def get_managed_output(
+        self,
+        node: Node,
+        output: Optional[DataBlockMetadata],
+        output_session: Optional[Session] = None,
+    ) -> Optional[DataBlock]:
+        # TODO: how to pass back with session?
+        #   maybe with env.produce() as output:
+        # Or just merge in new session in env.produce
+        if output is None or output_session is None:
+            return None
+        run_ctx = self.ctx.clone(current_runtime=self.select_runtime(node))
+        output = output_session.merge(output)
+        return output.as_managed_data_block(run_ctx, output_session)
+
+    def execute_to_output(
+        self,
+        node: Node,
+        to_exhaustion: bool = False,
+        on_output: Optional[Callable[[DataBlockMetadata], None]] = None,
+    ) -> Optional[DataBlockMetadata]:
+        """
+        Runs the node (to exhaustion, optionally) and returns its last output
+        block. `on_output` is called with each output block as soon as the run
+        that produced it has been committed (or, for generator pipes, as soon
+        as each yielded block is, see `Worker.process_output_stream`).
+        """
         runtime = self.select_runtime(node)
         run_ctx = self.ctx.clone(current_runtime=runtime)
-        worker = Worker(run_ctx)
+        worker = Worker(run_ctx, on_output=on_output)
 
         # Setup for run
         base_msg = f"Running node {cf.bold(node.key)} {cf.dimmed(node.pipe.key)}\n"
@@ -354,10 +596,16 @@ class ExecutionManager:
         last_non_none_output: Optional[DataBlockMetadata] = None
         try:
             while True:
-                last_execution_result = self._execute(node, worker)
-                if last_execution_result.output_block is not None:
-                    last_non_none_output = last_execution_result.output_block
-                n_runs += 1
+                for last_execution_result in self._execute(node, worker):
+                    if last_execution_result.output_block is not None:
+                        last_non_none_output = last_execution_result.output_block
+                        if (
+                            on_output is not None
+                            and not last_execution_result.output_handed_off
+                        ):
+                            on_output(last_non_none_output)
+                    n_runs += 1
+                assert last_execution_result is not None
                 if (
                     not to_exhaustion or not last_execution_result.inputs_bound
                 ):  # TODO: We just run no-input DFs (source extractors) once no matter what
@@ -375,18 +623,11 @@ class ExecutionManager:
             self.ctx.logger(INDENT + cf.error("Error " + error_symbol) + str(e) + "\n")  # type: ignore
             raise e
 
-        # TODO: how to pass back with session?
-        #   maybe with env.produce() as output:
-        # Or just merge in new session in env.produce
-        if last_non_none_output is None:
-            return None
-        logger.debug(f"*DONE* RUNNING NODE {node.key} {node.pipe.key}")
-        if output_session is not None:
-            last_non_none_output = output_session.merge(last_non_none_output)
-            return last_non_none_output.as_managed_data_block(run_ctx, output_session)
-        return None
+        if last_non_none_output is not None:
+            logger.debug(f"*DONE* RUNNING NODE {node.key} {node.pipe.key}")
+        return last_non_none_output
 
-    def _execute(self, node: Node, worker: Worker) -> ExecutionResult:
+    def _execute(self, node: Node, worker: Worker) -> List[ExecutionResult]:
         pipe = node.pipe
         executable = Executable(
             node_key=node.key,
@@ -397,7 +638,19 @@ class ExecutionManager:
             # bound_interface=interface_mgr.get_bound_interface(),
             configuration=node.config or {},
         )
-        return worker.execute(executable)
+        batch_size = node.get_batch_size()
+
+        def run() -> List[ExecutionResult]:
+            if batch_size > 1:
+                return worker.execute_batch(executable, batch_size)
+            return [worker.execute(executable)]
+
+        if pipe.idempotent:
+            # Each is a single metadata transaction, so an idempotent pipe can be
+            # re-run if it loses a write lock race on sqlite metadata (no-op on
+            # other databases). Others would repeat their side effects.
+            return retry_on_busy(run)
+        return run()
 
 
 def ensure_alias(sess: Session, node: Node, sdb: StoredDataBlockMetadata) -> Alias:
@@ -408,9 +661,14 @@ def ensure_alias(sess: Session, node: Node, sdb: StoredDataBlockMetadata) -> Ali
 
 
 class Worker:
-    def __init__(self, ctx: RunContext):
+    def __init__(
+        self,
+        ctx: RunContext,
+        on_output: Optional[Callable[[DataBlockMetadata], None]] = None,
+    ):
         self.env = ctx.env
         self.ctx = ctx
+        self.on_output = on_output
 
     def execute(self, executable: Executable) -> ExecutionResult:
         node = self.ctx.graph.get_node(executable.node_key)
@@ -418,26 +676,93 @@ class Worker:
             interface_mgr = NodeInterfaceManager(
                 self.ctx, execution_session.metadata_session, node
             )
-            executable.bound_interface = interface_mgr.get_bound_interface()
-            pipe_ctx = PipeContext(
-                self.ctx,
-                worker=self,
-                execution_session=execution_session,
-                executable=executable,
-                inputs=executable.bound_interface.inputs,
-                pipe_log=execution_session.pipe_log,
+            with timed("bind_inputs"):
+                executable.bound_interface = interface_mgr.get_bound_interface()
+            result = self.run_pipe(executable, execution_session)
+        return result
+
+    def execute_batch(
+        self, executable: Executable, batch_size: int
+    ) -> List[ExecutionResult]:
+        """
+        Binds the node's input streams once and calls the pipe on up to
+        `batch_size` unprocessed input blocks, one PipeLog per call, all in a
+        single metadata transaction (so all are committed, or none are).
+        Only pipes whose inputs are all single DataBlocks can be batched,
+        other pipes are executed once, as with `execute`.
+        """
+        node = self.ctx.graph.get_node(executable.node_key)
+        with self.env.session_scope() as sess:
+            interface_mgr = NodeInterfaceManager(self.ctx, sess, node)
+            connected_interface = interface_mgr.get_connected_interface()
+            if any(
+                i.annotation.is_stream or i.annotation.is_self_ref
+                for i in connected_interface.inputs
+            ):
+                return [self.execute(executable)]
+            input_streams = interface_mgr.get_input_data_block_streams()
+            results: List[ExecutionResult] = []
+            for _ in range(batch_size):
+                try:
+                    bound_interface = connected_interface.bind(input_streams)
+                except StopIteration:
+                    # An input stream ran out of blocks
+                    break
+                batch_executable = replace(executable, bound_interface=bound_interface)
+                with self.ctx.start_pipe_log(node, sess) as execution_session:
+                    results.append(self.run_pipe(batch_executable, execution_session))
+                if not input_streams:
+                    # No inputs bound, so nothing to batch
+                    break
+        return results
+
+    def run_pipe(
+        self, executable: Executable, execution_session: ExecutionSession
+    ) -> ExecutionResult:
+        assert executable.bound_interface is not None
+        pipe_ctx = PipeContext(
+            self.ctx,
+            worker=self,
+            execution_session=execution_session,
+            executable=executable,
+            inputs=executable.bound_interface.inputs,
+            pipe_log=execution_session.pipe_log,
+        )
+        pipe_args = []
+        if executable.bound_interface.requires_pipe_context:
+            pipe_args.append(pipe_ctx)
+        pipe_inputs = executable.bound_interface.inputs_as_kwargs()
+        pipe_kwargs = pipe_inputs
+        pipe = executable.compiled_pipe.pipe
+        cache_key = None
+        if self.ctx.memoize_outputs:
+            cache_key = get_output_cache_key(
+                pipe, executable.configuration, executable.bound_interface
             )
-            pipe_args = []
-            if executable.bound_interface.requires_pipe_context:
-                pipe_args.append(pipe_ctx)
-            pipe_inputs = executable.bound_interface.inputs_as_kwargs()
-            pipe_kwargs = pipe_inputs
-            # Actually run the pipe
-            output_obj = executable.compiled_pipe.pipe.pipe_callable(
-                *pipe_args, **pipe_kwargs
+        if cache_key is not None:
+            output_obj = get_cached_output(
+                self.ctx, execution_session.metadata_session, cache_key
             )
-            result = self.process_execution_result(
-                executable, execution_session, output_obj
+            if output_obj is not None:
+                logger.debug(f"Memoized output found for {executable.node_key}")
+                return self.process_execution_result(
+                    executable, execution_session, output_obj
+                )
+        # Actually run the pipe
+        # (Generator outputs are mostly consumed later, in `handle_output`)
+        with timed("pipe_call"):
+            output_obj = pipe.pipe_callable(*pipe_args, **pipe_kwargs)
+        if self.on_output is not None and isinstance(output_obj, abc.Generator):
+            return self.process_output_stream(executable, execution_session, output_obj)
+        result = self.process_execution_result(
+            executable, execution_session, output_obj
+        )
+        if cache_key is not None and result.output_block is not None:
+            set_cached_output(
+                execution_session.metadata_session,
+                cache_key,
+                pipe,
+                result.output_block,
             )
         return result
 
@@ -447,59 +772,128 @@ class Worker:
         execution_session: ExecutionSession,
         output_obj: DataInterfaceType,
     ) -> ExecutionResult:
-        node = self.ctx.graph.get_node(executable.node_key)
+        output_block, output_sdb = self.store_output(
+            executable, execution_session, output_obj
+        )
+        input_block_counts = self.log_inputs(executable, execution_session)
+        if output_block is not None:
+            self.log_output_message(executable, output_block)
+        return ExecutionResult(
+            inputs_bound=list(executable.bound_interface.inputs_as_kwargs().keys()),
+            input_blocks_processed=input_block_counts,
+            output_block=output_block,
+            output_stored_block=output_sdb,
+        )
+
+    def process_output_stream(
+        self,
+        executable: Executable,
+        execution_session: ExecutionSession,
+        output_gen: abc.Generator,
+    ) -> ExecutionResult:
+        """
+        Stores each object yielded by a generator pipe as its own output block,
+        committing it (with its lineage and the run's state so far) and passing
+        it to `on_output` before pulling the next one. Pipelined downstream
+        nodes can then start on it while the pipe is still producing, and a
+        full downstream channel pauses the generator. Blocks already committed
+        are kept if the pipe fails part way, but its inputs are only logged as
+        processed once it is done, so the run is retried.
+        """
+        assert self.on_output is not None
+        sess = execution_session.metadata_session
+        pipe_log = execution_session.pipe_log
         output_block: Optional[DataBlockMetadata] = None
         output_sdb: Optional[StoredDataBlockMetadata] = None
-        if output_obj is not None:
+        for output_obj in output_gen:
+            block, sdb = self.store_output(executable, execution_session, output_obj)
+            if block is None:
+                continue
+            output_block, output_sdb = block, sdb
+            # Streamed inputs emitted so far
+            for input_blocks in self.get_input_blocks(executable).values():
+                for input_block in input_blocks:
+                    execution_session.log_lineage_input(input_block)
+            self.log_output_message(executable, block)
+            pipe_log.persist_state(sess)
+            sess.add(pipe_log)
+            with timed("metadata_flush"):
+                sess.commit()
+            self.on_output(block)
+        input_block_counts = self.log_inputs(executable, execution_session)
+        return ExecutionResult(
+            inputs_bound=list(executable.bound_interface.inputs_as_kwargs().keys()),
+            input_blocks_processed=input_block_counts,
+            output_block=output_block,
+            output_stored_block=output_sdb,
+            output_handed_off=True,
+        )
+
+    def store_output(
+        self,
+        executable: Executable,
+        execution_session: ExecutionSession,
+        output_obj: DataInterfaceType,
+    ) -> Tuple[Optional[DataBlockMetadata], Optional[StoredDataBlockMetadata]]:
+        if output_obj is None:
+            return None, None
+        node = self.ctx.graph.get_node(executable.node_key)
+        with timed("handle_output") as span:
             output_sdb = self.handle_raw_output_object(
                 execution_session, output_obj, executable
             )
-            alias = None
-            # Output block may be none still if `output` was an empty generator
             if output_sdb is not None:
-                execution_session.metadata_session.flush(
-                    [output_sdb.data_block, output_sdb]
-                )
-                output_block = output_sdb.data_block
-                execution_session.log_output(output_block)
-                alias = ensure_alias(
-                    execution_session.metadata_session, node, output_sdb
-                )
-                execution_session.metadata_session.flush([alias])
+                span.records = output_sdb.data_block.record_count
+        # Output block may be none still if `output` was an empty generator
+        if output_sdb is None:
+            return None, None
+        with timed("metadata_flush"):
+            execution_session.metadata_session.flush(
+                [output_sdb.data_block, output_sdb]
+            )
+        output_block = output_sdb.data_block
+        execution_session.log_output(output_block)
+        ensure_alias(execution_session.metadata_session, node, output_sdb)
+        return output_block, output_sdb
 
-        # Flush
-        execution_session.metadata_session.flush()
+    def log_output_message(self, executable: Executable, block: DataBlockMetadata):
+        node = self.ctx.graph.get_node(executable.node_key)
+        self.ctx.logger(
+            INDENT
+            + f"Output: {node.get_alias()} "
+            + cf.dimmed(f"({block.id}) {block.record_count} records")  # type: ignore
+            + "\n"
+        )
 
+    def log_inputs(
+        self, executable: Executable, execution_session: ExecutionSession
+    ) -> Dict[str, int]:
         input_block_counts = {}
         total_input_count = 0
-        for input in executable.bound_interface.inputs:
-            if input.bound_stream is not None:
-                input_block_counts[input.name] = 0
-                for db in input.bound_stream.get_emitted_blocks():
-                    input_block_counts[input.name] += 1
-                    total_input_count += 1
-                    execution_session.log_input(db)
-        # Log
+        for name, input_blocks in self.get_input_blocks(executable).items():
+            input_block_counts[name] = len(input_blocks)
+            for db in input_blocks:
+                total_input_count += 1
+                execution_session.log_input(db)
         if executable.bound_interface.inputs:
             self.ctx.logger(
                 INDENT + f"Inputs: {total_input_count} block(s) processed\n"
             )
-        if output_block is not None:
-            self.ctx.logger(
-                INDENT
-                + f"Output: {alias.alias} "
-                + cf.dimmed(
-                    f"({output_block.id}) {output_block.record_count} records"
-                )  # type: ignore
-                + "\n"
-            )
+        return input_block_counts
 
-        return ExecutionResult(
-            inputs_bound=list(executable.bound_interface.inputs_as_kwargs().keys()),
-            input_blocks_processed=input_block_counts,
-            output_block=output_block,
-            output_stored_block=output_sdb,
-        )
+    def get_input_blocks(
+        self, executable: Executable
+    ) -> Dict[str, List[DataBlockMetadata]]:
+        input_blocks = {}
+        for input in executable.bound_interface.inputs:
+            if input.bound_stream is None:
+                continue
+            if input.is_stream:
+                input_blocks[input.name] = input.bound_stream.get_emitted_blocks()
+            else:
+                # Stream may be shared by several runs (when batched), so just log the bound block
+                input_blocks[input.name] = [input.bound_block.data_block_metadata]
+        return input_blocks
 
     def handle_raw_output_object(
         self,
@@ -542,6 +936,17 @@ class Worker:
                 dro,
                 created_by_node_key=executable.node_key,
             )
+            node = self.ctx.graph.get_node(executable.node_key)
+            if node.materialize != MATERIALIZE_EAGER and sdb.data_format.is_storable():
+                # Keep the output in local memory, consumers copy it if they need to
+                if (
+                    node.materialize == MATERIALIZE_LAZY
+                    and self.ctx.target_storage is not None
+                ):
+                    self.ctx.pending_materializations.add(
+                        sdb.id, self.ctx.target_storage
+                    )
+                return sdb
 
         # TODO: need target_format option too
         if self.ctx.target_storage is None or self.ctx.target_storage == sdb.storage:
@@ -550,23 +955,9 @@ class Worker:
                 # And its storable
                 return sdb
 
-        # check if existing storage_format is compatible with target storage,
-        # and it's storable, then use instead of natural (no need to convert)
-        target_format = self.ctx.target_storage.storage_engine.get_natural_format()
-        if self.ctx.target_storage.storage_engine.is_supported_format(sdb.data_format):
-            if sdb.data_format.is_storable():
-                target_format = sdb.data_format
-
-        assert target_format.is_storable()
-
         # Place output in target storage
-        return copy_lowest_cost(
-            self.ctx.env,
-            execution_session.metadata_session,
-            sdb=sdb,
-            target_storage=self.ctx.target_storage,
-            target_format=target_format,
-            eligible_storages=self.ctx.storages,
+        return copy_to_target_storage(
+            self.ctx, execution_session.metadata_session, sdb, self.ctx.target_storage
         )
 
     # TODO: where does this sql stuff really belong?
@@ -575,9 +966,54 @@ class Worker:
             raise Exception("Current runtime not set")
         if self.ctx.current_runtime.runtime_class != RuntimeClass.DATABASE:
             raise Exception(f"Runtime not supported {self.ctx.current_runtime}")
-        return sqlalchemy.create_engine(self.ctx.current_runtime.url)
+        # Shared, pooled engine for the url (see `DatabaseApi.get_engine`)
+        return self.ctx.current_runtime.as_storage().get_api().get_engine()
 
     def execute_sql(self, sql: str) -> ResultProxy:
         logger.debug("Executing SQL:")
         logger.debug(sql)
         return self.get_connection().execute(sql)
+
+
+class ProcessPoolWorker:
+    """
+    Executes nodes in separate worker processes. Each node run is shipped as a
+    serialized `ExecutionSpec`; the child rebuilds the environment and graph
+    (once per process) and runs the node there, so CPU-bound python pipes
+    are not serialized on the GIL. Requires metadata and target storages that
+    are reachable from other processes.
+    """
+
+    def __init__(self, ctx: RunContext, max_workers: Optional[int] = None):
+        self.ctx = ctx
+        self.env = ctx.env
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> ProcessPoolWorker:
+        # Spawn (rather than fork) so children don't inherit open db connections
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        return self
+
+    def __exit__(self, *args):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def submit(self, node: Node, to_exhaustion: bool = False) -> Future:
+        from snapflow.core.execution_spec import run_execution_spec
+
+        assert (
+            self._pool is not None
+        ), "ProcessPoolWorker must be used as a context manager"
+        spec = self.ctx.to_spec(node, to_exhaustion=to_exhaustion)
+        return self._pool.submit(run_execution_spec, spec.to_json())
+
+    def get_output(self, data_block_id: Optional[str]) -> Optional[DataBlockMetadata]:
+        if data_block_id is None:
+            return None
+        with self.env.session_scope(expire_on_commit=False) as sess:
+            return sess.query(DataBlockMetadata).get(data_block_id)
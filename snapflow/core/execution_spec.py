@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass, field
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+from snapflow.core.node import MATERIALIZE_EAGER, MATERIALIZE_LAZY, MATERIALIZE_NEVER
+from snapflow.core.pipe import Pipe, pipe_factory
+from snapflow.core.pipe_interface import SELF_REF_PARAM_NAME
+from snapflow.core.runtime import DatabaseRuntimeClass
+from snapflow.schema.base import Schema
+from snapflow.storage.storage import PythonStorageClass
+from snapflow.utils.common import SnapflowJSONEncoder, md5_hash
+from sqlalchemy import inspect
+
+if TYPE_CHECKING:
+    from snapflow.core.environment import Environment
+    from snapflow.core.execution import RunContext
+    from snapflow.core.graph import Graph
+    from snapflow.core.node import Node
+
+
+class SpecSerializationError(ValueError):
+    pass
+
+
+def callable_to_import_path(obj: Any) -> str:
+    module = getattr(obj, "__module__", None)
+    qualname = getattr(obj, "__qualname__", None)
+    if not module or not qualname or "<locals>" in qualname or module == "__main__":
+        raise SpecSerializationError(
+            f"{obj} is not importable, define it at module level to run it in a separate process"
+        )
+    return f"{module}:{qualname}"
+
+
+def import_from_path(path: str) -> Any:
+    module_name, qualname = path.split(":")
+    obj: Any = import_module(module_name)
+    for attr in qualname.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+@dataclass(frozen=True)
+class PipeSpec:
+    name: str
+    module_name: str
+    compatible_runtimes: str
+    callable_path: Optional[str] = None
+    sql: Optional[str] = None
+    config_class_path: Optional[str] = None
+    state_class_path: Optional[str] = None
+    declared_inputs: Optional[Dict[str, str]] = None
+    declared_output: Optional[str] = None
+    batch_size: Optional[int] = None
+    idempotent: bool = False
+
+    @classmethod
+    def from_pipe(cls, pipe: Pipe) -> PipeSpec:
+        from snapflow.core.sql.pipe import SqlPipeWrapper
+
+        callable_path = None
+        sql = None
+        if isinstance(pipe.pipe_callable, SqlPipeWrapper):
+            sql = pipe.pipe_callable.sql
+        else:
+            callable_path = callable_to_import_path(pipe.pipe_callable)
+        return PipeSpec(
+            name=pipe.name,
+            module_name=pipe.module_name,
+            compatible_runtimes=(
+                "database"
+                if DatabaseRuntimeClass in pipe.compatible_runtime_classes
+                else "python"
+            ),
+            callable_path=callable_path,
+            sql=sql,
+            config_class_path=(
+                callable_to_import_path(pipe.config_class)
+                if pipe.config_class
+                else None
+            ),
+            state_class_path=(
+                callable_to_import_path(pipe.state_class) if pipe.state_class else None
+            ),
+            declared_inputs=pipe.declared_inputs,
+            declared_output=pipe.declared_output,
+            batch_size=pipe.batch_size,
+            idempotent=pipe.idempotent,
+        )
+
+    def as_pipe(self) -> Pipe:
+        from snapflow.core.sql.pipe import SqlPipeWrapper
+
+        if self.sql is not None:
+            pipe_callable = SqlPipeWrapper(self.sql)
+        else:
+            assert self.callable_path is not None
+            pipe_callable = import_from_path(self.callable_path)
+            if isinstance(pipe_callable, Pipe):
+                # Imported the decorated object
+                pipe_callable = pipe_callable.pipe_callable
+        return pipe_factory(
+            pipe_callable,
+            name=self.name,
+            module=self.module_name,
+            compatible_runtimes=self.compatible_runtimes,
+            inputs=self.declared_inputs,
+            output=self.declared_output,
+            batch_size=self.batch_size,
+            idempotent=self.idempotent,
+            config_class=(
+                import_from_path(self.config_class_path)
+                if self.config_class_path
+                else None
+            ),
+            state_class=(
+                import_from_path(self.state_class_path)
+                if self.state_class_path
+                else None
+            ),
+        )
+
+
+@dataclass(frozen=True)
+class NodeSpec:
+    key: str
+    pipe: PipeSpec
+    config: Dict[str, Any] = field(default_factory=dict)
+    upstream: Dict[str, List[str]] = field(default_factory=dict)
+    upstream_schemas: Dict[str, List[str]] = field(default_factory=dict)
+    output_alias: Optional[str] = None
+    schema_translation: Optional[Dict[str, Dict[str, str]]] = None
+    batch_size: Optional[int] = None
+    materialize: str = MATERIALIZE_EAGER
+
+    @classmethod
+    def from_node(cls, node: Node) -> NodeSpec:
+        upstream = {}
+        upstream_schemas = {}
+        for name, declared_input in node.declared_inputs.items():
+            if name == SELF_REF_PARAM_NAME:
+                # Re-added by the interface manager at run time
+                continue
+            stream = declared_input.stream
+            if (
+                stream.operators
+                or stream.storages
+                or stream.data_block is not None
+                or stream.unprocessed_by is not None
+            ):
+                raise SpecSerializationError(
+                    f"Input `{name}` of node {node.key} is not serializable (only upstream node keys and schemas are supported)"
+                )
+            upstream[name] = stream.source_node_keys()
+            if stream.schemas:
+                upstream_schemas[name] = [
+                    s if isinstance(s, str) else s.key for s in stream.schemas
+                ]
+        return NodeSpec(
+            key=node.key,
+            pipe=PipeSpec.from_pipe(node.pipe),
+            config=node.config or {},
+            upstream=upstream,
+            upstream_schemas=upstream_schemas,
+            output_alias=node.output_alias,
+            schema_translation=node.declared_schema_translation,
+            batch_size=node.batch_size,
+            materialize=node.materialize,
+        )
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> NodeSpec:
+        d = dict(d)
+        d["pipe"] = PipeSpec(**d["pipe"])
+        return NodeSpec(**d)
+
+
+@dataclass(frozen=True)
+class ExecutionSpec:
+    """
+    JSON-serializable description of a node run: everything a separate worker
+    process needs to rebuild the environment and graph and execute the node.
+    """
+
+    node_key: str
+    metadata_storage_url: str
+    storage_urls: List[str]
+    target_storage_url: str
+    nodes: List[NodeSpec]
+    schemas: List[Dict] = field(default_factory=list)
+    module_lookup_names: List[str] = field(default_factory=list)
+    to_exhaustion: bool = False
+    node_timelimit_seconds: Optional[int] = None
+    execution_timelimit_seconds: Optional[int] = None
+    memoize_outputs: bool = False
+
+    @classmethod
+    def from_run_context(
+        cls, ctx: RunContext, node: Node, to_exhaustion: bool = False
+    ) -> ExecutionSpec:
+        if not ctx.env.supports_concurrent_metadata_sessions():
+            raise SpecSerializationError(
+                f"Metadata storage {ctx.env.metadata_storage.url} is not shareable across processes"
+            )
+        if issubclass(
+            ctx.target_storage.storage_engine.storage_class, PythonStorageClass
+        ):
+            raise SpecSerializationError(
+                f"Target storage {ctx.target_storage.url} is process-local, use a database or file storage"
+            )
+        return ExecutionSpec(
+            node_key=node.key,
+            metadata_storage_url=ctx.env.metadata_storage.url,
+            # Python storages are local to the process, so the child gets its own
+            storage_urls=[
+                s.url
+                for s in ctx.storages
+                if not issubclass(s.storage_engine.storage_class, PythonStorageClass)
+            ],
+            target_storage_url=ctx.target_storage.url,
+            nodes=[NodeSpec.from_node(n) for n in ctx.graph.all_nodes()],
+            schemas=[asdict(s) for s in ctx.env.all_schemas()],
+            module_lookup_names=ctx.env.get_module_order(),
+            to_exhaustion=to_exhaustion,
+            node_timelimit_seconds=ctx.node_timelimit_seconds,
+            execution_timelimit_seconds=ctx.execution_timelimit_seconds,
+            memoize_outputs=ctx.memoize_outputs,
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), cls=SnapflowJSONEncoder)
+
+    @classmethod
+    def from_json(cls, s: str) -> ExecutionSpec:
+        d = json.loads(s)
+        d["nodes"] = [NodeSpec.from_dict(n) for n in d["nodes"]]
+        return ExecutionSpec(**d)
+
+    def environment_hash(self) -> str:
+        d = asdict(self)
+        for k in ("node_key", "to_exhaustion"):
+            d.pop(k)
+        return md5_hash(json.dumps(d, cls=SnapflowJSONEncoder, sort_keys=True))
+
+    def build_environment(self) -> Tuple[Environment, Graph]:
+        from snapflow.core.environment import Environment
+        from snapflow.core.graph import Graph
+        from snapflow.core.streams import StreamBuilder
+
+        env = Environment(metadata_storage=self.metadata_storage_url)
+        for url in self.storage_urls:
+            env.add_storage(url)
+        for name in self.module_lookup_names:
+            env.library.add_module_name(name)
+        for d in self.schemas:
+            schema = Schema.from_dict(d)
+            if schema.key not in env.library.schemas:
+                env.add_schema(schema)
+        g = Graph(env)
+        for n in self.nodes:
+            upstream = {
+                name: StreamBuilder(
+                    nodes=keys, schemas=n.upstream_schemas.get(name) or None
+                )
+                for name, keys in n.upstream.items()
+            }
+            g.create_node(
+                key=n.key,
+                pipe=n.pipe.as_pipe(),
+                config=n.config,
+                upstream=upstream,
+                output_alias=n.output_alias,
+                schema_translation=n.schema_translation,
+                batch_size=n.batch_size,
+                # Memory of a worker process isn't reachable from the parent
+                materialize=(
+                    MATERIALIZE_LAZY
+                    if n.materialize == MATERIALIZE_NEVER
+                    else n.materialize
+                ),
+            )
+        return env, g
+
+
+# Rebuilt environments, cached per worker process
+_spec_environments: Dict[str, Tuple[Environment, Graph]] = {}
+
+
+def run_execution_spec(spec_json: str) -> Optional[str]:
+    """
+    Entrypoint for worker processes: rebuilds the run from the spec, executes
+    the node and returns the id of its last output block (if any).
+    """
+    from snapflow.core.execution import ExecutionManager
+
+    spec = ExecutionSpec.from_json(spec_json)
+    env_hash = spec.environment_hash()
+    if env_hash not in _spec_environments:
+        _spec_environments[env_hash] = spec.build_environment()
+    env, g = _spec_environments[env_hash]
+    logger.debug(f"Running spec for node {spec.node_key} in worker process")
+    ctx = env.get_run_context(
+        g,
+        target_storage=spec.target_storage_url,
+        node_timelimit_seconds=spec.node_timelimit_seconds,
+        execution_timelimit_seconds=spec.execution_timelimit_seconds,
+        memoize_outputs=spec.memoize_outputs,
+    )
+    em = ExecutionManager(ctx)
+    try:
+        output = em.execute_to_output(g.get_node(spec.node_key), spec.to_exhaustion)
+    finally:
+        ctx.materialize_pending()
+    if output is None:
+        return None
+    # Output is detached from its (closed) session, so read id from the identity key
+    return inspect(output).identity[0]
@@ -0,0 +1,407 @@
+"""
+Garbage collection of data blocks and compaction of their logs.
+
+Blocks are collected according to `RetentionPolicy`s per node (the block's
+creator) or per nominal schema. Collected blocks are flagged `deleted` (the
+metadata row stays, so logs, lineage and memoized outputs remain consistent)
+and all their stored copies are dropped, both metadata and physical storage.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+from snapflow.core.data_block import (
+    Alias,
+    DataBlockMetadata,
+    StoredDataBlockMetadata,
+)
+from snapflow.core.metadata.orm import BaseModel
+from snapflow.core.node import DataBlockLog, Direction, NodeBlockIndex, PipeLog
+from snapflow.utils.common import utcnow
+from sqlalchemy import Column, Date, Enum, Integer, String, and_, func
+from sqlalchemy.orm import Session
+
+if TYPE_CHECKING:
+    from snapflow.core.environment import Environment
+    from snapflow.core.graph import Graph
+
+
+# Max ids per `in` clause
+GC_BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """
+    Which blocks of a node (or schema) to keep: the `keep_latest` most recent
+    blocks, and any block younger than `max_age`. Blocks outside both (or the
+    one given) are collected. A node's latest output, aliased blocks, and
+    blocks not yet processed by every downstream node are always kept.
+    """
+
+    keep_latest: Optional[int] = None
+    max_age: Optional[timedelta] = None
+
+    def __post_init__(self):
+        if self.keep_latest is None and self.max_age is None:
+            raise ValueError("Retention policy needs `keep_latest` and/or `max_age`")
+        if self.keep_latest is not None and self.keep_latest < 0:
+            raise ValueError("`keep_latest` must be non-negative")
+
+
+class DataBlockLogSummary(BaseModel):
+    """
+    Daily counts of compacted DataBlockLog entries (those of collected blocks)
+    per node and direction.
+    """
+
+    node_key = Column(String(128), primary_key=True)
+    direction = Column(Enum(Direction, native_enum=False), primary_key=True)
+    period = Column(Date, primary_key=True)
+    log_count = Column(Integer, nullable=False, default=0)
+    record_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return self._repr(
+            node_key=self.node_key,
+            direction=self.direction,
+            period=self.period,
+            log_count=self.log_count,
+        )
+
+
+@dataclass
+class GarbageCollectionResult:
+    deleted_block_ids: List[str] = field(default_factory=list)
+    removed_stored_block_count: int = 0
+    compacted_log_count: int = 0
+    dry_run: bool = False
+
+
+def _batches(ids: List[str]) -> Iterable[List[str]]:
+    for i in range(0, len(ids), GC_BATCH_SIZE):
+        yield ids[i : i + GC_BATCH_SIZE]
+
+
+class GarbageCollector:
+    """
+    Collects blocks per the given policies, with precedence node policy, then
+    schema policy, then `default_policy` (blocks with no applicable policy are
+    kept). `graph` determines each node's downstream consumers, so it should
+    be the full graph run against this metadata.
+
+    Python storage copies are collected like any other stored copy, with their
+    block. Dropping the unreadable copies left by other processes regardless
+    of policy is separate, see `remove_dead_python_blocks`.
+    """
+
+    def __init__(
+        self,
+        env: Environment,
+        graph: Graph,
+        node_policies: Optional[Dict[str, RetentionPolicy]] = None,
+        schema_policies: Optional[Dict[str, RetentionPolicy]] = None,
+        default_policy: Optional[RetentionPolicy] = None,
+    ):
+        self.env = env
+        self.graph = graph
+        self.node_policies = node_policies or {}
+        self.schema_policies = schema_policies or {}
+        self.default_policy = default_policy
+
+    def get_policy(
+        self, node_key: Optional[str], schema_key: Optional[str]
+    ) -> Optional[RetentionPolicy]:
+        if node_key in self.node_policies:
+            return self.node_policies[node_key]
+        if schema_key in self.schema_policies:
+            return self.schema_policies[schema_key]
+        return self.default_policy
+
+    def get_consumers(self) -> Dict[Optional[str], List[Tuple[str, List[str]]]]:
+        """
+        (Consumer node key, accepted schema keys) of each node's output blocks,
+        keyed by node key. Consumers of schema-only streams (no upstream
+        nodes) are keyed by None, as they consume blocks from any node.
+        """
+        consumers: Dict[Optional[str], List[Tuple[str, List[str]]]] = defaultdict(list)
+        for node in self.graph.all_nodes():
+            for declared_input in node.declared_inputs.values():
+                stream = declared_input.stream
+                schemas = [
+                    s if isinstance(s, str) else s.key for s in stream.schemas or []
+                ]
+                source_keys = stream.source_node_keys()
+                for source_key in source_keys or [None]:
+                    if source_key == node.key:
+                        # Self reference
+                        continue
+                    consumers[source_key].append((node.key, schemas))
+        return consumers
+
+    def get_protected_block_ids(self, sess: Session) -> Set[str]:
+        protected = set(r[0] for r in sess.query(Alias.data_block_id))
+        # Block ids are only ordered within a process, so a node's latest
+        # output is the one it logged last
+        last_output_at = (
+            sess.query(
+                PipeLog.node_key,
+                func.max(DataBlockLog.processed_at).label("processed_at"),
+            )
+            .join(DataBlockLog, DataBlockLog.pipe_log_id == PipeLog.id)
+            .filter(DataBlockLog.direction == Direction.OUTPUT)
+            .group_by(PipeLog.node_key)
+            .subquery()
+        )
+        latest = (
+            sess.query(DataBlockLog.data_block_id)
+            .join(PipeLog, DataBlockLog.pipe_log_id == PipeLog.id)
+            .join(
+                last_output_at,
+                and_(
+                    PipeLog.node_key == last_output_at.c.node_key,
+                    DataBlockLog.processed_at == last_output_at.c.processed_at,
+                ),
+            )
+            .filter(DataBlockLog.direction == Direction.OUTPUT)
+        )
+        protected.update(r[0] for r in latest)
+        return protected
+
+    def get_expired_block_ids(self, sess: Session) -> List[str]:
+        cutoff_now = utcnow()
+        seen_per_group: Dict[Tuple, int] = defaultdict(int)
+        expired = []
+        block_output_at = (
+            sess.query(
+                DataBlockLog.data_block_id,
+                func.max(DataBlockLog.processed_at).label("processed_at"),
+            )
+            .filter(DataBlockLog.direction == Direction.OUTPUT)
+            .group_by(DataBlockLog.data_block_id)
+            .subquery()
+        )
+        rows = (
+            sess.query(
+                DataBlockMetadata.id,
+                DataBlockMetadata.created_by_node_key,
+                DataBlockMetadata.nominal_schema_key,
+                DataBlockMetadata.created_at,
+            )
+            .outerjoin(
+                block_output_at, DataBlockMetadata.id == block_output_at.c.data_block_id
+            )
+            .filter(~DataBlockMetadata.deleted)
+            # Most recent first, by when the block was output (if ever logged)
+            .order_by(
+                func.coalesce(
+                    block_output_at.c.processed_at, DataBlockMetadata.created_at
+                ).desc(),
+                DataBlockMetadata.id.desc(),
+            )
+        )
+        for block_id, node_key, schema_key, created_at in rows:
+            policy = self.get_policy(node_key, schema_key)
+            if policy is None:
+                continue
+            if (
+                node_key not in self.node_policies
+                and schema_key in self.schema_policies
+            ):
+                group = ("schema", schema_key)
+            else:
+                group = ("node", node_key)
+            seen_per_group[group] += 1
+            if (
+                policy.keep_latest is not None
+                and seen_per_group[group] <= policy.keep_latest
+            ):
+                continue
+            if policy.max_age is not None and created_at is not None:
+                if created_at.replace(tzinfo=cutoff_now.tzinfo) > (
+                    cutoff_now - policy.max_age
+                ):
+                    continue
+            expired.append(block_id)
+        return expired
+
+    def filter_unprocessed(
+        self, sess: Session, block_ids: List[str]
+    ) -> Tuple[List[str], Set[str]]:
+        """
+        Splits blocks into those processed by all their consumers, and those
+        still waiting on one or more. A block's consumers are those of every
+        node that output it (not only the one that created it, eg a memoized
+        output is output again by other nodes).
+        """
+        consumers = self.get_consumers()
+        schema_keys: Dict[str, Optional[str]] = {}
+        producers: Dict[str, Set[Optional[str]]] = defaultdict(set)
+        processed: Dict[str, Set[str]] = defaultdict(set)
+        for batch in _batches(block_ids):
+            for block_id, node_key, schema_key in sess.query(
+                DataBlockMetadata.id,
+                DataBlockMetadata.created_by_node_key,
+                DataBlockMetadata.nominal_schema_key,
+            ).filter(DataBlockMetadata.id.in_(batch)):
+                schema_keys[block_id] = schema_key
+                producers[block_id].add(node_key)
+            for node_key, block_id, direction in sess.query(
+                NodeBlockIndex.node_key,
+                NodeBlockIndex.data_block_id,
+                NodeBlockIndex.direction,
+            ).filter(NodeBlockIndex.data_block_id.in_(batch)):
+                if direction == Direction.INPUT:
+                    processed[block_id].add(node_key)
+                else:
+                    producers[block_id].add(node_key)
+        collectable = []
+        pending = set()
+        for block_id in block_ids:
+            schema_key = schema_keys[block_id]
+            waiting = [
+                consumer_key
+                for producer_key in producers[block_id] | {None}
+                for consumer_key, schemas in consumers.get(producer_key, [])
+                if (not schemas or schema_key in schemas)
+                and consumer_key not in processed[block_id]
+            ]
+            if waiting:
+                pending.add(block_id)
+            else:
+                collectable.append(block_id)
+        return collectable, pending
+
+    def remove_stored_blocks(
+        self, sess: Session, sdbs: List[StoredDataBlockMetadata]
+    ) -> int:
+        removed = 0
+        for sdb in sdbs:
+            api = sdb.storage.get_api()
+            name = sdb.get_name()
+            if api.exists(name):
+                api.remove(name)
+                removed += 1
+            sess.delete(sdb)
+        return removed
+
+    def collect(
+        self, dry_run: bool = False, compact_logs: bool = True
+    ) -> GarbageCollectionResult:
+        result = GarbageCollectionResult(dry_run=dry_run)
+        with self.env.session_scope() as sess:
+            protected = self.get_protected_block_ids(sess)
+            expired = [
+                b for b in self.get_expired_block_ids(sess) if b not in protected
+            ]
+            collectable, pending = self.filter_unprocessed(sess, expired)
+            if pending:
+                logger.debug(f"Keeping {len(pending)} expired but unprocessed blocks")
+            result.deleted_block_ids = collectable
+            if dry_run:
+                return result
+            for batch in _batches(collectable):
+                for block in sess.query(DataBlockMetadata).filter(
+                    DataBlockMetadata.id.in_(batch)
+                ):
+                    try:
+                        result.removed_stored_block_count += self.remove_stored_blocks(
+                            sess, list(block.stored_data_blocks)
+                        )
+                    except Exception as e:
+                        # Eg a table still referenced by a view on postgres
+                        logger.warning(
+                            f"Could not remove stored copies of {block}: {e}"
+                        )
+                        continue
+                    block.deleted = True
+            sess.flush()
+            if compact_logs:
+                result.compacted_log_count = compact_data_block_logs(sess)
+        logger.info(
+            f"Collected {len(result.deleted_block_ids)} blocks, "
+            f"compacted {result.compacted_log_count} logs"
+        )
+        return result
+
+
+def remove_dead_python_blocks(sess: Session) -> int:
+    """
+    Drops metadata of stored copies in python storages whose records are not
+    in this process's memory (copies of other, possibly finished, processes or
+    evicted ones), and flags blocks left without any stored copy as deleted.
+    Copies held by other live processes can't be told apart from dead ones, so
+    only call this when no other process is using the metadata.
+    """
+    sdbs = sess.query(StoredDataBlockMetadata).filter(
+        StoredDataBlockMetadata.storage_url.startswith("python://")
+    )
+    dead = [sdb for sdb in sdbs if not sdb.storage.get_api().exists(sdb.get_name())]
+    block_ids = set(sdb.data_block_id for sdb in dead)
+    dead_ids = [sdb.id for sdb in dead]
+    for batch in _batches(dead_ids):
+        # Aliases are recreated (or repointed) on the node's next output
+        sess.query(Alias).filter(Alias.stored_data_block_id.in_(batch)).delete(
+            synchronize_session=False
+        )
+    for sdb in dead:
+        sess.delete(sdb)
+    sess.flush()
+    for batch in _batches(list(block_ids)):
+        for block in sess.query(DataBlockMetadata).filter(
+            DataBlockMetadata.id.in_(batch),
+            ~DataBlockMetadata.stored_data_blocks.any(),
+        ):
+            block.deleted = True
+    return len(dead)
+
+
+def compact_data_block_logs(sess: Session) -> int:
+    """
+    Replaces the DataBlockLog entries of deleted blocks with daily summary
+    counts. Stream binding only relies on the node block index, so entries of
+    deleted blocks are history only.
+    """
+    rows = (
+        sess.query(
+            DataBlockLog.id,
+            PipeLog.node_key,
+            DataBlockLog.direction,
+            DataBlockLog.processed_at,
+            DataBlockMetadata.record_count,
+        )
+        .join(PipeLog, DataBlockLog.pipe_log_id == PipeLog.id)
+        .join(DataBlockMetadata, DataBlockLog.data_block_id == DataBlockMetadata.id)
+        .filter(DataBlockMetadata.deleted)
+        .all()
+    )
+    if not rows:
+        return 0
+    counts: Dict[Tuple[str, Direction, date], List[int]] = defaultdict(lambda: [0, 0])
+    for _, node_key, direction, processed_at, record_count in rows:
+        c = counts[(node_key, direction, processed_at.date())]
+        c[0] += 1
+        c[1] += record_count or 0
+    for (node_key, direction, period), (log_count, record_count) in counts.items():
+        summary = sess.query(DataBlockLogSummary).get((node_key, direction, period))
+        if summary is None:
+            summary = DataBlockLogSummary(
+                node_key=node_key,
+                direction=direction,
+                period=period,
+                log_count=0,
+                record_count=0,
+            )
+            sess.add(summary)
+        summary.log_count += log_count
+        summary.record_count += record_count
+    log_ids = [r[0] for r in rows]
+    for i in range(0, len(log_ids), GC_BATCH_SIZE):
+        sess.query(DataBlockLog).filter(
+            DataBlockLog.id.in_(log_ids[i : i + GC_BATCH_SIZE])
+        ).delete(synchronize_session=False)
+    return len(rows)
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+from dataclasses import dataclass, field
 from typing import (
     TYPE_CHECKING,
     Any,
     Callable,
     Dict,
     Iterable,
+    Iterator,
     List,
     Optional,
     Set,
@@ -17,9 +19,9 @@ from typing import (
 import networkx as nx
 from loguru import logger
 from snapflow.core.metadata.orm import BaseModel
-from snapflow.core.node import DeclaredNode, Node, NodeLike, node
+from snapflow.core.node import MATERIALIZE_EAGER, DeclaredNode, Node, NodeLike, node
 from snapflow.core.pipe import PipeLike
-from snapflow.utils.common import md5_hash, remove_dupes
+from snapflow.utils.common import md5_hash
 from sqlalchemy import Column, String
 from sqlalchemy.sql.sqltypes import JSON
 
@@ -62,6 +64,8 @@ class DeclaredGraph:
         graph: Optional[DeclaredGraph] = None,
         output_alias: Optional[str] = None,
         schema_translation: Optional[Dict[str, Union[Dict[str, str], str]]] = None,
+        batch_size: Optional[int] = None,
+        materialize: str = MATERIALIZE_EAGER,
     ) -> DeclaredNode:
         dn = node(
             pipe=pipe,
@@ -71,6 +75,8 @@ class DeclaredGraph:
             graph=graph,
             output_alias=output_alias,
             schema_translation=schema_translation,
+            batch_size=batch_size,
+            materialize=materialize,
         )
         self.add_node(dn)
         return dn
@@ -116,10 +122,73 @@ def hash_adjacency(adjacency: List[Tuple[str, Dict]]) -> str:
     return md5_hash(str(adjacency))
 
 
+@dataclass(frozen=True)
+class ExecutionPlan:
+    """
+    Immutable snapshot of a graph's structure, computed once per graph version:
+    the dependency graph, a topological execution order and the graph hash.
+    Upstream closures are memoized per node as they are requested.
+    """
+
+    nx_graph: nx.DiGraph
+    execution_order: Tuple[str, ...]
+    adjacency: List[Tuple[str, Dict]]
+    hash: str
+    _upstream_cache: Dict[str, Tuple[str, ...]] = field(
+        default_factory=dict, compare=False, repr=False
+    )
+
+    @classmethod
+    def from_nx_graph(cls, g: nx.DiGraph) -> ExecutionPlan:
+        adjacency = list(g.adjacency())
+        # Self-ref edges don't constrain execution order
+        acyclic = g.copy()
+        acyclic.remove_edges_from(list(nx.selfloop_edges(acyclic)))
+        return ExecutionPlan(
+            nx_graph=g,
+            execution_order=tuple(nx.topological_sort(acyclic)),
+            adjacency=adjacency,
+            hash=hash_adjacency(adjacency),
+        )
+
+    def predecessors(self, node_key: str) -> List[str]:
+        return [p for p in self.nx_graph.predecessors(node_key) if p != node_key]
+
+    def successors(self, node_key: str) -> List[str]:
+        return [s for s in self.nx_graph.successors(node_key) if s != node_key]
+
+    def upstream_in_execution_order(self, node_key: str) -> Tuple[str, ...]:
+        """
+        All upstream dependencies of `node_key` (and the node itself, last), in
+        the order of a depth-first post-order traversal of its predecessors.
+        """
+        if node_key in self._upstream_cache:
+            return self._upstream_cache[node_key]
+        ordered: List[str] = []
+        seen: Set[str] = {node_key}
+        stack: List[Tuple[str, Iterator[str]]] = [
+            (node_key, iter(self.predecessors(node_key)))
+        ]
+        while stack:
+            key, parents = stack[-1]
+            for parent in parents:
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append((parent, iter(self.predecessors(parent))))
+                    break
+            else:
+                stack.pop()
+                ordered.append(key)
+        closure = tuple(ordered)
+        self._upstream_cache[node_key] = closure
+        return closure
+
+
 class Graph:
     def __init__(self, env: Environment, nodes: Iterable[Node] = None):
         self.env = env
         self._nodes: Dict[str, Node] = {}
+        self._execution_plan: Optional[ExecutionPlan] = None
         if nodes:
             for n in nodes:
                 self.add_node(n)
@@ -129,8 +198,13 @@ class Graph:
         return s
 
     def get_metadata_obj(self) -> GraphMetadata:
-        adjacency = self.adjacency_list()
-        return GraphMetadata(hash=hash_adjacency(adjacency), adjacency=adjacency)
+        plan = self.get_execution_plan()
+        return GraphMetadata(hash=plan.hash, adjacency=plan.adjacency)
+
+    def get_execution_plan(self) -> ExecutionPlan:
+        if self._execution_plan is None:
+            self._execution_plan = ExecutionPlan.from_nx_graph(self.as_nx_graph())
+        return self._execution_plan
 
     # TODO: duplicated code
     def node(
@@ -142,6 +216,8 @@ class Graph:
         graph: Optional[DeclaredGraph] = None,
         output_alias: Optional[str] = None,
         schema_translation: Optional[Dict[str, Union[Dict[str, str], str]]] = None,
+        batch_size: Optional[int] = None,
+        materialize: str = MATERIALIZE_EAGER,
     ) -> Node:
         dn = node(
             pipe=pipe,
@@ -151,6 +227,8 @@ class Graph:
             graph=graph,
             output_alias=output_alias,
             schema_translation=schema_translation,
+            batch_size=batch_size,
+            materialize=materialize,
         )
         n = dn.instantiate(self.env, self)
         self.add_node(n)
@@ -162,9 +240,11 @@ class Graph:
         if node.key in self._nodes:
             raise KeyError(f"Duplicate node key {node.key}")
         self._nodes[node.key] = node
+        self._execution_plan = None
 
     def remove_node(self, node: Node):
         del self._nodes[node.key]
+        self._execution_plan = None
 
     def get_node(self, key: NodeLike) -> Node:
         if isinstance(key, Node):
@@ -201,31 +281,90 @@ class Graph:
         return g
 
     def adjacency_list(self):
-        return list(self.as_nx_graph().adjacency())
+        return self.get_execution_plan().adjacency
 
     def get_all_upstream_dependencies_in_execution_order(
         self, node: Node
     ) -> List[Node]:
-        g = self.as_nx_graph()
-        node_keys = self._get_all_upstream_dependencies_in_execution_order(g, node.key)
+        node_keys = self.get_execution_plan().upstream_in_execution_order(node.key)
         return [self.get_node(name) for name in node_keys]
 
-    def _get_all_upstream_dependencies_in_execution_order(
-        self, g: nx.DiGraph, node: str
-    ) -> List[str]:
-        nodes = []
-        for parent_node in g.predecessors(node):
-            if parent_node == node:
-                # Ignore self-ref cycles
-                continue
-            parent_deps = self._get_all_upstream_dependencies_in_execution_order(
-                g, parent_node
+    def get_all_nodes_in_execution_order(self) -> List[Node]:
+        return [
+            self.get_node(name) for name in self.get_execution_plan().execution_order
+        ]
+
+    def get_fusable_python_chains(
+        self, node_keys: Optional[Iterable[str]] = None
+    ) -> List[List[str]]:
+        """
+        Finds maximal linear chains (in execution order) of python nodes where
+        each intermediate node's output is consumed only by the next node in
+        the chain, as a single DataBlock input, so it never needs to leave memory.
+        """
+        from snapflow.core.runtime import PythonRuntimeClass
+
+        def can_fuse(upstream: Node, downstream: Node) -> bool:
+            return all(
+                PythonRuntimeClass in n.pipe.compatible_runtime_classes
+                for n in (upstream, downstream)
             )
-            nodes.extend(parent_deps)
-        nodes.append(node)
-        # May have added nodes twice, just keep first reference:
-        return remove_dupes(nodes)
 
-    def get_all_nodes_in_execution_order(self) -> List[Node]:
-        g = self.as_nx_graph()
-        return [self.get_node(name) for name in nx.topological_sort(g)]
+        return self._get_fusable_chains(node_keys, can_fuse)
+
+    def get_fusable_sql_chains(
+        self, node_keys: Optional[Iterable[str]] = None
+    ) -> List[List[str]]:
+        """
+        Finds maximal linear chains of SQL pipe nodes that can be compiled into
+        a single statement, see `snapflow.core.sql.fusion`.
+        """
+        from snapflow.core.sql.fusion import can_fuse_sql_nodes
+
+        return self._get_fusable_chains(node_keys, can_fuse_sql_nodes)
+
+    def _get_fusable_chains(
+        self,
+        node_keys: Optional[Iterable[str]],
+        can_fuse: Callable[[Node, Node], bool],
+    ) -> List[List[str]]:
+        plan = self.get_execution_plan()
+        keys = set(node_keys) if node_keys is not None else set(self._nodes)
+        chains: List[List[str]] = []
+        chained: Set[str] = set()
+        for key in plan.execution_order:
+            if key not in keys or key in chained:
+                continue
+            chain = [key]
+            while True:
+                nxt = self._get_fusable_successor(chain[-1], keys, can_fuse)
+                if nxt is None:
+                    break
+                chain.append(nxt)
+            if len(chain) > 1:
+                chains.append(chain)
+                chained.update(chain)
+        return chains
+
+    def _get_fusable_successor(
+        self, key: str, keys: Set[str], can_fuse: Callable[[Node, Node], bool]
+    ) -> Optional[str]:
+        plan = self.get_execution_plan()
+        successors = plan.successors(key)
+        if len(successors) != 1 or successors[0] not in keys:
+            return None
+        upstream = self.get_node(key)
+        downstream = self.get_node(successors[0])
+        if plan.predecessors(downstream.key) != [key]:
+            return None
+        if upstream.output_alias:
+            # Explicitly aliased outputs are meant to be consumed, keep them persisted
+            return None
+        for n in (upstream, downstream):
+            if any(i.is_self_ref for i in n.get_interface().inputs):
+                return None
+        if any(i.is_stream for i in downstream.get_interface().inputs):
+            return None
+        if not can_fuse(upstream, downstream):
+            return None
+        return downstream.key
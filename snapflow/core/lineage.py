@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from loguru import logger
+from snapflow.core.data_block import DataBlock, DataBlockMetadata
+from snapflow.core.metadata.orm import SNAPFLOW_METADATA_TABLE_PREFIX, BaseModel
+from snapflow.core.node import DataBlockLog, Direction
+from sqlalchemy import Column, ForeignKey, Integer, String, func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Query, Session
+from sqlalchemy.sql.schema import Index
+
+BlockLike = Union[DataBlockMetadata, DataBlock, str]
+# (pipe log id, data block id, direction) of a DataBlockLog entry
+LogEntry = Tuple[int, str, Direction]
+
+
+class BlockLineage(BaseModel):
+    """
+    Transitive closure of the block lineage graph: one row per (ancestor,
+    descendant) pair of blocks, with the length of the shortest path of pipe
+    runs between them. Maintained as runs are committed (see
+    `update_block_lineage`), so ancestry is a single indexed lookup.
+    """
+
+    __table_args__ = (
+        Index(
+            f"ix_{SNAPFLOW_METADATA_TABLE_PREFIX}block_lineage_descendant",
+            "descendant_block_id",
+            "depth",
+        ),
+    )
+
+    ancestor_block_id = Column(
+        String(128),
+        ForeignKey(f"{SNAPFLOW_METADATA_TABLE_PREFIX}data_block_metadata.id"),
+        primary_key=True,
+    )
+    descendant_block_id = Column(
+        String(128),
+        ForeignKey(f"{SNAPFLOW_METADATA_TABLE_PREFIX}data_block_metadata.id"),
+        primary_key=True,
+    )
+    depth = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return self._repr(
+            ancestor_block_id=self.ancestor_block_id,
+            descendant_block_id=self.descendant_block_id,
+            depth=self.depth,
+        )
+
+
+def _group_by_pipe_log(
+    logs: Iterable[LogEntry],
+) -> List[Tuple[List[str], List[str]]]:
+    # (input block ids, output block ids) per pipe log, in log order
+    grouped: Dict[int, Tuple[List[str], List[str]]] = {}
+    for pipe_log_id, block_id, direction in logs:
+        inputs, outputs = grouped.setdefault(pipe_log_id, ([], []))
+        (inputs if direction == Direction.INPUT else outputs).append(block_id)
+    return [g for g in grouped.values() if g[0] and g[1]]
+
+
+def update_block_lineage(conn: Connection, logs: Iterable[LogEntry]):
+    """
+    Adds the lineage of new DataBlockLog entries: each output of a pipe run
+    descends from the run's inputs and all of their ancestors. Runs are
+    processed in order, so a run may consume outputs logged earlier in the
+    same batch.
+    """
+    table = BlockLineage.__table__
+    for inputs, outputs in _group_by_pipe_log(logs):
+        ancestors: Dict[str, int] = {b: 1 for b in inputs}
+        rows = conn.execute(
+            select([table.c.ancestor_block_id, func.min(table.c.depth)])
+            .where(table.c.descendant_block_id.in_(inputs))
+            .group_by(table.c.ancestor_block_id)
+        )
+        for ancestor_id, depth in rows:
+            ancestors[ancestor_id] = min(
+                ancestors.get(ancestor_id, depth + 1), depth + 1
+            )
+        # An existing block may be output again (eg a memoized output)
+        existing = set(
+            tuple(r)
+            for r in conn.execute(
+                select([table.c.ancestor_block_id, table.c.descendant_block_id]).where(
+                    table.c.descendant_block_id.in_(outputs)
+                )
+            )
+        )
+        new_rows = [
+            dict(ancestor_block_id=a, descendant_block_id=o, depth=d)
+            for o in set(outputs)
+            for a, d in ancestors.items()
+            if a != o and (a, o) not in existing
+        ]
+        if new_rows:
+            conn.execute(table.insert(), new_rows)
+
+
+def build_block_lineage(conn: Connection):
+    """
+    Builds the lineage table from the existing DataBlockLog, if it has never
+    been built (eg metadata created before the table existed).
+    """
+    table = BlockLineage.__table__
+    if conn.execute(select([table.c.ancestor_block_id]).limit(1)).first() is not None:
+        return
+    log = DataBlockLog.__table__
+    rows = conn.execute(
+        select([log.c.pipe_log_id, log.c.data_block_id, log.c.direction]).order_by(
+            log.c.pipe_log_id, log.c.id
+        )
+    ).fetchall()
+    if not rows:
+        return
+    logger.info("Building block lineage from DataBlockLog")
+    ancestors: Dict[str, Dict[str, int]] = defaultdict(dict)
+    for inputs, outputs in _group_by_pipe_log(tuple(r) for r in rows):
+        new_ancestors: Dict[str, int] = {}
+        for i in inputs:
+            new_ancestors[i] = 1
+            for a, d in ancestors[i].items():
+                new_ancestors[a] = min(new_ancestors.get(a, d + 1), d + 1)
+        for o in outputs:
+            for a, d in new_ancestors.items():
+                if a != o and a not in ancestors[o]:
+                    ancestors[o][a] = d
+    new_rows = [
+        dict(ancestor_block_id=a, descendant_block_id=o, depth=d)
+        for o, o_ancestors in ancestors.items()
+        for a, d in o_ancestors.items()
+    ]
+    if new_rows:
+        conn.execute(table.insert(), new_rows)
+
+
+def block_id_for(block: BlockLike) -> str:
+    if isinstance(block, str):
+        return block
+    if isinstance(block, DataBlockMetadata):
+        return block.id
+    return block.data_block_id
+
+
+def query_block_ancestors(
+    sess: Session, block: BlockLike, max_depth: Optional[int] = None
+) -> Query:
+    """
+    Blocks that `block` was (transitively) derived from, nearest first.
+    """
+    q = (
+        sess.query(DataBlockMetadata)
+        .join(BlockLineage, BlockLineage.ancestor_block_id == DataBlockMetadata.id)
+        .filter(BlockLineage.descendant_block_id == block_id_for(block))
+    )
+    if max_depth is not None:
+        q = q.filter(BlockLineage.depth <= max_depth)
+    return q.order_by(BlockLineage.depth, DataBlockMetadata.id)
+
+
+def query_block_descendants(
+    sess: Session, block: BlockLike, max_depth: Optional[int] = None
+) -> Query:
+    """
+    Blocks (transitively) derived from `block`, nearest first.
+    """
+    q = (
+        sess.query(DataBlockMetadata)
+        .join(BlockLineage, BlockLineage.descendant_block_id == DataBlockMetadata.id)
+        .filter(BlockLineage.ancestor_block_id == block_id_for(block))
+    )
+    if max_depth is not None:
+        q = q.filter(BlockLineage.depth <= max_depth)
+    return q.order_by(BlockLineage.depth, DataBlockMetadata.id)
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from loguru import logger
+from snapflow.core.data_block import DataBlockMetadata, StoredDataBlockMetadata
+from snapflow.core.metadata.orm import BaseModel
+from snapflow.core.pipe import Pipe
+from snapflow.core.pipe_interface import BoundInterface
+from snapflow.utils.common import SnapflowJSONEncoder, md5_hash
+from sqlalchemy import Column, ForeignKey, String
+from sqlalchemy.orm import RelationshipProperty, Session, relationship
+
+if TYPE_CHECKING:
+    from snapflow.core.execution import RunContext
+
+
+class OutputCacheEntry(BaseModel):
+    """
+    Maps a content key (pipe source, config, input blocks and their schema
+    translations) to the block a pipe produced for it, so identical runs of
+    pure pipes can reuse the output.
+    """
+
+    key = Column(String(128), primary_key=True)
+    pipe_key = Column(String(128), nullable=False)
+    data_block_id = Column(
+        String(128), ForeignKey(DataBlockMetadata.id), nullable=False
+    )
+    data_block: RelationshipProperty = relationship(DataBlockMetadata)
+
+    def __repr__(self):
+        return self._repr(
+            key=self.key,
+            pipe_key=self.pipe_key,
+            data_block_id=self.data_block_id,
+        )
+
+
+def get_output_cache_key(
+    pipe: Pipe, config: Dict[str, Any], bound_interface: BoundInterface
+) -> Optional[str]:
+    """
+    Returns the content key for this pipe invocation, or None if it can't be
+    memoized. Only pipes whose bound inputs are all single DataBlocks are
+    eligible: stream inputs (and self-refs) depend on more than their block ids.
+    Stateful python pipes (those taking a `PipeContext`) are never eligible,
+    a cache hit would skip their state updates.
+    """
+    if pipe.state_class is not None or (
+        bound_interface.requires_pipe_context and pipe.source_code_language() != "sql"
+    ):
+        return None
+    input_block_ids = {}
+    translations = {}
+    for input in bound_interface.inputs:
+        if input.bound_stream is None:
+            continue
+        if input.is_stream or input.annotation.is_self_ref:
+            return None
+        input_block_ids[input.name] = input.bound_block.data_block_id
+        translations[input.name] = input.declared_schema_translation
+    if not input_block_ids:
+        # Source pipes read external state, never pure
+        return None
+    try:
+        source = pipe.get_source_code()
+    except (OSError, TypeError):
+        return None
+    return md5_hash(
+        json.dumps(
+            dict(
+                source=source,
+                config=config,
+                inputs=input_block_ids,
+                translations=translations,
+            ),
+            cls=SnapflowJSONEncoder,
+            sort_keys=True,
+        )
+    )
+
+
+def get_cached_output(
+    ctx: RunContext, sess: Session, key: str
+) -> Optional[StoredDataBlockMetadata]:
+    from snapflow.core.storage import ensure_data_block_on_storage
+
+    entry = sess.query(OutputCacheEntry).get(key)
+    if entry is None or entry.data_block.deleted:
+        return None
+    try:
+        sdb = ensure_data_block_on_storage(
+            ctx.env,
+            sess,
+            entry.data_block,
+            ctx.target_storage,
+            eligible_storages=ctx.storages,
+        )
+    except NotImplementedError:
+        # No reachable copy of the cached block
+        logger.debug(f"Cached output {entry} is not reachable from {ctx.storages}")
+        return None
+    if not sdb.exists():
+        return None
+    return sdb
+
+
+def set_cached_output(
+    sess: Session, key: str, pipe: Pipe, block: DataBlockMetadata
+) -> OutputCacheEntry:
+    return sess.merge(
+        OutputCacheEntry(key=key, pipe_key=pipe.key, data_block_id=block.id)
+    )
@@ -1,6 +1,12 @@
+from typing import Any, Optional
+
 from loguru import logger
+from snapflow.utils.common import LRUCache
 from sqlalchemy import event
-from sqlalchemy.orm import object_session, sessionmaker
+from sqlalchemy.orm import Session, object_session, sessionmaker
+from sqlalchemy.orm.session import SessionTransaction
+
+PENDING_CACHE_PUTS_SESSION_KEY = "snapflow_pending_cache_puts"
 
 # def add_persisting_sdb_listener(session_maker: sessionmaker):
 #     @event.listens_for(session_maker, "pending_to_persistent", propagate=True)
@@ -22,6 +28,52 @@ def immutability_update_listener(mapper, connection, target):
         raise ImmutableObjectException("DataBlocks and StoredDataBlocks are immutable")
 
 
+def get_root_transaction(sess: Session) -> SessionTransaction:
+    transaction = sess.transaction
+    while transaction.parent is not None:
+        transaction = transaction.parent
+    return transaction
+
+
+def put_after_commit(sess: Session, cache: LRUCache, key: Any, value: Any):
+    """
+    Puts `key` in `cache` once the session's current transaction commits (never,
+    if it rolls back). For caches of metadata rows written in the session, so
+    other sessions aren't told a row exists before it does.
+    """
+    sess.info.setdefault(PENDING_CACHE_PUTS_SESSION_KEY, []).append(
+        (get_root_transaction(sess), cache, key, value)
+    )
+
+
+def get_pending_put(sess: Session, cache: LRUCache, key: Any) -> Optional[Any]:
+    """
+    The value put (but not yet committed) in `cache` for `key` by the session,
+    only ever visible to the session itself.
+    """
+    transaction = get_root_transaction(sess)
+    for t, c, k, value in sess.info.get(PENDING_CACHE_PUTS_SESSION_KEY, []):
+        if t is transaction and c is cache and k == key:
+            return value
+    return None
+
+
+def apply_pending_cache_puts(sess: Session):
+    """
+    `after_commit` session listener, makes the session's pending cache puts.
+    Puts left over from earlier, rolled back transactions are dropped.
+    """
+    committed = sess.transaction
+    if committed is None or committed.nested:
+        # Savepoint released, the outer transaction may still roll back
+        return
+    for transaction, cache, key, value in sess.info.pop(
+        PENDING_CACHE_PUTS_SESSION_KEY, []
+    ):
+        if transaction is committed:
+            cache.put(key, value)
+
+
 # @event.listens_for(BaseModel, "init", propagate=True)
 # def intercept_init(instance, args, kwargs):
 #     from snapflow.core.data_block import StoredDataBlock
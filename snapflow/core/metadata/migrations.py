@@ -0,0 +1,114 @@
+"""
+Versioned, in-place upgrades of existing metadata databases.
+
+New tables (and their indexes) are created by `create_all`, so migrations only
+need to handle changes to existing tables. Each migration must be idempotent:
+they also run (as no-ops) against freshly created databases, which are then
+stamped with the latest version.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from loguru import logger
+from snapflow.core.metadata.orm import SNAPFLOW_METADATA_TABLE_PREFIX, BaseModel
+from sqlalchemy import Column, Integer, String, func, inspect, select
+from sqlalchemy.engine import Connection
+
+
+class MetadataVersion(BaseModel):
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String(256), nullable=True)
+
+    def __repr__(self):
+        return self._repr(
+            version=self.version,
+            description=self.description,
+            created_at=self.created_at,
+        )
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def add_missing_columns(conn: Connection, table_name: str, column_names: List[str]):
+    table = BaseModel.metadata.tables[table_name]
+    existing = set(c["name"] for c in inspect(conn).get_columns(table_name))
+    for name in column_names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        col_type = column.type.compile(dialect=conn.dialect)
+        logger.info(f"Adding column {table_name}.{name}")
+        conn.execute(f"alter table {table_name} add column {name} {col_type}")
+
+
+def create_missing_indexes(conn: Connection):
+    inspector = inspect(conn)
+    for table in BaseModel.metadata.sorted_tables:
+        existing = set(ix["name"] for ix in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info(f"Creating index {index.name}")
+                index.create(conn)
+
+
+def build_node_block_index(conn: Connection):
+    from snapflow.core.node import ensure_node_block_index
+
+    ensure_node_block_index(conn)
+
+
+def build_block_lineage(conn: Connection):
+    from snapflow.core.lineage import build_block_lineage
+
+    build_block_lineage(conn)
+
+
+def _prefixed(name: str) -> str:
+    return SNAPFLOW_METADATA_TABLE_PREFIX + name
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "Add PipeLog timings",
+        lambda conn: add_missing_columns(conn, _prefixed("pipe_log"), ["timings"]),
+    ),
+    Migration(2, "Build node block index", build_node_block_index),
+    Migration(3, "Add metadata indexes", create_missing_indexes),
+    Migration(4, "Build block lineage", build_block_lineage),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def get_metadata_version(conn: Connection) -> Optional[int]:
+    table = MetadataVersion.__table__
+    return conn.execute(select([func.max(table.c.version)])).scalar()
+
+
+def upgrade_metadata(conn: Connection) -> List[Migration]:
+    """
+    Applies (in order) all migrations newer than the database's version, each
+    in its own transaction. Returns the applied migrations.
+    """
+    current = get_metadata_version(conn) or 0
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+        logger.debug(f"Applying metadata migration {migration}")
+        with conn.begin():
+            migration.upgrade(conn)
+            conn.execute(
+                MetadataVersion.__table__.insert().values(
+                    version=migration.version, description=migration.description
+                )
+            )
+        applied.append(migration)
+    return applied
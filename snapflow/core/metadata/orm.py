@@ -1,4 +1,5 @@
 from collections import OrderedDict
+from threading import Lock
 from typing import Any
 
 from snapflow.utils.common import cf, rand_str, title_to_snake_case, utcnow
@@ -59,6 +60,7 @@ BaseModel = declarative_base(cls=_BaseModel)  # type: Any
 
 id_counter: int = 0
 last_second: str = ""
+_id_lock = Lock()
 
 
 def timestamp_increment_key() -> str:
@@ -67,13 +69,14 @@ def timestamp_increment_key() -> str:
     Appends random chars to ensure multiple processes can run at once and not collide.
     """
     global id_counter, last_second
-    curr_second = utcnow().strftime("%y%m%d%H%M%S")
-    if last_second != curr_second:
-        id_counter = 0
-    cntr = f"{id_counter:05}"
-    key = f"{curr_second}_{cntr}_{rand_str(3).lower()}"
-    last_second = curr_second
-    id_counter += 1
+    with _id_lock:
+        curr_second = utcnow().strftime("%y%m%d%H%M%S")
+        if last_second != curr_second:
+            id_counter = 0
+        cntr = f"{id_counter:05}"
+        key = f"{curr_second}_{cntr}_{rand_str(3).lower()}"
+        last_second = curr_second
+        id_counter += 1
     return key
 
 
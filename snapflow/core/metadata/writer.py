@@ -0,0 +1,109 @@
+"""
+Buffered writes of append-only run metadata.
+
+A pipe run logs one DataBlockLog entry per input block (and output), so adding
+them to the session one object at a time costs a round trip (or more) each on
+flush. Instead they are collected per metadata session and bulk inserted, with
+their node block index and block lineage entries, just before the session
+commits.
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import List, Tuple
+
+from snapflow.core.data_block import DataBlockMetadata
+from snapflow.core.lineage import update_block_lineage
+from snapflow.core.node import DataBlockLog, Direction, PipeLog, index_data_block_logs
+from snapflow.utils.common import utcnow
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.session import SessionTransaction
+
+METADATA_WRITER_SESSION_KEY = "snapflow_metadata_writer"
+
+
+class MetadataWriter:
+    def __init__(self, sess: Session):
+        self.sess = sess
+        self.logs: List[Tuple[PipeLog, DataBlockMetadata, Direction, datetime]] = []
+        # Inputs of runs whose outputs are committed before their inputs are
+        # logged (see `log_lineage_input`)
+        self.lineage_inputs: List[Tuple[PipeLog, DataBlockMetadata]] = []
+
+    def log(self, pipe_log: PipeLog, block: DataBlockMetadata, direction: Direction):
+        self.logs.append((pipe_log, block, direction, utcnow()))
+
+    def log_lineage_input(self, pipe_log: PipeLog, block: DataBlockMetadata):
+        """
+        An input of the run, for the lineage of its outputs logged with it,
+        without logging it as processed (yet).
+        """
+        self.lineage_inputs.append((pipe_log, block))
+
+    def flush(self):
+        if not self.logs:
+            return
+        logs, self.logs = self.logs, []
+        lineage_inputs, self.lineage_inputs = self.lineage_inputs, []
+        # Pipe logs and blocks (and aliases, state) in one unit of work, for their ids
+        self.sess.flush()
+        self.sess.bulk_insert_mappings(
+            DataBlockLog,
+            [
+                dict(
+                    pipe_log_id=pl.id,
+                    data_block_id=block.id,
+                    direction=direction,
+                    processed_at=processed_at,
+                )
+                for pl, block, direction, processed_at in logs
+            ],
+        )
+        conn = self.sess.connection()
+        index_data_block_logs(
+            conn,
+            set((pl.node_key, block.id, direction) for pl, block, direction, _ in logs),
+        )
+        update_block_lineage(
+            conn,
+            [(pl.id, block.id, Direction.INPUT) for pl, block in lineage_inputs]
+            + [(pl.id, block.id, direction) for pl, block, direction, _ in logs],
+        )
+
+    def clear(self):
+        self.logs = []
+        self.lineage_inputs = []
+
+
+def get_metadata_writer(sess: Session) -> MetadataWriter:
+    writer = sess.info.get(METADATA_WRITER_SESSION_KEY)
+    if writer is None:
+        writer = MetadataWriter(sess)
+        sess.info[METADATA_WRITER_SESSION_KEY] = writer
+    return writer
+
+
+def flush_metadata_writer(sess: Session):
+    """
+    `before_commit` session listener, writes the session's buffered metadata
+    when its outermost transaction commits (`before_commit` also fires when a
+    savepoint is released, and rows written in one are lost if it rolls back).
+    """
+    if sess.transaction is not None and sess.transaction.nested:
+        return
+    writer = sess.info.get(METADATA_WRITER_SESSION_KEY)
+    if writer is not None:
+        writer.flush()
+
+
+def clear_metadata_writer(sess: Session, previous_transaction: SessionTransaction):
+    """
+    `after_soft_rollback` session listener, drops the session's buffered
+    metadata when its outermost transaction rolls back (a rolled back
+    savepoint does not discard what was logged outside of it).
+    """
+    if previous_transaction.parent is not None:
+        return
+    writer = sess.info.get(METADATA_WRITER_SESSION_KEY)
+    if writer is not None:
+        writer.clear()
@@ -3,7 +3,7 @@ from __future__ import annotations
 import enum
 import traceback
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Union
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from loguru import logger
 from snapflow.core.data_block import DataBlock, DataBlockMetadata
@@ -16,10 +16,12 @@ from snapflow.core.pipe_interface import (
     PipeInterface,
 )
 from snapflow.utils.common import as_identifier
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
 from sqlalchemy.orm import Session, relationship
 from sqlalchemy.orm.relationships import RelationshipProperty
 from sqlalchemy.sql.functions import func
-from sqlalchemy.sql.schema import Column, ForeignKey
+from sqlalchemy.sql.schema import Column, ForeignKey, Index
 from sqlalchemy.sql.sqltypes import JSON, DateTime, Enum, Integer, String
 
 if TYPE_CHECKING:
@@ -30,6 +32,13 @@ if TYPE_CHECKING:
 NodeLike = Union[str, "Node", "DeclaredNode"]
 NodeBase = Union["Node", "DeclaredNode"]
 
+# When a node's output is copied to the target storage: right away, at the end of
+# the run (or earlier if a consumer needs it stored), or only if a consumer needs it
+MATERIALIZE_EAGER = "eager"
+MATERIALIZE_LAZY = "lazy"
+MATERIALIZE_NEVER = "never"
+MATERIALIZATION_POLICIES = (MATERIALIZE_EAGER, MATERIALIZE_LAZY, MATERIALIZE_NEVER)
+
 
 def ensure_stream(stream_like: StreamLike) -> StreamBuilder:
     from snapflow.core.streams import StreamBuilder, StreamLike
@@ -52,6 +61,8 @@ class DeclaredNode:
     graph: Optional[DeclaredGraph] = None
     output_alias: Optional[str] = None
     schema_translation: Optional[Dict[str, Union[Dict[str, str], str]]] = None
+    batch_size: Optional[int] = None
+    materialize: str = MATERIALIZE_EAGER
 
     def __post_init__(self):
         from snapflow.core.graph import DEFAULT_GRAPH
@@ -103,6 +114,8 @@ def node(
     graph: Optional[DeclaredGraph] = None,
     output_alias: Optional[str] = None,
     schema_translation: Optional[Dict[str, Union[Dict[str, str], str]]] = None,
+    batch_size: Optional[int] = None,
+    materialize: str = MATERIALIZE_EAGER,
 ) -> DeclaredNode:
     if key is None:
         key = make_pipe_name(pipe)
@@ -114,6 +127,8 @@ def node(
         graph=graph,
         output_alias=output_alias,
         schema_translation=schema_translation,
+        batch_size=batch_size,
+        materialize=materialize,
     )
 
 
@@ -122,6 +137,10 @@ def instantiate_node(
     graph: Graph,
     declared_node: DeclaredNode,
 ):
+    if declared_node.materialize not in MATERIALIZATION_POLICIES:
+        raise ValueError(
+            f"Unknown materialize option `{declared_node.materialize}` for node {declared_node.key}, expected one of {MATERIALIZATION_POLICIES}"
+        )
     if isinstance(declared_node.pipe, str):
         pipe = env.get_pipe(declared_node.pipe)
     else:
@@ -147,6 +166,8 @@ def instantiate_node(
         declared_inputs=declared_inputs,
         declared_schema_translation=schema_translation,
         output_alias=declared_node.output_alias,
+        batch_size=declared_node.batch_size,
+        materialize=declared_node.materialize,
     )
     return n
 
@@ -168,6 +189,8 @@ class Node:
     declared_inputs: Dict[str, DeclaredStreamInput]
     output_alias: Optional[str] = None
     declared_schema_translation: Optional[Dict[str, Dict[str, str]]] = None
+    batch_size: Optional[int] = None
+    materialize: str = MATERIALIZE_EAGER
 
     def __repr__(self):
         return f"<{self.__class__.__name__}(key={self.key}, pipe={self.pipe.key})>"
@@ -193,6 +216,9 @@ class Node:
     def get_interface(self) -> PipeInterface:
         return self.interface
 
+    def get_batch_size(self) -> int:
+        return self.batch_size or self.pipe.batch_size or 1
+
     def get_schema_translation_for_input(
         self, input_name: str
     ) -> Optional[Dict[str, str]]:
@@ -239,6 +265,13 @@ def get_state(sess: Session, node_key: str) -> Optional[Dict]:
 
 
 class PipeLog(BaseModel):
+    __table_args__ = (
+        Index(
+            f"ix_{SNAPFLOW_METADATA_TABLE_PREFIX}pipe_log_node_started",
+            "node_key",
+            "started_at",
+        ),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     graph_id = Column(
         String(128),
@@ -255,6 +288,7 @@ class PipeLog(BaseModel):
     started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
     error = Column(JSON, nullable=True)
+    timings = Column(JSON, nullable=True)
     data_block_logs: RelationshipProperty = relationship(
         "DataBlockLog", backref="pipe_log"
     )
@@ -314,6 +348,19 @@ class Direction(enum.Enum):
 
 
 class DataBlockLog(BaseModel):
+    __table_args__ = (
+        # Node's logs (via PipeLog), eg `Node.latest_output`
+        Index(
+            f"ix_{SNAPFLOW_METADATA_TABLE_PREFIX}dbl_pipe_log_direction",
+            "pipe_log_id",
+            "direction",
+        ),
+        Index(
+            f"ix_{SNAPFLOW_METADATA_TABLE_PREFIX}dbl_block_direction",
+            "data_block_id",
+            "direction",
+        ),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     pipe_log_id = Column(Integer, ForeignKey(PipeLog.id), nullable=False)
     data_block_id = Column(
@@ -346,3 +393,95 @@ class DataBlockLog(BaseModel):
             s += f"{dbl.direction.value:9}{str(dbl.data_block.updated_at):22}"
             s += f"{dbl.data_block.nominal_schema_key:20}{dbl.data_block.realized_schema_key:20}\n"
         return s
+
+
+class NodeBlockIndex(BaseModel):
+    """
+    Distinct (node, block, direction) entries of the DataBlockLog, maintained on
+    flush (see `index_new_data_block_logs`). Stream binding checks a block's
+    processed / produced status here with a primary key lookup, rather than
+    scanning and de-duplicating a node's entire log history.
+    """
+
+    __table_args__ = (
+        # Lookups by block (primary key leads with node_key)
+        Index(
+            f"ix_{SNAPFLOW_METADATA_TABLE_PREFIX}node_block_index_block",
+            "data_block_id",
+        ),
+    )
+
+    node_key = Column(String(128), primary_key=True)
+    data_block_id = Column(
+        String(128),
+        ForeignKey(f"{SNAPFLOW_METADATA_TABLE_PREFIX}data_block_metadata.id"),
+        primary_key=True,
+    )
+    direction = Column(Enum(Direction, native_enum=False), primary_key=True)
+
+    def __repr__(self):
+        return self._repr(
+            node_key=self.node_key,
+            data_block_id=self.data_block_id,
+            direction=self.direction,
+        )
+
+
+def index_new_data_block_logs(sess: Session, flush_context: Any):
+    """
+    `after_flush` session listener, adds index entries for DataBlockLogs inserted
+    in the flush.
+    """
+    keys = set()
+    for obj in sess.new:
+        # (Objects left out of a partial flush have no id yet)
+        if isinstance(obj, DataBlockLog) and obj.id is not None:
+            keys.add((obj.pipe_log.node_key, obj.data_block_id, obj.direction))
+    index_data_block_logs(sess.connection(), keys)
+
+
+def index_data_block_logs(conn: Connection, keys: Set[Tuple[str, str, Direction]]):
+    """
+    Adds index entries for the given (node key, block id, direction) keys, if
+    not already indexed.
+    """
+    if not keys:
+        return
+    table = NodeBlockIndex.__table__
+    existing = conn.execute(
+        select([table.c.node_key, table.c.data_block_id, table.c.direction]).where(
+            table.c.data_block_id.in_(set(k[1] for k in keys))
+        )
+    )
+    new_keys = keys - set(tuple(r) for r in existing)
+    if new_keys:
+        conn.execute(
+            table.insert(),
+            [
+                dict(node_key=n, data_block_id=b, direction=d)
+                for n, b, d in sorted(new_keys, key=str)
+            ],
+        )
+
+
+def ensure_node_block_index(conn: Connection):
+    """
+    Builds the index from the existing DataBlockLog, if it has never been built
+    (eg metadata created before the index existed).
+    """
+    table = NodeBlockIndex.__table__
+    if conn.execute(select([table.c.node_key]).limit(1)).first() is not None:
+        return
+    log = DataBlockLog.__table__
+    if conn.execute(select([log.c.id]).limit(1)).first() is None:
+        return
+    logger.info("Building node block index from DataBlockLog")
+    pipe_log = PipeLog.__table__
+    conn.execute(
+        table.insert().from_select(
+            ["node_key", "data_block_id", "direction"],
+            select([pipe_log.c.node_key, log.c.data_block_id, log.c.direction])
+            .select_from(log.join(pipe_log))
+            .distinct(),
+        )
+    )
@@ -71,6 +71,13 @@ class Pipe:
     state_class: Optional[Type] = None
     declared_inputs: Optional[Dict[str, str]] = None
     declared_output: Optional[str] = None
+    # Max input blocks to process per metadata transaction
+    batch_size: Optional[int] = None
+    # Safe to re-run (no side effects outside its metadata transaction)
+    idempotent: bool = False
+    _interface: Optional[PipeInterface] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     # TODO: runtime engine eg "mysql>=8.0", "python==3.7.4"  ???
     # TODO: runtime dependencies
@@ -88,7 +95,15 @@ class Pipe:
         return self.pipe_callable(*args, **kwargs)
 
     def get_interface(self) -> PipeInterface:
-        """"""
+        """
+        Computed once (it inspects the callable's signature, or parses its
+        sql) and cached, pipes being immutable.
+        """
+        if self._interface is None:
+            object.__setattr__(self, "_interface", self._build_interface())
+        return self._interface
+
+    def _build_interface(self) -> PipeInterface:
         found_interface = self._get_pipe_interface()
         assert found_interface is not None
         declared_interface = self._get_declared_interface()
@@ -183,6 +198,8 @@ def pipe(
     state_class: Optional[Type] = None,
     inputs: Optional[Dict[str, str]] = None,
     output: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    idempotent: bool = False,
 ) -> Union[Callable, Pipe]:
     if isinstance(pipe_or_name, str) or pipe_or_name is None:
         return partial(
@@ -194,6 +211,8 @@ def pipe(
             state_class=state_class,
             inputs=inputs,
             output=output,
+            batch_size=batch_size,
+            idempotent=idempotent,
         )
     return pipe_factory(
         pipe_or_name,
@@ -204,6 +223,8 @@ def pipe(
         state_class=state_class,
         inputs=inputs,
         output=output,
+        batch_size=batch_size,
+        idempotent=idempotent,
     )
 
 
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional
+
+
+@dataclass
+class PhaseTiming:
+    seconds: float = 0.0
+    calls: int = 0
+    records: Optional[int] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        d: Dict[str, Any] = dict(seconds=round(self.seconds, 6), calls=self.calls)
+        if self.records is not None:
+            d["records"] = self.records
+            if self.seconds > 0:
+                d["records_per_second"] = round(self.records / self.seconds, 1)
+        return d
+
+
+@dataclass
+class Span:
+    phase: str
+    records: Optional[int] = None
+
+
+@dataclass
+class PhaseTimings:
+    """
+    Wall-clock time (and records handled, where known) per execution phase of
+    a single pipe run. Phases may nest (eg `convert` inside `handle_output`), so
+    they are not expected to sum to the total.
+    """
+
+    phases: Dict[str, PhaseTiming] = field(default_factory=dict)
+
+    def add(self, phase: str, seconds: float, records: Optional[int] = None):
+        timing = self.phases.setdefault(phase, PhaseTiming())
+        timing.seconds += seconds
+        timing.calls += 1
+        if records is not None:
+            timing.records = (timing.records or 0) + records
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {phase: t.as_dict() for phase, t in self.phases.items()}
+
+
+_current_timings: ContextVar[Optional[PhaseTimings]] = ContextVar(
+    "snapflow_timings", default=None
+)
+
+
+@contextmanager
+def collect_timings() -> Iterator[PhaseTimings]:
+    """
+    Collects all `timed` spans entered (in this thread / context) until exit.
+    """
+    timings = PhaseTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextmanager
+def timed(phase: str, records: Optional[int] = None) -> Iterator[Span]:
+    """
+    Times the enclosed block as `phase`, if timings are being collected. Set
+    `records` on the yielded span if the record count is only known inside.
+    """
+    span = Span(phase, records)
+    timings = _current_timings.get()
+    if timings is None:
+        yield span
+        return
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        timings.add(phase, time.perf_counter() - start, span.records)
@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from queue import Empty, Full, Queue
+from threading import Event, Lock
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set
+
+from loguru import logger
+from snapflow.core.data_block import DataBlockMetadata
+from snapflow.core.node import Node
+from sqlalchemy import inspect
+
+if TYPE_CHECKING:
+    from snapflow.core.execution import ExecutionManager
+
+
+EXECUTORS = ("thread", "process")
+DEFAULT_PIPELINE_QUEUE_SIZE = 8
+
+
+class BlockChannel:
+    """
+    Bounded queue of new-output notifications (data block ids) from upstream
+    nodes to one downstream node. Once the downstream node is running
+    (`open`), producers block while the queue is full, so it bounds how far
+    ahead its upstreams can get. Until then producers never block: blocks are
+    logged in the metadata, so a node that starts late still finds them
+    unprocessed, and a waiting producer could otherwise hold the worker slot
+    its consumer needs.
+    """
+
+    def __init__(self, n_producers: int, maxsize: int = DEFAULT_PIPELINE_QUEUE_SIZE):
+        self.queue: Queue = Queue(maxsize=maxsize)
+        self.n_producers = n_producers
+        self.opened = Event()
+        self.closed = Event()
+        self._lock = Lock()
+        self._n_done = 0
+
+    def open(self):
+        self.opened.set()
+
+    def close(self):
+        # Consumer is gone, unblock any producers
+        self.closed.set()
+
+    def put(self, block_id: str):
+        while self.opened.is_set() and not self.closed.is_set():
+            try:
+                self.queue.put(block_id, timeout=0.1)
+                return
+            except Full:
+                continue
+        self._put_nowait(block_id)
+
+    def producer_done(self):
+        with self._lock:
+            self._n_done += 1
+        # Just a wake up, the count is what matters
+        self._put_nowait(None)
+
+    def _put_nowait(self, item: Optional[str]):
+        try:
+            self.queue.put_nowait(item)
+        except Full:
+            # Consumer has pending items to wake it up already
+            pass
+
+    def producers_done(self) -> bool:
+        with self._lock:
+            return self._n_done >= self.n_producers
+
+    def wait_for_items(self) -> List[str]:
+        """
+        Blocks for at least one item (or a finished upstream), then drains the
+        queue. Returns the new block ids.
+        """
+        items = [self.queue.get()]
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return [i for i in items if i is not None]
+
+
+class GraphScheduler:
+    """
+    Runs a set of nodes respecting their graph dependencies: a node is submitted
+    as soon as all of its upstream nodes (within the set) have completed, on a
+    pool of up to `max_workers` threads (`executor="thread"`) or processes
+    (`executor="process"`). Each node run gets its own `Worker` and metadata
+    session(s). With `RunContext.fuse_python_chains` / `fuse_sql_chains`, linear
+    chains of python or sql nodes are scheduled as one unit, see
+    `ExecutionManager.execute_chain`.
+    """
+
+    def __init__(
+        self,
+        execution_manager: ExecutionManager,
+        max_workers: int = 1,
+        executor: str = "thread",
+        pipelined: bool = False,
+        pipeline_queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE,
+    ):
+        if executor not in EXECUTORS:
+            raise ValueError(
+                f"Unknown executor `{executor}`, expected one of {EXECUTORS}"
+            )
+        if pipelined and executor != "thread":
+            raise ValueError("Pipelined execution is only supported with threads")
+        self.execution_manager = execution_manager
+        self.max_workers = max_workers
+        self.executor = executor
+        self.pipelined = pipelined
+        self.pipeline_queue_size = pipeline_queue_size
+
+    def get_dependencies(self, nodes: List[Node]) -> Dict[str, Set[str]]:
+        plan = self.execution_manager.ctx.graph.get_execution_plan()
+        keys = set(n.key for n in nodes)
+        return {
+            n.key: set(p for p in plan.predecessors(n.key) if p in keys) for n in nodes
+        }
+
+    def get_units(
+        self, nodes: List[Node], fuse_python: bool = False, fuse_sql: bool = False
+    ) -> List[List[Node]]:
+        """
+        Groups nodes into units of execution (in execution order). Fusable
+        python and/or sql chains are executed as one unit, every other node is
+        its own unit.
+        """
+        graph = self.execution_manager.ctx.graph
+        keys = [n.key for n in nodes]
+        chains: List[List[str]] = []
+        if fuse_python:
+            chains.extend(graph.get_fusable_python_chains(keys))
+        if fuse_sql:
+            chains.extend(graph.get_fusable_sql_chains(keys))
+        chain_by_head = {c[0]: c for c in chains}
+        chained = set(k for c in chains for k in c)
+        units = []
+        for n in nodes:
+            if n.key in chain_by_head:
+                units.append([graph.get_node(k) for k in chain_by_head[n.key]])
+            elif n.key not in chained:
+                units.append([n])
+        return units
+
+    def get_unit_dependencies(self, units: List[List[Node]]) -> Dict[str, Set[str]]:
+        # Units are keyed by their head node
+        unit_keys = {n.key: u[0].key for u in units for n in u}
+        node_deps = self.get_dependencies([n for u in units for n in u])
+        unit_deps: Dict[str, Set[str]] = {}
+        for u in units:
+            unit_deps[u[0].key] = set(
+                unit_keys[d] for n in u for d in node_deps[n.key]
+            ) - {u[0].key}
+        return unit_deps
+
+    def run(
+        self, nodes: List[Node], to_exhaustion: bool = True
+    ) -> Dict[str, Optional[DataBlockMetadata]]:
+        """
+        Executes `nodes` (expected in a valid execution order) and returns the last
+        output block of each node, keyed by node key.
+        """
+        env = self.execution_manager.env
+        max_workers = self.max_workers
+        if max_workers > 1 and not env.supports_concurrent_metadata_sessions():
+            logger.warning(
+                f"Metadata storage {env.metadata_storage.url} does not support concurrent "
+                "sessions, running nodes serially"
+            )
+            max_workers = 1
+        ctx = self.execution_manager.ctx
+        fuse_python, fuse_sql = ctx.fuse_python_chains, ctx.fuse_sql_chains
+        if (
+            (fuse_python or fuse_sql)
+            and (self.pipelined or self.executor == "process")
+            and max_workers > 1
+        ):
+            logger.warning(
+                "Chain fusion is not supported with pipelined or process execution, ignoring"
+            )
+            fuse_python = fuse_sql = False
+        units = self.get_units(nodes, fuse_python=fuse_python, fuse_sql=fuse_sql)
+        if max_workers <= 1 or len(units) <= 1:
+            return self.run_serial(units, to_exhaustion=to_exhaustion)
+        if self.pipelined:
+            return self.run_pipelined(nodes, max_workers, to_exhaustion=to_exhaustion)
+        return self.run_parallel(units, max_workers, to_exhaustion=to_exhaustion)
+
+    def run_serial(
+        self, units: List[List[Node]], to_exhaustion: bool = True
+    ) -> Dict[str, Optional[DataBlockMetadata]]:
+        outputs: Dict[str, Optional[DataBlockMetadata]] = {}
+        for unit in units:
+            outputs.update(
+                self.execution_manager.execute_chain(unit, to_exhaustion=to_exhaustion)
+            )
+        return outputs
+
+    def run_parallel(
+        self, units: List[List[Node]], max_workers: int, to_exhaustion: bool = True
+    ) -> Dict[str, Optional[DataBlockMetadata]]:
+        # Graph metadata is shared by all node runs, so insert it once up front
+        # rather than have concurrent runs race to create it
+        self.execution_manager.ctx.ensure_graph_metadata()
+        if self.executor == "process":
+            from snapflow.core.execution import ProcessPoolWorker
+
+            with ProcessPoolWorker(
+                self.execution_manager.ctx, max_workers=max_workers
+            ) as pool_worker:
+                outputs = self._run_pool(
+                    units,
+                    lambda u: pool_worker.submit(u[0], to_exhaustion=to_exhaustion),
+                )
+            return {k: pool_worker.get_output(v) for k, v in outputs.items()}
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="snapflow-worker"
+        ) as pool:
+            unit_outputs = self._run_pool(
+                units,
+                lambda u: pool.submit(
+                    self.execution_manager.execute_chain,
+                    u,
+                    to_exhaustion=to_exhaustion,
+                ),
+            )
+        outputs: Dict[str, Optional[DataBlockMetadata]] = {}
+        for o in unit_outputs.values():
+            outputs.update(o)
+        return outputs
+
+    def _run_pool(
+        self, units: List[List[Node]], submit: Callable[[List[Node]], Future]
+    ) -> Dict[str, Any]:
+        remaining_deps = self.get_unit_dependencies(units)
+        units_by_key = {u[0].key: u for u in units}
+        ready = [u[0].key for u in units if not remaining_deps[u[0].key]]
+        running: Dict[Future, str] = {}
+        outputs: Dict[str, Any] = {}
+        error: Optional[BaseException] = None
+        while ready or running:
+            while ready and error is None:
+                key = ready.pop(0)
+                running[submit(units_by_key[key])] = key
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                key = running.pop(fut)
+                exc = fut.exception()
+                if exc is not None:
+                    # Stop scheduling new units, but let running ones finish
+                    if error is None:
+                        error = exc
+                    continue
+                outputs[key] = fut.result()
+                for downstream_key, deps in remaining_deps.items():
+                    if key in deps:
+                        deps.remove(key)
+                        if not deps:
+                            ready.append(downstream_key)
+        if error is not None:
+            raise error
+        return outputs
+
+    def run_pipelined(
+        self, nodes: List[Node], max_workers: int, to_exhaustion: bool = True
+    ) -> Dict[str, Optional[DataBlockMetadata]]:
+        """
+        Starts nodes in execution order on up to `max_workers` threads, without
+        waiting for their upstreams to finish. Nodes with upstreams in the run
+        wait on a `BlockChannel` and process new upstream blocks as soon as
+        they are committed (each block yielded by a generator pipe is committed
+        on its own). Without `to_exhaustion`, each node runs once, on its first
+        new upstream blocks (or once its upstreams are done).
+        """
+        self.execution_manager.ctx.ensure_graph_metadata()
+        deps = self.get_dependencies(nodes)
+        channels = {
+            n.key: BlockChannel(len(deps[n.key]), maxsize=self.pipeline_queue_size)
+            for n in nodes
+            if deps[n.key]
+        }
+        downstreams: Dict[str, List[BlockChannel]] = {n.key: [] for n in nodes}
+        for key, upstream_keys in deps.items():
+            for upstream_key in upstream_keys:
+                downstreams[upstream_key].append(channels[key])
+        # Upstreams are submitted (so started) before their downstreams, so a
+        # node waiting on its channel never holds a slot its upstreams need
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="snapflow-pipeline"
+        ) as pool:
+            futures = {
+                pool.submit(
+                    self._run_pipelined_node,
+                    n,
+                    channels.get(n.key),
+                    downstreams[n.key],
+                    to_exhaustion,
+                ): n.key
+                for n in nodes
+            }
+            wait(list(futures))
+        outputs: Dict[str, Optional[DataBlockMetadata]] = {}
+        for fut, key in futures.items():
+            # Raise first error in execution order
+            outputs[key] = fut.result()
+        return outputs
+
+    def _run_pipelined_node(
+        self,
+        node: Node,
+        channel: Optional[BlockChannel],
+        downstreams: List[BlockChannel],
+        to_exhaustion: bool = True,
+    ) -> Optional[DataBlockMetadata]:
+        def publish(block: DataBlockMetadata):
+            block_id = inspect(block).identity[0]
+            for c in downstreams:
+                c.put(block_id)
+
+        def execute() -> Optional[DataBlockMetadata]:
+            return self.execution_manager.execute_to_output(
+                node, to_exhaustion=to_exhaustion, on_output=publish
+            )
+
+        last_output = None
+        try:
+            if channel is not None:
+                channel.open()
+                while not channel.producers_done():
+                    block_ids = channel.wait_for_items()
+                    if block_ids:
+                        logger.debug(
+                            f"{node.key} received new upstream blocks {block_ids}"
+                        )
+                        last_output = execute() or last_output
+                        if not to_exhaustion:
+                            return last_output
+            # All upstreams done (or none), final run
+            last_output = execute() or last_output
+        finally:
+            if channel is not None:
+                channel.close()
+            for c in downstreams:
+                c.producer_done()
+        return last_output
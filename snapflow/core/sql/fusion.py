@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from loguru import logger
+from snapflow.core.data_block import DataBlockMetadata, create_data_block_from_sql
+from snapflow.core.execution import (
+    CompiledPipe,
+    Executable,
+    ExecutionResult,
+    PipeContext,
+)
+from snapflow.core.node import Node
+from snapflow.core.pipe import Pipe
+from snapflow.core.pipe_interface import BoundInterface, NodeInterfaceManager
+from snapflow.core.sql.pipe import SqlPipeWrapper, extract_interface
+from snapflow.schema.base import Schema
+from sqlalchemy.orm import Session
+
+if TYPE_CHECKING:
+    from snapflow.core.environment import Environment
+    from snapflow.core.execution import Worker
+
+
+FUSED_CTE_PREFIX = "_fused_"
+
+
+def is_sql_pipe(pipe: Pipe) -> bool:
+    return isinstance(pipe.pipe_callable, SqlPipeWrapper)
+
+
+def has_jinja(sql: str) -> bool:
+    return "{{" in sql or "{%" in sql
+
+
+def can_fuse_sql_nodes(upstream: Node, downstream: Node) -> bool:
+    if not (is_sql_pipe(upstream.pipe) and is_sql_pipe(downstream.pipe)):
+        return False
+    # Only the head of a chain is compiled with a run context, downstream sql is inlined as is
+    if has_jinja(downstream.pipe.pipe_callable.sql):
+        return False
+    return len(downstream.get_interface().inputs) == 1
+
+
+def clean_sql(sql: str) -> str:
+    return sql.strip().rstrip(";").strip()
+
+
+def compile_fused_sql(head_sql: str, downstream: List[Tuple[str, str]]) -> List[str]:
+    """
+    Compiles a chain of sql statements into one, each step selecting from the
+    previous step as a CTE. `downstream` is the (input table name, sql) of each
+    step after the head. Returns the standalone statement for every step of the
+    chain, the last one being the fused statement for the whole chain.
+    """
+    ctes: List[str] = []
+    body = clean_sql(head_sql)
+    stmts = [body]
+    for i, (input_name, sql) in enumerate(downstream):
+        cte_name = f"{FUSED_CTE_PREFIX}{i}"
+        ctes.append(f"{cte_name} as (\n{body}\n)")
+        body = clean_sql(extract_interface(sql, {input_name: cte_name}).cleaned_sql)
+        stmts.append("with " + ",\n".join(ctes) + "\n" + body)
+    return stmts
+
+
+def get_nominal_output_schema(
+    env: Environment, sess: Session, node: Node
+) -> Optional[Schema]:
+    output = node.get_interface().output
+    if output is None or output.is_generic:
+        return None
+    return output.schema(env, sess)
+
+
+def run_fused_sql_chain(
+    worker: Worker, nodes: List[Node], expose_views: bool = False
+) -> Dict[str, ExecutionResult]:
+    """
+    Runs one invocation of a linear chain of SQL nodes (see
+    `Graph.get_fusable_sql_chains`) as a single statement, binding the head's
+    inputs as usual. Only the tail's output is materialized as a table;
+    intermediate outputs are created as views if `expose_views`, otherwise they
+    never exist. Every node still gets its PipeLog (in one transaction), so
+    node state and processed inputs are tracked as if the nodes ran separately.
+    """
+    ctx = worker.ctx
+    assert ctx.current_runtime is not None, "Runtime not set"
+    db_api = ctx.current_runtime.get_api()
+    head = nodes[0]
+    results: Dict[str, ExecutionResult] = {}
+    stmts: List[str] = []
+    prev_block: Optional[DataBlockMetadata] = None
+    head_input_blocks: List[DataBlockMetadata] = []
+    with ctx.env.session_scope() as sess:
+        bound_interface = NodeInterfaceManager(ctx, sess, head).get_bound_interface()
+        for i, node in enumerate(nodes):
+            is_tail = i == len(nodes) - 1
+            executable = Executable(
+                node_key=node.key,
+                compiled_pipe=CompiledPipe(key=node.key, pipe=node.pipe),
+                # Downstream inputs are inlined, so nothing is bound
+                bound_interface=(
+                    bound_interface
+                    if node is head
+                    else BoundInterface(inputs=[], output=node.get_interface().output)
+                ),
+                configuration=node.config or {},
+            )
+            with ctx.start_pipe_log(node, sess) as execution_session:
+                if node is head:
+                    pipe_ctx = PipeContext(
+                        ctx,
+                        worker=worker,
+                        execution_session=execution_session,
+                        executable=executable,
+                        inputs=bound_interface.inputs,
+                        pipe_log=execution_session.pipe_log,
+                    )
+                    head_sql = head.pipe.pipe_callable.get_compiled_sql(
+                        pipe_ctx, bound_interface.inputs_as_kwargs()
+                    )
+                    stmts = compile_fused_sql(
+                        head_sql,
+                        [
+                            (n.get_interface().inputs[0].name, n.pipe.pipe_callable.sql)
+                            for n in nodes[1:]
+                        ],
+                    )
+                    logger.debug(f"Fused sql for chain {[n.key for n in nodes]}:")
+                    logger.debug(stmts[-1])
+                    nominal_schema = bound_interface.resolve_nominal_output_schema(
+                        ctx.env, sess
+                    )
+                else:
+                    nominal_schema = get_nominal_output_schema(ctx.env, sess, node)
+                sdb = None
+                if is_tail or expose_views:
+                    _, sdb = create_data_block_from_sql(
+                        ctx.env,
+                        stmts[i],
+                        sess=sess,
+                        db_api=db_api,
+                        nominal_schema=nominal_schema,
+                        created_by_node_key=node.key,
+                        as_view=not is_tail,
+                    )
+                if prev_block is not None:
+                    execution_session.log_input(prev_block)
+                elif is_tail and node is not head:
+                    # Intermediates never existed, so the tail's output descends
+                    # directly from the head's inputs
+                    for block in head_input_blocks:
+                        execution_session.log_lineage_input(block)
+                result = worker.process_execution_result(
+                    executable, execution_session, sdb
+                )
+            if node is head:
+                head_input_blocks = [
+                    b for bs in worker.get_input_blocks(executable).values() for b in bs
+                ]
+            results[node.key] = result
+            prev_block = result.output_block
+    return results
@@ -9,14 +9,16 @@ from snapflow.core.data_block import (
     get_datablock_id,
 )
 from snapflow.core.environment import Environment
+from snapflow.core.profiling import timed
 from snapflow.storage.data_copy.base import (
+    DEFAULT_EXPECTED_RECORD_COUNT,
     Conversion,
     ConversionPath,
     StorageFormat,
     get_datacopy_lookup,
 )
 from snapflow.storage.data_formats import DataFormat
-from snapflow.storage.storage import LocalPythonStorageEngine, Storage
+from snapflow.storage.storage import LocalPythonStorageEngine, PythonStorageApi, Storage
 from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, event, or_
 from sqlalchemy.orm.session import Session
 
@@ -62,14 +64,31 @@ def get_copy_path_for_sdb(
         # Already exists, do nothing
         return ConversionPath()
     conversion = Conversion(source_format, target_format)
+    record_count = sdb.data_block.record_count
     conversion_path = get_datacopy_lookup(
         available_storage_engines=set(s.storage_engine for s in storages),
+        expected_record_count=(
+            record_count if record_count is not None else DEFAULT_EXPECTED_RECORD_COUNT
+        ),
+        expected_byte_size=estimate_byte_size(sdb),
     ).get_lowest_cost_path(
         conversion,
     )
     return conversion_path
 
 
+def estimate_byte_size(sdb: StoredDataBlockMetadata) -> Optional[int]:
+    """
+    Size of the block's records, where cheaply known (only for copies in python
+    storage, for now).
+    """
+    if not sdb.storage_url.startswith("python:"):
+        return None
+    api = sdb.storage.get_api()
+    assert isinstance(api, PythonStorageApi)
+    return api.byte_size(sdb.get_name())
+
+
 def convert_sdb(
     env: Environment,
     sess: Session,
@@ -102,14 +121,15 @@ def convert_sdb(
             storage_url=next_storage.url,
         )
         sess.add(next_sdb)
-        conversion_edge.copier.copy(
-            from_name=prev_sdb.get_name(),
-            to_name=next_sdb.get_name(),
-            conversion=conversion,
-            from_storage_api=prev_storage.get_api(),
-            to_storage_api=next_storage.get_api(),
-            schema=realized_schema,
-        )
+        with timed("convert", records=prev_sdb.data_block.record_count):
+            conversion_edge.copier.copy(
+                from_name=prev_sdb.get_name(),
+                to_name=next_sdb.get_name(),
+                conversion=conversion,
+                from_storage_api=prev_storage.get_api(),
+                to_storage_api=next_storage.get_api(),
+                schema=realized_schema,
+            )
         if (
             prev_sdb.data_format.is_python_format()
             and not prev_sdb.data_format.is_storable()
@@ -128,6 +148,16 @@ def convert_sdb(
     return next_sdb
 
 
+def is_available(sdb: StoredDataBlockMetadata) -> bool:
+    """
+    Whether `sdb`'s records can be read: false for copies in python storage
+    that were evicted from memory (or belong to another process).
+    """
+    if not sdb.storage_url.startswith("python:"):
+        return True
+    return sdb.storage.get_api().exists(sdb.get_name())
+
+
 def ensure_data_block_on_storage(
     env: Environment,
     sess: Session,
@@ -146,13 +176,15 @@ def ensure_data_block_on_storage(
         match = match.filter(StoredDataBlockMetadata.data_format == fmt)
     matched_sdb = match.first()
     if matched_sdb is not None:
-        return matched_sdb
+        if is_available(matched_sdb):
+            return matched_sdb
+        # Evicted from memory, copy it again
+        sess.delete(matched_sdb)
+        sess.flush()
 
     # logger.debug(f"{cnt} SDBs total")
     existing_sdbs = sdbs.filter(
         # DO NOT fetch memory SDBs that aren't of current runtime (since we can't get them!)
-        # TODO: clean up memory SDBs when the memory goes away? Doesn't make sense to persist them really
-        # Should be a separate in-memory lookup for memory SDBs, so they naturally expire?
         or_(
             ~StoredDataBlockMetadata.storage_url.startswith("python:"),
             StoredDataBlockMetadata.storage_url == storage.url,
@@ -173,7 +205,7 @@ def ensure_data_block_on_storage(
     eligible_conversion_paths = (
         []
     )  #: List[List[Tuple[ConversionCostLevel, Type[Converter]]]] = []
-    existing_sdbs = list(existing_sdbs)
+    existing_sdbs = [sdb for sdb in existing_sdbs if is_available(sdb)]
     for sdb in existing_sdbs:
         conversion_path = get_copy_path_for_sdb(
             sdb, target_storage_format, eligible_storages
@@ -26,6 +26,7 @@ from snapflow.core.node import (
     DeclaredNode,
     Direction,
     Node,
+    NodeBlockIndex,
     NodeLike,
     PipeLog,
 )
@@ -33,7 +34,7 @@ from snapflow.core.pipe_interface import get_schema_translation
 from snapflow.schema.base import Schema, SchemaLike, SchemaTranslation
 from snapflow.storage.storage import Storage
 from snapflow.utils.common import ensure_list
-from sqlalchemy import and_, not_
+from sqlalchemy import and_, exists, not_
 from sqlalchemy.orm import Query
 from sqlalchemy.orm.session import Session
 
@@ -86,7 +87,12 @@ class StreamBuilder:
         return s
 
     def _base_query(self) -> Query:
-        return Query(DataBlockMetadata).order_by(DataBlockMetadata.id)
+        # Excluding blocks removed by garbage collection
+        return (
+            Query(DataBlockMetadata)
+            .filter(~DataBlockMetadata.deleted)
+            .order_by(DataBlockMetadata.id)
+        )
 
     def get_query(self, ctx: RunContext, sess: Session) -> Query:
         q = self._base_query()
@@ -140,23 +146,16 @@ class StreamBuilder:
     ) -> Query:
         if not self.unprocessed_by:
             return query
+        clauses = [
+            NodeBlockIndex.node_key == self.unprocessed_by.key,
+            NodeBlockIndex.data_block_id == DataBlockMetadata.id,
+        ]
         if self.allow_cycle:
             # Only exclude blocks processed as INPUT
-            filter_clause = and_(
-                DataBlockLog.direction == Direction.INPUT,
-                PipeLog.node_key == self.unprocessed_by.key,
-            )
-        else:
-            # No block cycles allowed
-            # Exclude blocks processed as INPUT and blocks outputted
-            filter_clause = PipeLog.node_key == self.unprocessed_by.key
-        already_processed_drs = (
-            Query(DataBlockLog.data_block_id)
-            .join(PipeLog)
-            .filter(filter_clause)
-            .distinct()
-        )
-        return query.filter(not_(DataBlockMetadata.id.in_(already_processed_drs)))
+            clauses.append(NodeBlockIndex.direction == Direction.INPUT)
+        # Otherwise no block cycles allowed:
+        # Exclude blocks processed as INPUT and blocks outputted
+        return query.filter(not_(exists().where(and_(*clauses))))
 
     def get_upstream(self, g: Graph) -> List[Node]:
         nodes = ensure_list(self.nodes)
@@ -177,16 +176,17 @@ class StreamBuilder:
     ) -> Query:
         if not self.nodes:
             return query
-        eligible_input_drs = (
-            Query(DataBlockLog.data_block_id)
-            .join(PipeLog)
-            .filter(
-                DataBlockLog.direction == Direction.OUTPUT,
-                PipeLog.node_key.in_([c.key for c in self.get_upstream(ctx.graph)]),
+        return query.filter(
+            exists().where(
+                and_(
+                    NodeBlockIndex.node_key.in_(
+                        [c.key for c in self.get_upstream(ctx.graph)]
+                    ),
+                    NodeBlockIndex.data_block_id == DataBlockMetadata.id,
+                    NodeBlockIndex.direction == Direction.OUTPUT,
+                )
             )
-            .distinct()
         )
-        return query.filter(DataBlockMetadata.id.in_(eligible_input_drs))
 
     def get_schemas(self, env: Environment, sess: Session):
         dts = ensure_list(self.schemas)
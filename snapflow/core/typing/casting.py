@@ -6,7 +6,15 @@ from functools import total_ordering
 from typing import TYPE_CHECKING
 
 from loguru import logger
-from snapflow.schema.base import Field, Schema, create_quick_field, create_quick_schema
+from snapflow.core.metadata.listeners import get_pending_put, put_after_commit
+from snapflow.core.typing.inference import AUTO_SCHEMA_FINGERPRINT_LENGTH
+from snapflow.schema.base import (
+    Field,
+    Schema,
+    create_quick_field,
+    create_quick_schema,
+    fields_fingerprint,
+)
 from sqlalchemy.orm.session import Session
 
 if TYPE_CHECKING:
@@ -75,7 +83,10 @@ def update_matching_field_definitions(
     if not modified:
         return schema
     schema_dict = asdict(schema)
-    schema_dict["name"] = f"{schema.name}_with_{update_with_schema.name}"
+    # Named by fingerprint, as auto schemas are, so a changed definition of
+    # `update_with_schema` never reuses a stale generated schema
+    fingerprint = fields_fingerprint(fields)[:AUTO_SCHEMA_FINGERPRINT_LENGTH]
+    schema_dict["name"] = f"{schema.name}_{fingerprint}"
     schema_dict["fields"] = fields
     updated = Schema.from_dict(schema_dict)
     env.add_new_generated_schema(updated, sess)
@@ -88,7 +99,31 @@ def cast_to_realized_schema(
     inferred_schema: Schema,
     nominal_schema: Schema,
     cast_level: CastToSchemaLevel = CastToSchemaLevel.SOFT,
-):
+) -> Schema:
+    """
+    Memoized (per environment) by inferred and nominal schema key, see
+    `_cast_to_realized_schema`. The realized schema may be a new generated
+    schema, so it is only memoized once `sess` commits.
+    """
+    cache_key = (inferred_schema.key, nominal_schema.key, cast_level)
+    realized_schema = env.realized_schemas.get(cache_key) or get_pending_put(
+        sess, env.realized_schemas, cache_key
+    )
+    if realized_schema is None:
+        realized_schema = _cast_to_realized_schema(
+            env, sess, inferred_schema, nominal_schema, cast_level
+        )
+        put_after_commit(sess, env.realized_schemas, cache_key, realized_schema)
+    return realized_schema
+
+
+def _cast_to_realized_schema(
+    env: Environment,
+    sess: Session,
+    inferred_schema: Schema,
+    nominal_schema: Schema,
+    cast_level: CastToSchemaLevel = CastToSchemaLevel.SOFT,
+) -> Schema:
     if is_strict_schema_match(inferred_schema, nominal_schema):
         return nominal_schema
     if has_subset_fields(nominal_schema, inferred_schema):
@@ -17,6 +17,7 @@ from snapflow.schema.base import (
     Schema,
     create_quick_field,
     create_quick_schema,
+    fields_fingerprint,
 )
 from snapflow.storage.data_formats import Records
 from snapflow.utils.common import (
@@ -25,7 +26,6 @@ from snapflow.utils.common import (
     ensure_datetime,
     ensure_time,
     is_datetime_str,
-    rand_str,
     title_to_snake_case,
 )
 from snapflow.utils.data import is_nullish, read_json, records_as_dict_of_lists
@@ -98,8 +98,14 @@ def infer_schema_from_records(records: Records, **kwargs) -> Schema:
     return generate_auto_schema(fields, **kwargs)
 
 
+AUTO_SCHEMA_FINGERPRINT_LENGTH = 16
+
+
 def generate_auto_schema(fields, **kwargs) -> Schema:
-    auto_name = "AutoSchema_" + rand_str(8)
+    # Named by fingerprint, so identical inferred schemas share one key
+    auto_name = (
+        "AutoSchema_" + fields_fingerprint(fields)[:AUTO_SCHEMA_FINGERPRINT_LENGTH]
+    )
     args = dict(
         name=auto_name,
         module_name=DEFAULT_LOCAL_MODULE.name,
@@ -1,12 +1,18 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
+import json
+from dataclasses import asdict, dataclass, field
 from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
 
 import strictyaml
 from loguru import logger
 from snapflow.core.metadata.orm import BaseModel
-from snapflow.utils.common import StringEnum, ensure_bool, title_to_snake_case
+from snapflow.utils.common import (
+    StringEnum,
+    ensure_bool,
+    md5_hash,
+    title_to_snake_case,
+)
 from sqlalchemy import JSON, Column, String
 from sqlalchemy.orm.session import Session
 
@@ -95,6 +101,14 @@ class Implementation:
         )
 
 
+def fields_fingerprint(fields: List[Field]) -> str:
+    """
+    Hash of the field definitions (names, types and options, in order), so
+    structurally identical schemas can be recognized regardless of name.
+    """
+    return md5_hash(json.dumps([asdict(f) for f in fields], sort_keys=True))
+
+
 def schema_key_to_identifier(key: str) -> str:
     key = key.replace(".", "_")
     return title_to_snake_case(key)
@@ -149,6 +163,9 @@ class Schema:
     def field_names(self) -> List[str]:
         return [f.name for f in self.fields]
 
+    def fingerprint(self) -> str:
+        return fields_fingerprint(self.fields)
+
     @property
     def updated_at_field(self) -> Optional[Field]:
         if self.updated_at_field_name:
@@ -160,16 +177,24 @@ class Schema:
 
     @classmethod
     def from_dict(cls, d: Dict) -> Schema:
+        d = dict(d)
         fields = []
         for f in d["fields"]:
             if isinstance(f, dict):
-                f = build_field_from_dict(f)
+                f = build_field_from_dict(dict(f))
             elif isinstance(f, Field):
                 pass
             else:
                 raise ValueError(f)
             fields.append(f)
         d["fields"] = fields
+        d["relations"] = [
+            Relation(**r) if isinstance(r, dict) else r for r in d.get("relations", [])
+        ]
+        d["implementations"] = [
+            Implementation(**i) if isinstance(i, dict) else i
+            for i in d.get("implementations", [])
+        ]
         return Schema(**d)
 
     def get_translation_to(
@@ -294,8 +319,10 @@ def conform_field_type(ft: str) -> str:
     return ft
 
 
-def load_validator_from_dict(v: str) -> Validator:
+def load_validator_from_dict(v: Union[str, Dict]) -> Validator:
     # TODO
+    if isinstance(v, dict):
+        return Validator(**v)
     return Validator(v)
 
 
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import enum
+import math
 import random
 from collections import defaultdict
 from dataclasses import dataclass, field
@@ -42,6 +43,9 @@ from sqlalchemy.orm.session import Session
 
 CostFunction = Callable[[int], int]
 BUFFER_SIZE = 100
+# Assumed when a block's record count (or byte size) is not known
+DEFAULT_EXPECTED_RECORD_COUNT = 10000
+DEFAULT_RECORD_BYTE_SIZE = 100
 
 
 @dataclass(frozen=True)
@@ -54,8 +58,12 @@ class DataCopyCost:
         lambda n: n
     )  # Always the same? this is just dumb data copying
 
-    def total_cost(self, n: int) -> int:
-        return self.wire_cost(n) + self.time_cost(n) + self.memory_cost(n)
+    def total_cost(self, n: int, byte_size: Optional[int] = None) -> int:
+        wire_cost = self.wire_cost(n)
+        if byte_size is not None and n > 0:
+            # Wire costs assume records of the default size
+            wire_cost = int(wire_cost * byte_size / (n * DEFAULT_RECORD_BYTE_SIZE))
+        return wire_cost + self.time_cost(n) + self.memory_cost(n)
 
     def __add__(self, other: DataCopyCost) -> DataCopyCost:
         return DataCopyCost(
@@ -86,6 +94,51 @@ NetworkToMemoryCost = DataCopyCost(
 NetworkToBufferCost = DataCopyCost(
     wire_cost=(lambda n: n * 5), memory_cost=lambda n: BUFFER_SIZE
 )
+# Bulk load protocols (eg postgres COPY) skip most of the per-row statement overhead
+BulkLoadToMemoryCost = DataCopyCost(wire_cost=lambda n: n * 2, memory_cost=lambda n: n)
+BulkLoadToBufferCost = DataCopyCost(
+    wire_cost=lambda n: n * 2, memory_cost=lambda n: BUFFER_SIZE
+)
+
+
+@dataclass(frozen=True)
+class CopierCalibration:
+    """
+    Measured run time of a copier (see `calibration.calibrate_copiers`)
+    """
+
+    fixed_seconds: float = 0.0
+    per_record_seconds: float = 0.0
+    per_byte_seconds: float = 0.0
+
+    def seconds(self, n: int, byte_size: int) -> float:
+        return (
+            self.fixed_seconds
+            + self.per_record_seconds * n
+            + self.per_byte_seconds * byte_size
+        )
+
+
+# Calibration per copier key, used instead of its `DataCopyCost` when set
+_copier_calibrations: Dict[str, CopierCalibration] = {}
+# Scale of measured seconds to (uncalibrated) cost units, so calibrated and
+# uncalibrated copiers are comparable
+_calibrated_cost_per_second: float = 1.0
+_calibration_version = 0
+
+
+def set_copier_calibrations(
+    calibrations: Dict[str, CopierCalibration], cost_per_second: float
+):
+    global _calibrated_cost_per_second, _calibration_version
+    _copier_calibrations.clear()
+    _copier_calibrations.update(calibrations)
+    _calibrated_cost_per_second = cost_per_second
+    _calibration_version += 1
+
+
+def get_copier_calibration(key: str) -> Optional[CopierCalibration]:
+    return _copier_calibrations.get(key)
 
 
 @dataclass(frozen=True)
@@ -112,7 +165,8 @@ class ConversionEdge:
 @dataclass(frozen=True)
 class ConversionPath:
     conversions: List[ConversionEdge] = field(default_factory=list)
-    expected_record_count: int = 10000
+    expected_record_count: int = DEFAULT_EXPECTED_RECORD_COUNT
+    expected_byte_size: Optional[int] = None
 
     def add(self, edge: ConversionEdge):
         self.conversions.append(edge)
@@ -123,7 +177,7 @@ class ConversionPath:
     @property
     def total_cost(self) -> int:
         return sum(
-            c.copier.cost.total_cost(self.expected_record_count)
+            c.copier.get_cost(self.expected_record_count, self.expected_byte_size)
             for c in self.conversions
         )
 
@@ -167,6 +221,18 @@ class DataCopier:
 
     __call__ = copy
 
+    @property
+    def key(self) -> str:
+        return f"{self.copier_function.__module__}.{self.copier_function.__qualname__}"
+
+    def get_cost(self, n: int, byte_size: Optional[int] = None) -> int:
+        calibration = get_copier_calibration(self.key)
+        if calibration is None:
+            return self.cost.total_cost(n, byte_size)
+        if byte_size is None:
+            byte_size = n * DEFAULT_RECORD_BYTE_SIZE
+        return int(calibration.seconds(n, byte_size) * _calibrated_cost_per_second)
+
     def can_handle_from(self, from_storage_format: StorageFormat) -> bool:
         if self.from_storage_classes:
             if (
@@ -240,15 +306,18 @@ class CopyLookup:
         copiers: Iterable[DataCopier],
         available_storage_engines: Set[Type[StorageEngine]] = None,
         available_data_formats: Iterable[DataFormat] = None,
-        expected_record_count: int = 10000,
+        expected_record_count: int = DEFAULT_EXPECTED_RECORD_COUNT,
+        expected_byte_size: Optional[int] = None,
     ):
         self._lookup: Dict[Conversion, List[DataCopier]] = defaultdict(list)
         self._copiers: Iterable[DataCopier] = copiers
         self.available_data_formats = available_data_formats
         self.available_storage_engines = available_storage_engines
         self.available_storage_formats = self._get_all_available_formats()
-        self.expected_record_count = expected_record_count  # TODO: hmmmmm
-        self._graph = self._build_copy_graph(expected_record_count)
+        self.expected_record_count = expected_record_count
+        self.expected_byte_size = expected_byte_size
+        self._graph = self._build_copy_graph()
+        self._paths: Dict[Conversion, Optional[ConversionPath]] = {}
 
     def _get_all_available_formats(self) -> List[StorageFormat]:
         fmts = []
@@ -259,7 +328,10 @@ class CopyLookup:
                         fmts.append(StorageFormat(eng, fmt))
         return fmts
 
-    def _build_copy_graph(self, expected_record_count: int) -> nx.MultiDiGraph:
+    def get_cost(self, copier: DataCopier) -> int:
+        return copier.get_cost(self.expected_record_count, self.expected_byte_size)
+
+    def _build_copy_graph(self) -> nx.MultiDiGraph:
         g = nx.MultiDiGraph()
         for c in self._copiers:
             for from_fmt in self.available_storage_formats:
@@ -270,7 +342,7 @@ class CopyLookup:
                                 from_fmt,
                                 to_fmt,
                                 copier=c,
-                                cost=c.cost.total_cost(expected_record_count),
+                                cost=self.get_cost(c),
                             )
                             self._lookup[Conversion(from_fmt, to_fmt)].append(c)
         return g
@@ -279,6 +351,11 @@ class CopyLookup:
         return self._lookup.get(conversion, [])
 
     def get_lowest_cost_path(self, conversion: Conversion) -> Optional[ConversionPath]:
+        if conversion not in self._paths:
+            self._paths[conversion] = self._get_lowest_cost_path(conversion)
+        return self._paths[conversion]
+
+    def _get_lowest_cost_path(self, conversion: Conversion) -> Optional[ConversionPath]:
         try:
             path = nx.shortest_path(
                 self._graph,
@@ -289,7 +366,8 @@ class CopyLookup:
         except nx.NetworkXNoPath:
             return None
         conversion_path = ConversionPath(
-            expected_record_count=self.expected_record_count
+            expected_record_count=self.expected_record_count,
+            expected_byte_size=self.expected_byte_size,
         )
         for i in range(len(path) - 1):
             edge = Conversion(path[i], path[i + 1])
@@ -302,7 +380,7 @@ class CopyLookup:
 
     def get_lowest_cost(self, conversion: Conversion) -> Optional[DataCopier]:
         converters = [
-            (c.cost.total_cost(self.expected_record_count), random.random(), c)
+            (self.get_cost(c), random.random(), c)
             for c in self.get_capable_copiers(conversion)
         ]
         if not converters:
@@ -316,17 +394,68 @@ class CopyLookup:
                 print("\t", d, attrs["converter"])
 
 
+def round_to_magnitude(n: int) -> int:
+    """
+    Rounds up to a power of ten, so that lookups are shared by similar sizes.
+    """
+    if n <= 1:
+        return 1
+    return 10 ** math.ceil(math.log10(n))
+
+
+# Lookups of the registered copiers and formats, per (storage engines, record
+# count, byte size). Valid for one version of the registries (and calibration),
+# see `get_datacopy_lookup`
+_datacopy_lookups: Dict[Tuple, CopyLookup] = {}
+_datacopy_lookups_version: Tuple[int, int, int] = (-1, -1, -1)
+
+
 def get_datacopy_lookup(
     copiers: Iterable[DataCopier] = None,
     available_storage_engines: Set[Type[StorageEngine]] = None,
     available_data_formats: Iterable[DataFormat] = None,
-    expected_record_count: int = 10000,
+    expected_record_count: int = DEFAULT_EXPECTED_RECORD_COUNT,
+    expected_byte_size: Optional[int] = None,
 ) -> CopyLookup:
-    return CopyLookup(
-        copiers=copiers or all_data_copiers,
-        available_storage_engines=available_storage_engines
-        or set(global_registry.all(StorageEngine)),
-        available_data_formats=available_data_formats
-        or list(global_registry.all(DataFormatBase)),
-        expected_record_count=expected_record_count,
+    """
+    Lookups of all registered copiers and formats are cached (with their
+    lowest cost paths) until a copier, format or storage engine is registered.
+    Sizes of cached lookups are rounded up to their order of magnitude.
+    """
+    global _datacopy_lookups_version
+    available_storage_engines = available_storage_engines or set(
+        global_registry.all(StorageEngine)
     )
+    if copiers is not None or available_data_formats is not None:
+        return CopyLookup(
+            copiers=copiers or all_data_copiers,
+            available_storage_engines=available_storage_engines,
+            available_data_formats=available_data_formats
+            or list(global_registry.all(DataFormatBase)),
+            expected_record_count=expected_record_count,
+            expected_byte_size=expected_byte_size,
+        )
+    # All registered copiers are in `all_data_copiers`, which only grows
+    version = (global_registry.version, len(all_data_copiers), _calibration_version)
+    if version != _datacopy_lookups_version:
+        _datacopy_lookups.clear()
+        _datacopy_lookups_version = version
+    expected_record_count = round_to_magnitude(expected_record_count)
+    if expected_byte_size is not None:
+        expected_byte_size = round_to_magnitude(expected_byte_size)
+    key = (
+        frozenset(available_storage_engines),
+        expected_record_count,
+        expected_byte_size,
+    )
+    lookup = _datacopy_lookups.get(key)
+    if lookup is None:
+        lookup = CopyLookup(
+            copiers=all_data_copiers,
+            available_storage_engines=available_storage_engines,
+            available_data_formats=list(global_registry.all(DataFormatBase)),
+            expected_record_count=expected_record_count,
+            expected_byte_size=expected_byte_size,
+        )
+        _datacopy_lookups[key] = lookup
+    return lookup
@@ -0,0 +1,262 @@
+"""
+Calibration of data copy costs.
+
+Each registered copier is benchmarked on local sample data (python memory, a
+local directory and a temporary sqlite database) at a couple of sizes, giving
+a fixed, per-record and per-byte run time. Loaded calibrations replace the
+copiers' hand-picked `DataCopyCost`s in path selection.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+import pandas as pd
+from loguru import logger
+from snapflow.schema.base import create_quick_schema
+from snapflow.storage.data_copy.base import (
+    DEFAULT_RECORD_BYTE_SIZE,
+    CopierCalibration,
+    Conversion,
+    DataCopier,
+    StorageFormat,
+    all_data_copiers,
+    get_datacopy_lookup,
+    set_copier_calibrations,
+)
+from snapflow.storage.data_formats import (
+    DataFrameIteratorFormat,
+    RecordsFormat,
+    RecordsIteratorFormat,
+)
+from snapflow.storage.data_records import as_records
+from snapflow.storage.db.api import dispose_all
+from snapflow.storage.storage import (
+    LocalFileSystemStorageEngine,
+    LocalPythonStorageEngine,
+    SqliteStorageEngine,
+    Storage,
+    StorageApi,
+    StorageEngine,
+    new_local_python_storage,
+)
+from snapflow.utils.common import rand_str
+
+DEFAULT_CALIBRATION_RECORD_COUNT = 2000
+# Payload lengths of the narrow and wide sample records
+NARROW_PAYLOAD_LENGTH = 8
+WIDE_PAYLOAD_LENGTH = 512
+ITERATOR_CHUNK_SIZE = 500
+
+RECORDS_FORMAT = StorageFormat(LocalPythonStorageEngine, RecordsFormat)
+CalibrationSample = create_quick_schema(
+    "CalibrationSample",
+    [("id", "Integer"), ("value", "Float"), ("payload", "Unicode")],
+)
+
+
+def make_sample_records(n: int, payload_length: int) -> List[Dict]:
+    return [
+        {"id": i, "value": i * 0.5, "payload": "x" * payload_length} for i in range(n)
+    ]
+
+
+def records_byte_size(records: List[Dict]) -> int:
+    # As serialized, roughly
+    return sum(len(json.dumps(r)) for r in records)
+
+
+class CopierBenchmark:
+    """
+    Times copiers on local storages, realizing sample records in each copier's
+    source format first (with the lowest cost path of the other copiers).
+    The local directory, sqlite database and python records all belong to the
+    benchmark, and are removed when it is closed.
+    """
+
+    def __init__(self):
+        self.dir = tempfile.mkdtemp(prefix="snapflow_calibration_")
+        files_dir = os.path.join(self.dir, "files")
+        os.makedirs(files_dir)
+        self.storages: Dict[Type[StorageEngine], Storage] = {
+            LocalPythonStorageEngine: new_local_python_storage(),
+            LocalFileSystemStorageEngine: Storage.from_url(f"file://{files_dir}"),
+            SqliteStorageEngine: Storage.from_url(
+                f"sqlite:///{os.path.join(self.dir, 'calibration.db')}"
+            ),
+        }
+        self.lookup = get_datacopy_lookup(available_storage_engines=set(self.storages))
+        self.names: List[str] = []
+
+    def __enter__(self) -> CopierBenchmark:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        python_api = self.storages[LocalPythonStorageEngine].get_api()
+        for name in self.names:
+            python_api.remove(name)
+        self.names = []
+        dispose_all(self.dir)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def new_name(self) -> str:
+        name = f"_calibration_{rand_str(10).lower()}"
+        self.names.append(name)
+        return name
+
+    def get_conversion(self, copier: DataCopier) -> Optional[Conversion]:
+        # Any local conversion the copier handles, from a realizable format
+        for from_fmt in self.lookup.available_storage_formats:
+            if not copier.can_handle_from(from_fmt):
+                continue
+            if from_fmt != RECORDS_FORMAT and not self.lookup.get_lowest_cost_path(
+                Conversion(RECORDS_FORMAT, from_fmt)
+            ):
+                continue
+            for to_fmt in self.lookup.available_storage_formats:
+                if to_fmt != from_fmt and copier.can_handle_to(to_fmt):
+                    return Conversion(from_fmt, to_fmt)
+        return None
+
+    def realize(
+        self, records: List[Dict], storage_format: StorageFormat
+    ) -> Tuple[StorageApi, str]:
+        api = self.storages[LocalPythonStorageEngine].get_api()
+        name = self.new_name()
+        chunks = [
+            records[i : i + ITERATOR_CHUNK_SIZE]
+            for i in range(0, len(records), ITERATOR_CHUNK_SIZE)
+        ]
+        # Iterators are built directly, copy paths to them may hold open resources
+        if storage_format.data_format == RecordsIteratorFormat:
+            api.put(name, as_records(iter(chunks), data_format=RecordsIteratorFormat))
+            return api, name
+        if storage_format.data_format == DataFrameIteratorFormat:
+            api.put(
+                name,
+                as_records(
+                    (pd.DataFrame(c) for c in chunks),
+                    data_format=DataFrameIteratorFormat,
+                ),
+            )
+            return api, name
+        api.put(name, as_records(records))
+        if storage_format == RECORDS_FORMAT:
+            return api, name
+        path = self.lookup.get_lowest_cost_path(
+            Conversion(RECORDS_FORMAT, storage_format)
+        )
+        assert path is not None
+        for edge in path.conversions:
+            to_api = self.storages[
+                edge.conversion.to_storage_format.storage_engine
+            ].get_api()
+            to_name = self.new_name()
+            edge.copier.copy(
+                name, to_name, edge.conversion, api, to_api, CalibrationSample
+            )
+            api, name = to_api, to_name
+        return api, name
+
+    def time_copy(
+        self, copier: DataCopier, conversion: Conversion, records: List[Dict]
+    ) -> float:
+        from_api, from_name = self.realize(records, conversion.from_storage_format)
+        to_api = self.storages[conversion.to_storage_format.storage_engine].get_api()
+        to_name = self.new_name()
+        start = time.perf_counter()
+        copier.copy(from_name, to_name, conversion, from_api, to_api, CalibrationSample)
+        return time.perf_counter() - start
+
+    def calibrate(self, copier: DataCopier, n: int) -> Optional[CopierCalibration]:
+        conversion = self.get_conversion(copier)
+        if conversion is None:
+            logger.debug(f"No local conversion to calibrate {copier.key}")
+            return None
+        narrow = make_sample_records(n, NARROW_PAYLOAD_LENGTH)
+        narrow_double = make_sample_records(2 * n, NARROW_PAYLOAD_LENGTH)
+        wide = make_sample_records(n, WIDE_PAYLOAD_LENGTH)
+        t1, t2, t3 = (
+            self.time_copy(copier, conversion, records)
+            for records in (narrow, narrow_double, wide)
+        )
+        b1, b2, b3 = (records_byte_size(r) for r in (narrow, narrow_double, wide))
+        # Fit t = fixed + per_record * n + per_byte * bytes
+        per_byte = max((t3 - t1) / (b3 - b1), 0.0)
+        per_record = max((t2 - t1 - per_byte * (b2 - b1)) / n, 0.0)
+        fixed = max(t1 - per_record * n - per_byte * b1, 0.0)
+        return CopierCalibration(
+            fixed_seconds=fixed,
+            per_record_seconds=per_record,
+            per_byte_seconds=per_byte,
+        )
+
+
+def calibrate_copiers(
+    copiers: Iterable[DataCopier] = None,
+    record_count: int = DEFAULT_CALIBRATION_RECORD_COUNT,
+) -> Tuple[Dict[str, CopierCalibration], float]:
+    """
+    Benchmarks the (registered) copiers, returning the calibration of each one
+    that could be run locally, and the scale of seconds to cost units (the
+    median ratio of uncalibrated cost to measured time at `record_count`).
+    """
+    calibrations: Dict[str, CopierCalibration] = {}
+    ratios = []
+    byte_size = record_count * DEFAULT_RECORD_BYTE_SIZE
+    with CopierBenchmark() as benchmark:
+        for copier in copiers or all_data_copiers:
+            try:
+                calibration = benchmark.calibrate(copier, record_count)
+            except Exception as e:
+                logger.warning(f"Could not calibrate {copier.key}: {e}")
+                continue
+            if calibration is None:
+                continue
+            calibrations[copier.key] = calibration
+            seconds = calibration.seconds(record_count, byte_size)
+            if seconds > 0:
+                ratios.append(copier.cost.total_cost(record_count) / seconds)
+    cost_per_second = statistics.median(ratios) if ratios else 1.0
+    return calibrations, cost_per_second
+
+
+def save_calibration(
+    path: str, calibrations: Dict[str, CopierCalibration], cost_per_second: float
+):
+    with open(path, "w") as f:
+        json.dump(
+            dict(
+                cost_per_second=cost_per_second,
+                copiers={
+                    k: dict(
+                        fixed_seconds=c.fixed_seconds,
+                        per_record_seconds=c.per_record_seconds,
+                        per_byte_seconds=c.per_byte_seconds,
+                    )
+                    for k, c in calibrations.items()
+                },
+            ),
+            f,
+            indent=2,
+        )
+
+
+def load_calibration(path: str):
+    """
+    Uses the calibration saved at `path` for copy path selection.
+    """
+    with open(path) as f:
+        d = json.load(f)
+    set_copier_calibrations(
+        {k: CopierCalibration(**c) for k, c in d["copiers"].items()},
+        d["cost_per_second"],
+    )
@@ -1,3 +1,4 @@
+import pandas as pd
 from snapflow.schema.base import Schema
 from snapflow.storage.data_copy.base import (
     Conversion,
@@ -12,7 +13,9 @@ from snapflow.storage.data_formats import (
     DatabaseTableRef,
     DatabaseTableRefFormat,
     RecordsFormat,
+    RecordsIteratorFormat,
 )
+from snapflow.storage.data_formats.data_frame import DataFrameIteratorFormat
 from snapflow.storage.data_records import as_records
 from snapflow.storage.db.api import DatabaseStorageApi
 from snapflow.storage.db.utils import result_proxy_to_records
@@ -76,6 +79,56 @@ def copy_db_to_cursor(
     to_storage_api.put(to_name, mdr)
 
 
+@datacopy(
+    from_storage_classes=[DatabaseStorageClass],
+    from_data_formats=[DatabaseTableFormat],
+    to_storage_classes=[PythonStorageClass],
+    to_data_formats=[RecordsIteratorFormat],
+    cost=NetworkToBufferCost,
+)
+def copy_db_to_records_iterator(
+    from_name: str,
+    to_name: str,
+    conversion: Conversion,
+    from_storage_api: StorageApi,
+    to_storage_api: StorageApi,
+    schema: Schema,
+):
+    assert isinstance(from_storage_api, DatabaseStorageApi)
+    assert isinstance(to_storage_api, PythonStorageApi)
+    # Lazy, the query runs (and holds its connection) once iterated
+    itr = from_storage_api.stream_sql_result(f"select * from {from_name}")
+    mdr = as_records(itr, data_format=RecordsIteratorFormat, schema=schema)
+    mdr = mdr.conform_to_schema()
+    to_storage_api.put(to_name, mdr)
+
+
+@datacopy(
+    from_storage_classes=[DatabaseStorageClass],
+    from_data_formats=[DatabaseTableFormat],
+    to_storage_classes=[PythonStorageClass],
+    to_data_formats=[DataFrameIteratorFormat],
+    cost=NetworkToBufferCost,
+)
+def copy_db_to_df_iterator(
+    from_name: str,
+    to_name: str,
+    conversion: Conversion,
+    from_storage_api: StorageApi,
+    to_storage_api: StorageApi,
+    schema: Schema,
+):
+    assert isinstance(from_storage_api, DatabaseStorageApi)
+    assert isinstance(to_storage_api, PythonStorageApi)
+    itr = (
+        pd.DataFrame(records)
+        for records in from_storage_api.stream_sql_result(f"select * from {from_name}")
+    )
+    mdr = as_records(itr, data_format=DataFrameIteratorFormat, schema=schema)
+    mdr = mdr.conform_to_schema()
+    to_storage_api.put(to_name, mdr)
+
+
 # @datacopy(
 #     from_storage_classes=[DatabaseStorageClass],
 #     from_data_formats=[DatabaseTableFormat],
@@ -0,0 +1,32 @@
+from snapflow.schema.base import Schema
+from snapflow.storage.data_copy.base import BulkLoadToBufferCost, Conversion, datacopy
+from snapflow.storage.data_formats import DatabaseTableFormat
+from snapflow.storage.data_formats.delimited_file import DelimitedFileFormat
+from snapflow.storage.db.postgres import PostgresDatabaseStorageApi
+from snapflow.storage.file_system import FileSystemStorageApi
+from snapflow.storage.storage import (
+    FileSystemStorageClass,
+    PostgresStorageEngine,
+    StorageApi,
+)
+
+
+@datacopy(
+    from_storage_classes=[FileSystemStorageClass],
+    from_data_formats=[DelimitedFileFormat],
+    to_storage_engines=[PostgresStorageEngine],
+    to_data_formats=[DatabaseTableFormat],
+    cost=BulkLoadToBufferCost,
+)
+def copy_delim_file_to_postgres(
+    from_name: str,
+    to_name: str,
+    conversion: Conversion,
+    from_storage_api: StorageApi,
+    to_storage_api: StorageApi,
+    schema: Schema,
+):
+    assert isinstance(from_storage_api, FileSystemStorageApi)
+    assert isinstance(to_storage_api, PostgresDatabaseStorageApi)
+    with from_storage_api.open(from_name) as f:
+        to_storage_api.bulk_copy_csv(to_name, f, schema)
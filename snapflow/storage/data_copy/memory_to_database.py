@@ -2,6 +2,8 @@ from typing import Sequence
 
 from snapflow.schema.base import Schema
 from snapflow.storage.data_copy.base import (
+    BulkLoadToBufferCost,
+    BulkLoadToMemoryCost,
     Conversion,
     DiskToMemoryCost,
     NetworkToBufferCost,
@@ -15,9 +17,15 @@ from snapflow.storage.data_formats import (
     RecordsFormat,
     RecordsIteratorFormat,
 )
+from snapflow.storage.data_formats.data_frame import (
+    DataFrameFormat,
+    DataFrameIteratorFormat,
+)
 from snapflow.storage.db.api import DatabaseStorageApi
+from snapflow.storage.db.postgres import PostgresDatabaseStorageApi
 from snapflow.storage.storage import (
     DatabaseStorageClass,
+    PostgresStorageEngine,
     PythonStorageApi,
     PythonStorageClass,
     StorageApi,
@@ -65,3 +73,87 @@ def copy_records_iterator_to_db(
     mdr = from_storage_api.get(from_name)
     for records in mdr.records_object:
         to_storage_api.bulk_insert_records(to_name, records, schema)
+
+
+@datacopy(
+    from_storage_classes=[PythonStorageClass],
+    from_data_formats=[RecordsFormat],
+    to_storage_engines=[PostgresStorageEngine],
+    to_data_formats=[DatabaseTableFormat],
+    cost=BulkLoadToMemoryCost,
+)
+def copy_records_to_postgres(
+    from_name: str,
+    to_name: str,
+    conversion: Conversion,
+    from_storage_api: StorageApi,
+    to_storage_api: StorageApi,
+    schema: Schema,
+):
+    assert isinstance(from_storage_api, PythonStorageApi)
+    assert isinstance(to_storage_api, PostgresDatabaseStorageApi)
+    mdr = from_storage_api.get(from_name)
+    to_storage_api.bulk_copy_records(to_name, [mdr.records_object], schema)
+
+
+@datacopy(
+    from_storage_classes=[PythonStorageClass],
+    from_data_formats=[RecordsIteratorFormat],
+    to_storage_engines=[PostgresStorageEngine],
+    to_data_formats=[DatabaseTableFormat],
+    cost=BulkLoadToBufferCost,
+)
+def copy_records_iterator_to_postgres(
+    from_name: str,
+    to_name: str,
+    conversion: Conversion,
+    from_storage_api: StorageApi,
+    to_storage_api: StorageApi,
+    schema: Schema,
+):
+    assert isinstance(from_storage_api, PythonStorageApi)
+    assert isinstance(to_storage_api, PostgresDatabaseStorageApi)
+    mdr = from_storage_api.get(from_name)
+    to_storage_api.bulk_copy_records(to_name, mdr.records_object, schema)
+
+
+@datacopy(
+    from_storage_classes=[PythonStorageClass],
+    from_data_formats=[DataFrameFormat],
+    to_storage_engines=[PostgresStorageEngine],
+    to_data_formats=[DatabaseTableFormat],
+    cost=BulkLoadToMemoryCost,
+)
+def copy_df_to_postgres(
+    from_name: str,
+    to_name: str,
+    conversion: Conversion,
+    from_storage_api: StorageApi,
+    to_storage_api: StorageApi,
+    schema: Schema,
+):
+    assert isinstance(from_storage_api, PythonStorageApi)
+    assert isinstance(to_storage_api, PostgresDatabaseStorageApi)
+    mdr = from_storage_api.get(from_name)
+    to_storage_api.bulk_copy_dataframes(to_name, [mdr.records_object], schema)
+
+
+@datacopy(
+    from_storage_classes=[PythonStorageClass],
+    from_data_formats=[DataFrameIteratorFormat],
+    to_storage_engines=[PostgresStorageEngine],
+    to_data_formats=[DatabaseTableFormat],
+    cost=BulkLoadToBufferCost,
+)
+def copy_df_iterator_to_postgres(
+    from_name: str,
+    to_name: str,
+    conversion: Conversion,
+    from_storage_api: StorageApi,
+    to_storage_api: StorageApi,
+    schema: Schema,
+):
+    assert isinstance(from_storage_api, PythonStorageApi)
+    assert isinstance(to_storage_api, PostgresDatabaseStorageApi)
+    mdr = from_storage_api.get(from_name)
+    to_storage_api.bulk_copy_dataframes(to_name, mdr.records_object, schema)
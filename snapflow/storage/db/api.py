@@ -3,7 +3,19 @@ from __future__ import annotations
 import json
 import os
 from contextlib import contextmanager
-from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Tuple, Type
+from dataclasses import asdict, dataclass, replace
+from threading import RLock
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
 
 import sqlalchemy
 from loguru import logger
@@ -11,7 +23,7 @@ from snapflow.core.typing.inference import infer_schema_from_db_table
 from snapflow.schema.base import Schema
 from snapflow.storage.data_formats.records import Records
 from snapflow.storage.db.schema import SchemaMapper
-from snapflow.storage.db.utils import conform_columns_for_insert
+from snapflow.storage.db.utils import conform_columns_for_insert, db_result_batcher
 from snapflow.storage.storage import Storage, StorageApi
 from snapflow.utils.common import SnapflowJSONEncoder, rand_str
 from snapflow.utils.data import conform_records_for_insert
@@ -24,24 +36,63 @@ if TYPE_CHECKING:
     pass
 
 
+@dataclass(frozen=True)
+class EnginePoolSettings:
+    pool_size: int = 5
+    max_overflow: int = 10
+    # Test connections on checkout, so dropped ones are replaced transparently
+    pool_pre_ping: bool = True
+    pool_recycle: int = 1800  # Seconds
+
+    def as_engine_kwargs(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+DEFAULT_FETCH_SIZE = 10000
+
+_pool_settings = EnginePoolSettings()
 _sa_engines: List[Engine] = []
+# One engine (and so one connection pool) per url, shared by all apis in the process
+_shared_engines: Dict[str, Engine] = {}
+_engines_lock = RLock()
+
+
+def configure_engine_pool(**settings: Any):
+    """
+    Sets the connection pool settings (see `EnginePoolSettings`) of engines
+    created from now on.
+    """
+    global _pool_settings
+    _pool_settings = replace(_pool_settings, **settings)
+
+
+def get_engine_pool_settings() -> EnginePoolSettings:
+    return _pool_settings
 
 
 def dispose_all(keyword: Optional[str] = None):
-    for e in _sa_engines:
-        if keyword:
-            if keyword not in str(e.url):
-                continue
-        e.dispose()
+    with _engines_lock:
+        for e in _sa_engines:
+            if keyword:
+                if keyword not in str(e.url):
+                    continue
+            e.dispose()
+        for url in list(_shared_engines):
+            if not keyword or keyword in url:
+                del _shared_engines[url]
 
 
 class DatabaseApi:
+    # Rows per batch when streaming results, see `stream_sql_result`
+    fetch_size: int = DEFAULT_FETCH_SIZE
+
     def __init__(
         self,
         url: str,
         json_serializer: Callable = None,
     ):
         self.url = url
+        self._custom_json_serializer = json_serializer is not None
         self.json_serializer = (
             json_serializer
             if json_serializer is not None
@@ -49,15 +100,34 @@ class DatabaseApi:
         )
         self.eng: Optional[sqlalchemy.engine.Engine] = None
 
-    def get_engine(self) -> sqlalchemy.engine.Engine:
-        if self.eng is not None:
-            return self.eng
-        self.eng = sqlalchemy.create_engine(
-            self.url,
+    def get_engine_kwargs(self) -> Dict[str, Any]:
+        return dict(
             json_serializer=self.json_serializer,
             echo=False,
+            **get_engine_pool_settings().as_engine_kwargs(),
         )
-        _sa_engines.append(self.eng)
+
+    def engine_is_shareable(self) -> bool:
+        # An engine with a custom serializer is specific to this api
+        return not self._custom_json_serializer
+
+    def create_engine(self) -> sqlalchemy.engine.Engine:
+        eng = sqlalchemy.create_engine(self.url, **self.get_engine_kwargs())
+        _sa_engines.append(eng)
+        return eng
+
+    def get_engine(self) -> sqlalchemy.engine.Engine:
+        if self.eng is not None:
+            return self.eng
+        if not self.engine_is_shareable():
+            self.eng = self.create_engine()
+            return self.eng
+        with _engines_lock:
+            eng = _shared_engines.get(self.url)
+            if eng is None:
+                eng = self.create_engine()
+                _shared_engines[self.url] = eng
+        self.eng = eng
         return self.eng
 
     def dialect_is_supported(self) -> bool:
@@ -81,6 +151,21 @@ class DatabaseApi:
         with self.connection() as conn:
             yield conn.execute(sql)
 
+    def stream_sql_result(
+        self, sql: str, fetch_size: Optional[int] = None
+    ) -> Iterator[Records]:
+        """
+        Yields the query's rows as records, `fetch_size` at a time, from a
+        server-side cursor where the driver has one (eg a named cursor on
+        postgres), so memory use is bounded by the fetch size. The connection
+        is held until the iterator is exhausted (or closed).
+        """
+        logger.debug("Streaming SQL:")
+        logger.debug(sql)
+        with self.connection() as conn:
+            result = conn.execution_options(stream_results=True).execute(sql)
+            yield from db_result_batcher(result, fetch_size or self.fetch_size)
+
     def ensure_table(self, name: str, schema: Schema) -> str:
         if self.exists(name):
             return name
@@ -119,6 +204,12 @@ class DatabaseApi:
     def copy(self, name: str, to_name: str):
         self.execute_sql(f"create table {to_name} as select * from {name}")
 
+    def remove(self, name: str):
+        if name in sqlalchemy.inspect(self.get_engine()).get_view_names():
+            self.execute_sql(f"drop view {name}")
+        else:
+            self.execute_sql(f"drop table if exists {name}")
+
     def rename_table(self, table_name: str, new_name: str):
         self.execute_sql(f"alter table {table_name} rename to {new_name}")
 
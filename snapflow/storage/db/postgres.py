@@ -1,7 +1,15 @@
+import csv
+import json
+import math
 from contextlib import contextmanager
-from typing import Dict, Iterator, List
+from io import StringIO
+from itertools import chain
+from typing import IO, Any, Dict, Iterable, Iterator, List
 
+import pandas as pd
 from loguru import logger
+from snapflow.schema.base import Schema
+from snapflow.storage.data_formats import Records
 from snapflow.storage.db.api import (
     DatabaseApi,
     DatabaseStorageApi,
@@ -13,8 +21,12 @@ from snapflow.storage.db.utils import (
     compile_jinja_sql_template,
     conform_columns_for_insert,
 )
-from snapflow.utils.common import rand_str
-from snapflow.utils.data import conform_records_for_insert
+from snapflow.utils.common import SnapflowJSONEncoder, rand_str
+from snapflow.utils.data import (
+    SnapflowCsvDialect,
+    conform_records_for_insert,
+    process_csv_value,
+)
 from sqlalchemy.engine import Engine
 
 POSTGRES_SUPPORTED = False
@@ -28,6 +40,13 @@ except ImportError:
         raise ImportError("Psycopg2 not installed")
 
 
+# Rows per COPY buffer, bounds the memory (not the transaction) of a load
+COPY_BUFFER_SIZE = 50000
+# Only ever written unquoted, and every other value quoted, so no string (not
+# even "" or a literal "\N") loads as NULL
+COPY_NULL = r"\N"
+
+
 def bulk_insert(*args, **kwargs):
     kwargs["update"] = False
     return bulk_upsert(*args, **kwargs)
@@ -87,6 +106,145 @@ def pg_execute_values(
         conn.close()
 
 
+def format_copy_float(v: float) -> str:
+    # So integral floats (eg upcast by missing values) load into integer columns
+    return str(int(v)) if v.is_integer() else repr(v)
+
+
+def is_copy_null(v: Any) -> bool:
+    if v is None or v is pd.NA or v is pd.NaT:
+        return True
+    return isinstance(v, float) and math.isnan(v)
+
+
+def format_copy_field(v: Any) -> str:
+    if is_copy_null(v):
+        return COPY_NULL
+    if isinstance(v, float):
+        v = format_copy_float(v)
+    return '"' + str(v).replace('"', '""') + '"'
+
+
+def format_copy_row(row: Iterable) -> str:
+    return ",".join(format_copy_field(v) for v in row) + "\n"
+
+
+def copy_buffers_from_rows(
+    rows: Iterable[Iterable], buffer_size: int = COPY_BUFFER_SIZE
+) -> Iterator[StringIO]:
+    buf = StringIO()
+    n = 0
+    for row in rows:
+        buf.write(format_copy_row(row))
+        n += 1
+        if n >= buffer_size:
+            buf.seek(0)
+            yield buf
+            buf = StringIO()
+            n = 0
+    if n:
+        buf.seek(0)
+        yield buf
+
+
+def copy_buffers_from_dataframe(
+    df: pd.DataFrame, columns: List[str], buffer_size: int = COPY_BUFFER_SIZE
+) -> Iterator[StringIO]:
+    for i in range(0, len(df), buffer_size):
+        chunk = df.iloc[i : i + buffer_size][columns]
+        for c in columns:
+            if chunk[c].dtype == object:
+                chunk = chunk.assign(
+                    **{
+                        c: chunk[c].map(
+                            lambda o: json.dumps(o, cls=SnapflowJSONEncoder)
+                            if isinstance(o, (list, dict))
+                            else o
+                        )
+                    }
+                )
+        rows = chunk.itertuples(index=False, name=None)
+        yield from copy_buffers_from_rows(rows, buffer_size)
+
+
+def pg_copy_from(
+    eng: Engine, table_name: str, columns: List[str], buffers: Iterable[IO]
+):
+    """
+    Loads CSV buffers into `table_name` with `COPY ... FROM STDIN`, all in one
+    transaction. Buffers may be generated lazily, only one is held at a time.
+    """
+    sql = compile_jinja_sql_template(
+        "load_csv.sql",
+        {"table_name": table_name, "columns": columns, "null": COPY_NULL},
+    )
+    logger.debug("SQL", sql)
+    conn = eng.raw_connection()
+    try:
+        with conn.cursor() as curs:
+            for buf in buffers:
+                curs.copy_expert(sql, buf)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        conn.close()
+
+
+def bulk_copy_records(
+    eng: Engine,
+    table_name: str,
+    records_chunks: Iterable[Records],
+    columns: List[str] = None,
+    adapt_objects_to_json: bool = True,
+):
+    chunks = (r for r in records_chunks if r)
+    first = next(chunks, None)
+    if first is None:
+        return
+    columns = conform_columns_for_insert(first, columns)
+    rows = (
+        row
+        for records in chain([first], chunks)
+        for row in conform_records_for_insert(records, columns, adapt_objects_to_json)
+    )
+    pg_copy_from(eng, table_name, columns, copy_buffers_from_rows(rows))
+
+
+def bulk_copy_dataframes(
+    eng: Engine,
+    table_name: str,
+    dfs: Iterable[pd.DataFrame],
+    columns: List[str] = None,
+):
+    frames = (df for df in dfs if len(df))
+    first = next(frames, None)
+    if first is None:
+        return
+    if columns is None:
+        columns = list(first.columns)
+    buffers = (
+        buf
+        for df in chain([first], frames)
+        for buf in copy_buffers_from_dataframe(df, columns)
+    )
+    pg_copy_from(eng, table_name, columns, buffers)
+
+
+def bulk_copy_csv(eng: Engine, table_name: str, lines: Iterable[str]):
+    """
+    Loads a snapflow CSV (as written by `write_csv`, with a header) by
+    re-encoding it for COPY, so values read as they would by `read_csv`.
+    """
+    reader = csv.reader(lines, dialect=SnapflowCsvDialect)
+    columns = next(reader, None)
+    if not columns:
+        return
+    rows = ([process_csv_value(v) for v in row] for row in reader)
+    pg_copy_from(eng, table_name, columns, copy_buffers_from_rows(rows))
+
+
 class PostgresDatabaseApi(DatabaseApi):
     def dialect_is_supported(self) -> bool:
         return POSTGRES_SUPPORTED
@@ -96,6 +254,26 @@ class PostgresDatabaseApi(DatabaseApi):
             eng=self.get_engine(), table_name=table_name, records=records, **kwargs
         )
 
+    def bulk_copy_records(
+        self, name: str, records_chunks: Iterable[Records], schema: Schema
+    ):
+        """
+        Like `bulk_insert_records`, but streams (chunks of) records through
+        COPY, in one transaction.
+        """
+        self.ensure_table(name, schema=schema)
+        bulk_copy_records(self.get_engine(), name, records_chunks)
+
+    def bulk_copy_dataframes(
+        self, name: str, dfs: Iterable[pd.DataFrame], schema: Schema
+    ):
+        self.ensure_table(name, schema=schema)
+        bulk_copy_dataframes(self.get_engine(), name, dfs)
+
+    def bulk_copy_csv(self, name: str, lines: Iterable[str], schema: Schema):
+        self.ensure_table(name, schema=schema)
+        bulk_copy_csv(self.get_engine(), name, lines)
+
     @classmethod
     @contextmanager
     def temp_local_database(cls) -> Iterator[str]:
@@ -1,5 +1,5 @@
-copy {{ output_table }} (
- {{ output_object_type.field_name_list|join(",") }}
+copy "{{ table_name }}" (
+    {{ columns|column_list }}
 )
-from '{{ csv_path }}' delimiter ',' csv header
+from stdin with (format csv, null '{{ null }}')
 ;
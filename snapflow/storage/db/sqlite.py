@@ -1,14 +1,100 @@
 from __future__ import annotations
 
+import random
+import time
 from contextlib import contextmanager
-from typing import Dict, Iterator, List
+from typing import Any, Callable, Dict, Iterator, List, TypeVar
 
+import sqlalchemy
+from loguru import logger
 from snapflow.storage.db.api import DatabaseApi, DatabaseStorageApi
 from snapflow.storage.db.utils import conform_columns_for_insert, get_tmp_sqlite_db_url
 from snapflow.utils.data import conform_records_for_insert
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+
+T = TypeVar("T")
+
+# How long a connection waits on another's lock before failing as busy
+SQLITE_BUSY_TIMEOUT_SECONDS = 30
+# Set on every new connection. WAL lets readers proceed alongside a writer,
+# and `synchronous=NORMAL` is safe (if not durable on power loss) under WAL
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_SECONDS * 1000,
+}
+SQLITE_BUSY_RETRIES = 5
+SQLITE_BUSY_BACKOFF_SECONDS = 0.1
+
+
+def is_memory_sqlite_url(url: str) -> bool:
+    return sqlalchemy.engine.url.make_url(url).database in (None, "", ":memory:")
+
+
+def set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def is_busy_error(e: Exception) -> bool:
+    s = str(e).lower()
+    return isinstance(e, OperationalError) and (
+        "database is locked" in s or "database is busy" in s
+    )
+
+
+def retry_on_busy(
+    fn: Callable[[], T],
+    retries: int = SQLITE_BUSY_RETRIES,
+    backoff_seconds: float = SQLITE_BUSY_BACKOFF_SECONDS,
+) -> T:
+    """
+    Calls `fn`, calling it again (after an exponential, jittered backoff) if it
+    fails with a sqlite busy error, ie if it timed out waiting on another
+    writer. `fn` must be a whole transaction, so it is safe to repeat.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except OperationalError as e:
+            if attempt == retries or not is_busy_error(e):
+                raise e
+            wait = backoff_seconds * 2 ** attempt * (1 + random.random())
+            logger.warning(f"Sqlite busy, retrying in {wait:.2f}s: {e}")
+            time.sleep(wait)
+    raise AssertionError("Unreachable")
 
 
 class SqliteDatabaseApi(DatabaseApi):
+    def get_engine_kwargs(self) -> Dict[str, Any]:
+        kwargs = super().get_engine_kwargs()
+        if is_memory_sqlite_url(self.url):
+            # Each connection is its own in-memory database, keep the default pool
+            return dict(json_serializer=kwargs["json_serializer"], echo=False)
+        kwargs.update(
+            poolclass=QueuePool,
+            connect_args=dict(
+                timeout=SQLITE_BUSY_TIMEOUT_SECONDS, check_same_thread=False
+            ),
+        )
+        return kwargs
+
+    def engine_is_shareable(self) -> bool:
+        # A new in-memory engine is a new, empty database
+        return super().engine_is_shareable() and not is_memory_sqlite_url(self.url)
+
+    def create_engine(self) -> sqlalchemy.engine.Engine:
+        eng = super().create_engine()
+        if not is_memory_sqlite_url(self.url):
+            event.listen(eng, "connect", set_sqlite_pragmas)
+        return eng
+
     @classmethod
     @contextmanager
     def temp_local_database(cls) -> Iterator[str]:
@@ -20,9 +20,12 @@ def result_proxy_to_records(
 
 
 def db_result_batcher(result_proxy: ResultProxy, batch_size: int = 1000) -> Generator:
+    keys = result_proxy.keys()
     while True:
         rows = result_proxy.fetchmany(batch_size)
-        yield result_proxy_to_records(result_proxy, rows)
+        if not rows:
+            return
+        yield [{k: v for k, v in zip(keys, row)} for row in rows]
         if len(rows) < batch_size:
             return
 
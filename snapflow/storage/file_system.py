@@ -54,6 +54,12 @@ class FileSystemStorageApi(StorageApi):
         to_pth = self.get_path(to_name)
         shutil.copy(pth, to_pth)
 
+    def remove(self, name: str):
+        try:
+            os.remove(self.get_path(name))
+        except FileNotFoundError:
+            pass
+
     def write_lines_to_file(
         self,
         name: str,
@@ -2,12 +2,31 @@ from __future__ import annotations
 
 import enum
 import os
+import pickle
+import shutil
+import sys
+import tempfile
+import weakref
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from copy import deepcopy
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Type
+from threading import RLock
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Type,
+)
 from urllib.parse import urlparse
 
 from loguru import logger
+from pandas import DataFrame
 from snapflow.storage.data_formats import (
     DatabaseCursorFormat,
     DatabaseTableFormat,
@@ -194,13 +213,250 @@ class StorageApi:
     def copy(self, name: str, to_name: str):
         raise NotImplementedError
 
+    def remove(self, name: str):
+        raise NotImplementedError
+
     def create_alias(
         self, name: str, alias: str
     ):  # TODO: rename to overwrite_alias or set_alias?
         raise NotImplementedError
 
 
-LOCAL_PYTHON_STORAGE: Dict[str, MemoryDataRecords] = {}  # TODO: global state...
+# Records sampled to estimate the size of a list of records
+SIZE_ESTIMATE_SAMPLE = 100
+
+
+def estimate_memory_size(records_object: Any) -> int:
+    """
+    Rough size in bytes of a python records object (0 for iterators and
+    other objects of unknown size).
+    """
+    if isinstance(records_object, DataFrame):
+        return int(records_object.memory_usage(deep=True).sum())
+    if isinstance(records_object, list):
+        size = sys.getsizeof(records_object)
+        if not records_object:
+            return size
+        sample = records_object[:SIZE_ESTIMATE_SAMPLE]
+        sample_size = 0
+        for r in sample:
+            sample_size += sys.getsizeof(r)
+            if isinstance(r, dict):
+                sample_size += sum(sys.getsizeof(v) for v in r.values())
+        return size + sample_size * len(records_object) // len(sample)
+    return 0
+
+
+_run_pins: ContextVar[Optional[Set[str]]] = ContextVar(
+    "snapflow_memory_run_pins", default=None
+)
+
+
+class MemoryStorageManager:
+    """
+    Process-wide store of the objects in python storages, keyed by path.
+    Bounded (if `budget_bytes` is set) by evicting least recently used
+    objects. Objects used by an active run (see `run_scope`) are pinned and
+    never evicted. Evicted objects are spilled (pickled) to a local scratch
+    directory, if `spill` is set, and reloaded on their next `get`. Otherwise
+    they are gone.
+    """
+
+    def __init__(
+        self,
+        budget_bytes: Optional[int] = None,
+        spill: bool = True,
+        spill_dir: Optional[str] = None,
+    ):
+        self.budget_bytes = budget_bytes
+        self.spill = spill
+        self.spill_dir = spill_dir
+        self.total_bytes = 0
+        self.evicted_count = 0
+        self.spilled_count = 0
+        self._lock = RLock()
+        # Path -> records, least recently used first
+        self._entries: OrderedDict = OrderedDict()
+        # Aliases share records, so sizes and holding paths are per object
+        self._sizes: Dict[int, int] = {}
+        self._holders: Dict[int, Set[str]] = {}
+        self._pins: Counter = Counter()
+        # Path -> spill file, shared by the paths of a spilled object
+        self._spilled: Dict[str, str] = {}
+        self._spill_dir_finalizer: Optional[weakref.finalize] = None
+
+    def get(self, path: str) -> Optional[MemoryDataRecords]:
+        with self._lock:
+            mdr = self._entries.get(path)
+            if mdr is None and path in self._spilled:
+                mdr = self._unspill(path)
+            if mdr is not None:
+                self._entries.move_to_end(path)
+                self._pin_for_run(path)
+                self.evict()
+            return mdr
+
+    def put(self, path: str, mdr: MemoryDataRecords):
+        with self._lock:
+            self._insert(path, mdr)
+            self._pin_for_run(path)
+            self.evict()
+
+    def _insert(self, path: str, mdr: MemoryDataRecords):
+        self._remove(path)
+        self._entries[path] = mdr
+        holders = self._holders.setdefault(id(mdr), set())
+        if not holders:
+            size = estimate_memory_size(mdr.records_object)
+            self._sizes[id(mdr)] = size
+            self.total_bytes += size
+        holders.add(path)
+
+    def remove(self, path: str):
+        with self._lock:
+            self._remove(path)
+
+    def _remove(self, path: str):
+        spill_path = self._spilled.pop(path, None)
+        if spill_path is not None and spill_path not in self._spilled.values():
+            os.remove(spill_path)
+        mdr = self._entries.pop(path, None)
+        if mdr is None:
+            return
+        holders = self._holders[id(mdr)]
+        holders.discard(path)
+        if not holders:
+            del self._holders[id(mdr)]
+            self.total_bytes -= self._sizes.pop(id(mdr))
+
+    def size_of(self, path: str) -> Optional[int]:
+        """
+        Estimated size in bytes of the object at `path`, if in memory.
+        """
+        mdr = self._entries.get(path)
+        if mdr is None:
+            return None
+        return self._sizes.get(id(mdr))
+
+    def is_pinned(self, path: str) -> bool:
+        return self._pins[path] > 0
+
+    def is_spilled(self, path: str) -> bool:
+        return path in self._spilled
+
+    def evict(self):
+        """
+        Evicts least recently used, unpinned objects (with all their paths)
+        until within budget.
+        """
+        if self.budget_bytes is None:
+            return
+        with self._lock:
+            for path in list(self._entries):
+                if self.total_bytes <= self.budget_bytes:
+                    break
+                mdr = self._entries.get(path)
+                if mdr is None:
+                    # Already evicted as an alias
+                    continue
+                if not self._sizes[id(mdr)]:
+                    # Nothing to gain (eg an iterator, that can't be spilled either)
+                    continue
+                holders = list(self._holders[id(mdr)])
+                if any(self.is_pinned(p) for p in holders):
+                    continue
+                spill_path = self._spill(mdr) if self.spill else None
+                for p in holders:
+                    logger.debug(f"Evicting {p} from memory")
+                    self._remove(p)
+                    if spill_path is not None:
+                        self._spilled[p] = spill_path
+                    self.evicted_count += 1
+
+    def _spill(self, mdr: MemoryDataRecords) -> Optional[str]:
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="snapflow_spill_")
+            # Our own scratch dir (not a given `spill_dir`), removed with us or at exit
+            self._spill_dir_finalizer = weakref.finalize(
+                self, shutil.rmtree, self.spill_dir, ignore_errors=True
+            )
+        spill_path = os.path.join(self.spill_dir, rand_str(16))
+        try:
+            with open(spill_path, "wb") as f:
+                pickle.dump(mdr, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning(f"Could not spill {mdr} to disk, dropping it: {e}")
+            if os.path.exists(spill_path):
+                os.remove(spill_path)
+            return None
+        self.spilled_count += 1
+        return spill_path
+
+    def _unspill(self, path: str) -> MemoryDataRecords:
+        spill_path = self._spilled[path]
+        logger.debug(f"Reloading {path} from {spill_path}")
+        with open(spill_path, "rb") as f:
+            mdr = pickle.load(f)
+        # Restores all aliases of the object, sharing it again
+        for p in [p for p, sp in self._spilled.items() if sp == spill_path]:
+            self._insert(p, mdr)
+        return mdr
+
+    def _pin_for_run(self, path: str):
+        pins = _run_pins.get()
+        if pins is not None and path not in pins:
+            pins.add(path)
+            self._pins[path] += 1
+
+    @contextmanager
+    def run_scope(self) -> Iterator[None]:
+        """
+        Pins every object put or read within the scope (in this thread /
+        context) until the scope exits, so a run's inputs and outputs are not
+        evicted while it is using them.
+        """
+        pins: Set[str] = set()
+        token = _run_pins.set(pins)
+        try:
+            yield
+        finally:
+            _run_pins.reset(token)
+            with self._lock:
+                for path in pins:
+                    self._pins[path] -= 1
+                    if self._pins[path] <= 0:
+                        del self._pins[path]
+                self.evict()
+
+    def clear(self):
+        with self._lock:
+            for spill_path in set(self._spilled.values()):
+                os.remove(spill_path)
+            self._spilled.clear()
+            self._entries.clear()
+            self._sizes.clear()
+            self._holders.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            entries=len(self._entries),
+            spilled_entries=len(self._spilled),
+            total_bytes=self.total_bytes,
+            budget_bytes=self.budget_bytes,
+            pinned=len(self._pins),
+            evicted=self.evicted_count,
+            spilled=self.spilled_count,
+        )
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._entries or path in self._spilled
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self._spilled)
+
+
+LOCAL_PYTHON_STORAGE = MemoryStorageManager()
 
 
 def new_local_python_storage() -> Storage:
@@ -224,11 +480,11 @@ class PythonStorageApi(StorageApi):
 
     def remove(self, name: str):
         pth = self.get_path(name)
-        del LOCAL_PYTHON_STORAGE[pth]
+        LOCAL_PYTHON_STORAGE.remove(pth)
 
     def put(self, name: str, mdr: MemoryDataRecords):
         pth = self.get_path(name)
-        LOCAL_PYTHON_STORAGE[pth] = mdr
+        LOCAL_PYTHON_STORAGE.put(pth, mdr)
 
     def exists(self, name: str) -> bool:
         pth = self.get_path(name)
@@ -238,6 +494,11 @@ class PythonStorageApi(StorageApi):
         mdr = self.get(name)
         return mdr.record_count
 
+    def byte_size(self, name: str) -> Optional[int]:
+        size = LOCAL_PYTHON_STORAGE.size_of(self.get_path(name))
+        # Unknown for objects we can't size (eg iterators)
+        return size or None
+
     def copy(self, name: str, to_name: str):
         mdr = self.get(name)
         mdr_copy = deepcopy(mdr)
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+import collections
 import decimal
 import hashlib
 import json
 import random
 import re
 import string
+import threading
 import uuid
 from dataclasses import field
 from datetime import date, datetime, time, timedelta
@@ -335,6 +337,53 @@ class SnapflowJSONEncoder(json.JSONEncoder):
             return super().default(o)
 
 
+class LRUCache(Generic[K, V]):
+    """
+    Thread-safe mapping bounded to the `maxsize` most recently used entries,
+    counting hits and misses.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: K, value: V):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return dict(
+            hits=self.hits, misses=self.misses, size=len(self), maxsize=self.maxsize
+        )
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
 def to_json(d: Any) -> str:
     return json.dumps(d, cls=SnapflowJSONEncoder)
 
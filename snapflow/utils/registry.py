@@ -16,9 +16,14 @@ ClassBasedEnumType = Type[ClassBasedEnum]
 class ClassRegistry:
     def __init__(self):
         self._registry: OrderedDict[str, ClassBasedEnumType] = OrderedDict()
+        # Bumped on every change, so lookups derived from the registry can be cached
+        self.version = 0
 
     def register(self, cls: ClassBasedEnumType):
-        self._registry[self.get_key(cls)] = cls
+        key = self.get_key(cls)
+        if self._registry.get(key) is not cls:
+            self._registry[key] = cls
+            self.version += 1
 
     def get_key(self, cls: ClassBasedEnumType) -> str:
         return cls.__name__
@@ -11,6 +11,11 @@ def test_app():
     runner = CliRunner()
     result = runner.invoke(app, ["-m", db_url, "logs"])
     assert result.exit_code == 0
+    result = runner.invoke(app, ["-m", db_url, "logs", "--timings"])
+    assert result.exit_code == 0
+    result = runner.invoke(app, ["-m", db_url, "migrate"])
+    assert result.exit_code == 0
+    assert "Metadata at version" in result.output
     result = runner.invoke(app, ["-m", db_url, "nodes"])
     assert result.exit_code == 0
     result = runner.invoke(app, ["-m", db_url, "blocks"])
@@ -24,3 +29,8 @@ def test_app():
         assert result.exit_code == 0
         pth = os.path.join(os.getcwd(), SNAPFLOW_PROJECT_FILE_NAME)
         assert os.path.exists(pth)
+        result = runner.invoke(
+            app, ["-m", db_url, "calibrate", "-n", "20", "-o", "calibration.json"]
+        )
+        assert result.exit_code == 0
+        assert os.path.exists("calibration.json")
@@ -1,20 +1,31 @@
 from __future__ import annotations
 
+import os
 import tempfile
 import types
+from collections import OrderedDict
 from io import StringIO
 from typing import Optional, Type
 
 import pytest
 from snapflow.core.data_block import DataBlockMetadata, create_data_block_from_records
 from snapflow.storage.data_copy.base import (
+    BufferToBufferCost,
+    CopierCalibration,
     Conversion,
     DataCopier,
+    DataCopyCost,
     NetworkToMemoryCost,
     NoOpCost,
     StorageFormat,
     datacopy,
     get_datacopy_lookup,
+    set_copier_calibrations,
+)
+from snapflow.storage.data_copy.calibration import (
+    calibrate_copiers,
+    load_calibration,
+    save_calibration,
 )
 from snapflow.storage.data_copy.database_to_memory import copy_db_to_records
 from snapflow.storage.data_copy.memory_to_database import copy_records_to_db
@@ -27,7 +38,9 @@ from snapflow.storage.data_formats import (
     JsonLinesFileFormat,
     RecordsFormat,
     RecordsIteratorFormat,
+    register_format,
 )
+from snapflow.storage.data_formats.base import DataFormatBase
 from snapflow.storage.data_formats.data_frame import DataFrameIteratorFormat
 from snapflow.storage.data_formats.delimited_file_object import (
     DelimitedFileObjectFormat,
@@ -35,6 +48,7 @@ from snapflow.storage.data_formats.delimited_file_object import (
 from snapflow.storage.data_records import MemoryDataRecords, as_records
 from snapflow.storage.db.api import DatabaseApi, DatabaseStorageApi
 from snapflow.storage.storage import (
+    LOCAL_PYTHON_STORAGE,
     DatabaseStorageClass,
     FileSystemStorageClass,
     LocalFileSystemStorageEngine,
@@ -47,6 +61,7 @@ from snapflow.storage.storage import (
     clear_local_storage,
     new_local_python_storage,
 )
+from snapflow.utils.registry import global_registry
 from tests.utils import TestSchema1, TestSchema4
 
 
@@ -58,6 +73,37 @@ def test_data_copy_decorator():
     assert copy.cost is NoOpCost
 
 
+@pytest.fixture
+def restore_global_registry():
+    registered = OrderedDict(global_registry._registry)
+    yield
+    global_registry._registry = registered
+    # Invalidates lookups cached with the test's registrations
+    global_registry.version += 1
+
+
+def test_data_copy_lookup_cached(restore_global_registry):
+    engines = {SqliteStorageEngine, LocalPythonStorageEngine}
+    lkup = get_datacopy_lookup(available_storage_engines=engines)
+    assert get_datacopy_lookup(available_storage_engines=set(engines)) is lkup
+    conversion = Conversion(
+        StorageFormat(SqliteStorageEngine, DatabaseTableFormat),
+        StorageFormat(LocalPythonStorageEngine, RecordsFormat),
+    )
+    path = lkup.get_lowest_cost_path(conversion)
+    assert lkup.get_lowest_cost_path(conversion) is path
+    assert get_datacopy_lookup() is not lkup
+    # Registering a known class changes nothing, a new one invalidates lookups
+    register_format(RecordsFormat)
+    assert get_datacopy_lookup(available_storage_engines=engines) is lkup
+
+    class _LookupTestFormat(DataFormatBase):
+        pass
+
+    register_format(_LookupTestFormat)
+    assert get_datacopy_lookup(available_storage_engines=engines) is not lkup
+
+
 def test_data_copy_lookup():
     @datacopy(
         cost=NoOpCost, from_storage_classes=[FileSystemStorageClass], unregistered=True
@@ -102,7 +148,7 @@ def test_data_copy_lookup():
                 StorageFormat(LocalPythonStorageEngine, DataFrameFormat),
                 StorageFormat(PostgresStorageEngine, DatabaseTableFormat),
             ),
-            2,
+            1,  # COPY
         ),
         (
             (
@@ -146,6 +192,13 @@ def test_data_copy_lookup():
             ),
             3,  # file -> file obj -> records iter -> db table
         ),
+        (
+            (
+                StorageFormat(LocalFileSystemStorageEngine, DelimitedFileFormat),
+                StorageFormat(PostgresStorageEngine, DatabaseTableFormat),
+            ),
+            1,  # COPY
+        ),
     ],
 )
 def test_conversion_costs(conversion: Conversion, length: Optional[int]):
@@ -157,3 +210,94 @@ def test_conversion_costs(conversion: Conversion, length: Optional[int]):
         # for c in cp.conversions:
         #     print(f"{c.copier.copier_function} {c.conversion}")
         assert len(cp.conversions) == length
+
+
+def test_size_aware_copy_costs():
+    memory = StorageFormat(LocalPythonStorageEngine, RecordsFormat)
+    target = StorageFormat(LocalPythonStorageEngine, DataFrameFormat)
+
+    @datacopy(
+        cost=DataCopyCost(wire_cost=lambda n: 0, memory_cost=lambda n: 2 * n),
+        from_data_formats=[RecordsFormat],
+        to_data_formats=[DataFrameFormat],
+        unregistered=True,
+    )
+    def in_memory(*args):
+        pass
+
+    @datacopy(
+        cost=BufferToBufferCost,
+        from_data_formats=[RecordsFormat],
+        to_data_formats=[RecordsIteratorFormat],
+        unregistered=True,
+    )
+    def to_buffer(*args):
+        pass
+
+    @datacopy(
+        cost=BufferToBufferCost,
+        from_data_formats=[RecordsIteratorFormat],
+        to_data_formats=[DataFrameFormat],
+        unregistered=True,
+    )
+    def from_buffer(*args):
+        pass
+
+    def lowest_cost_copiers(n: int):
+        lkup = get_datacopy_lookup(
+            copiers=[in_memory, to_buffer, from_buffer],
+            available_storage_engines={LocalPythonStorageEngine},
+            available_data_formats=[
+                RecordsFormat,
+                RecordsIteratorFormat,
+                DataFrameFormat,
+            ],
+            expected_record_count=n,
+        )
+        path = lkup.get_lowest_cost_path(Conversion(memory, target))
+        return [e.copier for e in path.conversions]
+
+    assert lowest_cost_copiers(10) == [in_memory]
+    assert lowest_cost_copiers(10 ** 6) == [to_buffer, from_buffer]
+    # Wire costs scale with the byte size of records
+    assert NetworkToMemoryCost.total_cost(100, byte_size=100 * 1000) > (
+        NetworkToMemoryCost.total_cost(100)
+    )
+
+
+def test_copier_calibration():
+    calibrations, cost_per_second = calibrate_copiers(
+        [copy_records_to_db], record_count=50
+    )
+    calibration = calibrations[copy_records_to_db.key]
+    assert calibration.seconds(50, 5000) > 0
+    assert cost_per_second > 0
+    pth = tempfile.mktemp(suffix=".json")
+    save_calibration(pth, {copy_records_to_db.key: CopierCalibration(1, 0, 0)}, 10)
+    lkup = get_datacopy_lookup()
+    try:
+        load_calibration(pth)
+        assert copy_records_to_db.get_cost(10 ** 6) == 10
+        assert get_datacopy_lookup() is not lkup
+    finally:
+        set_copier_calibrations({}, 1.0)
+    assert copy_records_to_db.get_cost(10) == NetworkToMemoryCost.total_cost(10)
+
+
+def test_copier_calibration_cleaned_up(monkeypatch):
+    dirs = []
+
+    def mkdtemp(**kwargs):
+        dirs.append(tempfile.mkdtemp(**kwargs))
+        return dirs[-1]
+
+    monkeypatch.setattr(
+        "snapflow.storage.data_copy.calibration.tempfile",
+        types.SimpleNamespace(mkdtemp=mkdtemp),
+    )
+    entry_count = len(LOCAL_PYTHON_STORAGE)
+    calibrations, _ = calibrate_copiers([copy_records_to_db], record_count=50)
+    assert copy_records_to_db.key in calibrations
+    assert len(dirs) == 1
+    assert not os.path.exists(dirs[0])
+    assert len(LOCAL_PYTHON_STORAGE) == entry_count
@@ -16,7 +16,11 @@ from snapflow.storage.data_copy.base import (
     datacopy,
     get_datacopy_lookup,
 )
-from snapflow.storage.data_copy.database_to_memory import copy_db_to_records
+from snapflow.storage.data_copy.database_to_memory import (
+    copy_db_to_df_iterator,
+    copy_db_to_records,
+    copy_db_to_records_iterator,
+)
 from snapflow.storage.data_copy.memory_to_database import copy_records_to_db
 from snapflow.storage.data_formats import (
     DatabaseCursorFormat,
@@ -34,6 +38,7 @@ from snapflow.storage.data_formats.delimited_file_object import (
 )
 from snapflow.storage.data_records import MemoryDataRecords, as_records
 from snapflow.storage.db.api import DatabaseApi, DatabaseStorageApi
+from snapflow.storage.db.utils import db_result_batcher
 from snapflow.storage.storage import (
     DatabaseStorageClass,
     FileSystemStorageClass,
@@ -80,3 +85,58 @@ def test_db_to_mem(url):
         )
         copy_db_to_records.copy(name, name, conversion, api, mem_api)
         assert list(mem_api.get(name).records_object) == [{"a": 1, "b": 2}]
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "sqlite://",
+        "postgresql://localhost",
+        "mysql://",
+    ],
+)
+def test_db_to_mem_iterators(url):
+    s: Storage = Storage.from_url(url)
+    api_cls: Type[DatabaseApi] = s.storage_engine.get_api_cls()
+    mem_api: PythonStorageApi = new_local_python_storage().get_api()
+    if not s.get_api().dialect_is_supported():
+        return
+    with api_cls.temp_local_database() as db_url:
+        api: DatabaseStorageApi = Storage.from_url(db_url).get_api()
+        api.fetch_size = 2
+        name = "_test"
+        api.execute_sql(f"create table {name} (a integer, b integer)")
+        api.execute_sql(f"insert into {name} values (1, 2), (3, 4), (5, 6)")
+        # Records iterator
+        conversion = Conversion(
+            StorageFormat(s.storage_engine, DatabaseTableFormat),
+            StorageFormat(LocalPythonStorageEngine, RecordsIteratorFormat),
+        )
+        copy_db_to_records_iterator.copy(name, name, conversion, api, mem_api)
+        assert list(mem_api.get(name).records_object) == [
+            [{"a": 1, "b": 2}, {"a": 3, "b": 4}],
+            [{"a": 5, "b": 6}],
+        ]
+        # DataFrame iterator
+        conversion = Conversion(
+            StorageFormat(s.storage_engine, DatabaseTableFormat),
+            StorageFormat(LocalPythonStorageEngine, DataFrameIteratorFormat),
+        )
+        copy_db_to_df_iterator.copy(name, name + "df", conversion, api, mem_api)
+        dfs = list(mem_api.get(name + "df").records_object)
+        assert [len(df) for df in dfs] == [2, 1]
+        assert list(dfs[0]["a"]) == [1, 3]
+        # Preferred by the planner for iterator consumers
+        path = get_datacopy_lookup(
+            available_storage_engines={s.storage_engine, LocalPythonStorageEngine}
+        ).get_lowest_cost_path(conversion)
+        assert [c.copier for c in path.conversions] == [copy_db_to_df_iterator]
+
+
+def test_db_result_batcher():
+    api: DatabaseApi = Storage.from_url("sqlite://").get_api()
+    with api.connection() as conn:
+        conn.execute("create table t as select 1 a union all select 2")
+        batches = list(db_result_batcher(conn.execute("select * from t"), 2))
+    # No trailing empty batch
+    assert batches == [[{"a": 1}, {"a": 2}]]
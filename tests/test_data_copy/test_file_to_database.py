@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import tempfile
+import warnings
+
+from snapflow.storage.data_copy.base import Conversion, StorageFormat
+from snapflow.storage.data_copy.file_to_database import copy_delim_file_to_postgres
+from snapflow.storage.data_formats import DatabaseTableFormat, DelimitedFileFormat
+from snapflow.storage.db.api import DatabaseStorageApi
+from snapflow.storage.db.postgres import PostgresDatabaseApi
+from snapflow.storage.file_system import FileSystemStorageApi
+from snapflow.storage.storage import PostgresStorageEngine, Storage
+from tests.utils import TestSchema4
+
+
+def test_file_to_postgres():
+    if not Storage.from_url("postgresql://localhost").get_api().dialect_is_supported():
+        warnings.warn("Skipping postgres COPY tests (psycopg2 not installed)")
+        return
+    dr = tempfile.gettempdir()
+    s: Storage = Storage.from_url(f"file://{dr}")
+    fs_api: FileSystemStorageApi = s.get_api()
+    name = "_test"
+    fs_api.write_lines_to_file(name, ["f1,f2", "hi,2", '"a,b",', "null,3"])
+    with PostgresDatabaseApi.temp_local_database() as db_url:
+        db_api: DatabaseStorageApi = Storage.from_url(db_url).get_api()
+        conversion = Conversion(
+            StorageFormat(s.storage_engine, DelimitedFileFormat),
+            StorageFormat(PostgresStorageEngine, DatabaseTableFormat),
+        )
+        copy_delim_file_to_postgres.copy(
+            name, name, conversion, fs_api, db_api, schema=TestSchema4
+        )
+        with db_api.execute_sql_result(f"select * from {name}") as res:
+            # Nullish values load as NULL, as they read with `read_csv`
+            assert [dict(r) for r in res] == [
+                {"f1": "hi", "f2": 2},
+                {"f1": "a,b", "f2": None},
+                {"f1": None, "f2": 3},
+            ]
@@ -6,6 +6,7 @@ import warnings
 from io import StringIO
 from typing import Optional, Type
 
+import pandas as pd
 import pytest
 from snapflow.core.data_block import DataBlockMetadata, create_data_block_from_records
 from snapflow.storage.data_copy.base import (
@@ -19,8 +20,12 @@ from snapflow.storage.data_copy.base import (
 )
 from snapflow.storage.data_copy.database_to_memory import copy_db_to_records
 from snapflow.storage.data_copy.memory_to_database import (
+    copy_df_iterator_to_postgres,
+    copy_df_to_postgres,
     copy_records_iterator_to_db,
+    copy_records_iterator_to_postgres,
     copy_records_to_db,
+    copy_records_to_postgres,
 )
 from snapflow.storage.data_formats import (
     DatabaseCursorFormat,
@@ -38,6 +43,12 @@ from snapflow.storage.data_formats.delimited_file_object import (
 )
 from snapflow.storage.data_records import MemoryDataRecords, as_records
 from snapflow.storage.db.api import DatabaseApi, DatabaseStorageApi
+from snapflow.storage.db.postgres import (
+    PostgresDatabaseApi,
+    PostgresDatabaseStorageApi,
+    copy_buffers_from_dataframe,
+    copy_buffers_from_rows,
+)
 from snapflow.storage.storage import (
     DatabaseStorageClass,
     FileSystemStorageClass,
@@ -118,3 +129,103 @@ def test_records_iterator_to_db(url):
         )
         with db_api.execute_sql_result(f"select * from {name}") as res:
             assert [dict(r) for r in res] == records
+
+
+def test_copy_buffers():
+    rows = [
+        ["hi", 1, 1.5, None],
+        ['a,\n"b"', 2.0, float("nan"), ""],
+        ["\\N", 3, 0.0, "x"],
+    ]
+    bufs = list(copy_buffers_from_rows(rows, buffer_size=2))
+    assert [b.read() for b in bufs] == [
+        '"hi","1","1.5",\\N\n"a,\n""b""","2",\\N,""\n',
+        '"\\N","3","0","x"\n',
+    ]
+    assert list(copy_buffers_from_rows([])) == []
+    df = pd.DataFrame(
+        {
+            "f1": ["hi", None, "\\N"],
+            "f2": [1, None, 3],
+            "f3": [{"a": 1}, [], None],
+        }
+    )
+    bufs = list(copy_buffers_from_dataframe(df, ["f1", "f2", "f3"], buffer_size=2))
+    assert "".join(b.read() for b in bufs).splitlines() == [
+        '"hi","1","{""a"": 1}"',
+        '\\N,\\N,"[]"',
+        '"\\N","3",\\N',
+    ]
+
+
+@pytest.mark.parametrize(
+    "obj,fmt,copier",
+    [
+        (records, RecordsFormat, copy_records_to_postgres),
+        (records_itr(), RecordsIteratorFormat, copy_records_iterator_to_postgres),
+        (pd.DataFrame(records), DataFrameFormat, copy_df_to_postgres),
+        (
+            (pd.DataFrame([r]) for r in records),
+            DataFrameIteratorFormat,
+            copy_df_iterator_to_postgres,
+        ),
+    ],
+)
+def test_copy_to_postgres_chunks(monkeypatch, obj, fmt, copier):
+    # Checks what each format hands to COPY, without a postgres server
+    copied = []
+    monkeypatch.setattr(
+        PostgresDatabaseStorageApi,
+        "bulk_copy_records",
+        lambda self, name, chunks, schema: copied.extend(chunks),
+    )
+    monkeypatch.setattr(
+        PostgresDatabaseStorageApi,
+        "bulk_copy_dataframes",
+        lambda self, name, dfs, schema: copied.extend(
+            df.to_dict("records") for df in dfs
+        ),
+    )
+    mem_api: PythonStorageApi = new_local_python_storage().get_api()
+    db_api = Storage.from_url("postgresql://localhost").get_api()
+    mem_api.put("_test", as_records(obj, data_format=fmt))
+    conversion = Conversion(
+        StorageFormat(LocalPythonStorageEngine, fmt),
+        StorageFormat(PostgresStorageEngine, DatabaseTableFormat),
+    )
+    assert get_datacopy_lookup().get_lowest_cost(conversion) is copier
+    copier.copy("_test", "_test", conversion, mem_api, db_api, schema=TestSchema4)
+    assert [r for chunk in copied for r in chunk] == records
+
+
+def test_copy_to_postgres():
+    if not Storage.from_url("postgresql://localhost").get_api().dialect_is_supported():
+        warnings.warn("Skipping postgres COPY tests (psycopg2 not installed)")
+        return
+    mem_api: PythonStorageApi = new_local_python_storage().get_api()
+    with PostgresDatabaseApi.temp_local_database() as db_url:
+        db_api: DatabaseStorageApi = Storage.from_url(db_url).get_api()
+        for name, obj, fmt, copier in [
+            ("_test_records", records, RecordsFormat, copy_records_to_postgres),
+            (
+                "_test_records_itr",
+                records_itr(),
+                RecordsIteratorFormat,
+                copy_records_iterator_to_postgres,
+            ),
+            ("_test_df", pd.DataFrame(records), DataFrameFormat, copy_df_to_postgres),
+            (
+                "_test_df_itr",
+                (pd.DataFrame([r]) for r in records),
+                DataFrameIteratorFormat,
+                copy_df_iterator_to_postgres,
+            ),
+        ]:
+            mem_api.put(name, as_records(obj, data_format=fmt))
+            conversion = Conversion(
+                StorageFormat(LocalPythonStorageEngine, fmt),
+                StorageFormat(PostgresStorageEngine, DatabaseTableFormat),
+            )
+            copier.copy(name, name, conversion, mem_api, db_api, schema=TestSchema4)
+            with db_api.execute_sql_result(f"select * from {name}") as res:
+                assert [dict(r) for r in res] == records
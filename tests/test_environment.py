@@ -2,6 +2,14 @@ from __future__ import annotations
 
 from snapflow.core.environment import Environment
 from snapflow.core.graph import Graph
+from snapflow.core.metadata.migrations import (
+    LATEST_VERSION,
+    MIGRATIONS,
+    get_metadata_version,
+)
+from snapflow.core.metadata.orm import SNAPFLOW_METADATA_TABLE_PREFIX
+from snapflow.storage.db.utils import get_tmp_sqlite_db_url
+from sqlalchemy import inspect
 
 
 def test_env_init():
@@ -22,3 +30,28 @@ def test_env_init():
         env.add_storage("postgresql://test")
         assert len(env.storages) == 2  # added plus default local memory
         assert len(env.runtimes) == 3  # added plus default local python # TODO
+
+
+def test_metadata_migrations():
+    db_url = get_tmp_sqlite_db_url()
+    env = Environment(metadata_storage=db_url)
+    engine = env.Session.kw["bind"]
+    assert get_metadata_version(engine) == LATEST_VERSION
+    # Simulate a database from before the migrations
+    engine.execute(f"delete from {SNAPFLOW_METADATA_TABLE_PREFIX}metadata_version")
+    engine.execute(
+        f"drop index ix_{SNAPFLOW_METADATA_TABLE_PREFIX}pipe_log_node_started"
+    )
+    engine.execute(f"alter table {SNAPFLOW_METADATA_TABLE_PREFIX}pipe_log drop timings")
+    env = Environment(metadata_storage=db_url, auto_upgrade_metadata=False)
+    assert get_metadata_version(engine) is None
+    applied = env.upgrade_metadata()
+    assert [m.version for m in applied] == [m.version for m in MIGRATIONS]
+    inspector = inspect(engine)
+    table = f"{SNAPFLOW_METADATA_TABLE_PREFIX}pipe_log"
+    assert "timings" in [c["name"] for c in inspector.get_columns(table)]
+    assert f"ix_{SNAPFLOW_METADATA_TABLE_PREFIX}pipe_log_node_started" in [
+        ix["name"] for ix in inspector.get_indexes(table)
+    ]
+    # Up to date
+    assert env.upgrade_metadata() == []
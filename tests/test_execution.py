@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from threading import Event
 from typing import Optional
 
 import pytest
@@ -12,27 +13,35 @@ from snapflow.core.execution import (
     ExecutionSession,
     Worker,
 )
+from snapflow.core.execution_spec import (
+    ExecutionSpec,
+    PipeSpec,
+    SpecSerializationError,
+)
 from snapflow.core.graph import Graph
+from snapflow.core.node import DataBlockLog, Direction, PipeLog
+from snapflow.core.pipe import pipe_factory
 from snapflow.core.pipe_interface import NodeInterfaceManager
+from snapflow.core.scheduler import BlockChannel, GraphScheduler
 from snapflow.modules import core
-from snapflow.storage.data_formats import Records
+from snapflow.storage.data_formats import Records, RecordsIterator
+from snapflow.storage.db.utils import get_tmp_sqlite_db_url
+from sqlalchemy.exc import OperationalError
 from tests.utils import (
     TestSchema1,
     TestSchema4,
     make_test_env,
+    make_test_graph_context,
     make_test_run_context,
+    mock_dl_output,
+    pipe_dl_source,
     pipe_generic,
+    pipe_passthrough,
     pipe_t1_sink,
     pipe_t1_source,
     pipe_t1_to_t2,
 )
 
-mock_dl_output = [{"f1": "2"}, {"f2": 3}]
-
-
-def pipe_dl_source() -> Records[TestSchema4]:
-    return mock_dl_output
-
 
 def pipe_error() -> Records[TestSchema4]:
     raise Exception("pipe FAIL")
@@ -105,3 +114,313 @@ def test_non_terminating_pipe():
     em = ExecutionManager(ec)
     output = em.execute(node, to_exhaustion=True)
     assert output is None
+
+
+def test_parallel_scheduler():
+    env = make_test_env(metadata_storage=get_tmp_sqlite_db_url())
+    g = Graph(env)
+    sources = [
+        g.create_node(key=f"source{i}", pipe=pipe_dl_source, output_alias=f"out{i}")
+        for i in range(4)
+    ]
+    sink = g.create_node(key="sink", pipe=pipe_t1_sink, upstream="source0")
+    rt = env.runtimes[0]
+    ec = env.get_run_context(g, current_runtime=rt, target_storage=rt.as_storage())
+    em = ExecutionManager(ec)
+    assert GraphScheduler(em).get_dependencies(sources + [sink])["sink"] == {"source0"}
+    outputs = em.execute_many(
+        g.get_all_nodes_in_execution_order(), to_exhaustion=True, max_workers=4
+    )
+    assert set(outputs) == {"source0", "source1", "source2", "source3", "sink"}
+    assert outputs["sink"] is None
+    with env.session_scope() as sess:
+        for i in range(4):
+            assert outputs[f"source{i}"] is not None
+            assert (
+                sess.query(Alias).filter(Alias.alias == f"out{i}").first().data_block_id
+                == sess.merge(outputs[f"source{i}"]).id
+            )
+        assert (
+            sess.query(PipeLog).filter(PipeLog.node_key == "sink").first() is not None
+        )
+
+
+def test_execution_spec_roundtrip():
+    env = make_test_env(metadata_storage=get_tmp_sqlite_db_url())
+    storage_url = get_tmp_sqlite_db_url()
+    g = Graph(env)
+    source = g.create_node(key="source", pipe=pipe_dl_source, config={"a": 1})
+    g.create_node(key="sink", pipe=pipe_t1_sink, upstream="source")
+    ec = env.get_run_context(g, target_storage=storage_url)
+    spec = ec.to_spec(source, to_exhaustion=True)
+    assert ExecutionSpec.from_json(spec.to_json()) == spec
+    assert spec.target_storage_url == storage_url
+    assert [n.key for n in spec.nodes] == ["source", "sink"]
+    assert spec.nodes[1].upstream == {"input": ["source"]}
+    env2, g2 = spec.build_environment()
+    assert g2.get_metadata_obj().hash == g.get_metadata_obj().hash
+    assert g2.get_node("source").pipe.pipe_callable is pipe_dl_source
+    assert g2.get_node("source").config == {"a": 1}
+    assert env2.get_schema("TestSchema4", None) == TestSchema4
+
+
+def test_execution_spec_requires_shared_storages():
+    env = make_test_env()
+    g = Graph(env)
+    node = g.create_node(key="source", pipe=pipe_dl_source)
+    with pytest.raises(SpecSerializationError):
+        env.get_run_context(g, target_storage=get_tmp_sqlite_db_url()).to_spec(node)
+
+
+def test_process_pool_scheduler():
+    env = make_test_env(metadata_storage=get_tmp_sqlite_db_url())
+    g = Graph(env)
+    for i in range(2):
+        g.create_node(key=f"source{i}", pipe=pipe_dl_source, output_alias=f"out{i}")
+    ec = env.get_run_context(g, target_storage=get_tmp_sqlite_db_url())
+    em = ExecutionManager(ec)
+    outputs = em.execute_many(
+        g.get_all_nodes_in_execution_order(),
+        to_exhaustion=True,
+        max_workers=2,
+        executor="process",
+    )
+    with env.session_scope() as sess:
+        for i in range(2):
+            block = sess.merge(outputs[f"source{i}"])
+            assert block.record_count == len(mock_dl_output)
+            assert (
+                sess.query(Alias).filter(Alias.alias == f"out{i}").first().data_block_id
+                == block.id
+            )
+            mdb = block.as_managed_data_block(ec, sess)
+            assert len(mdb.as_records()) == len(mock_dl_output)
+
+
+def test_batched_execution():
+    env = make_test_env()
+    g = Graph(env)
+    rt = env.runtimes[0]
+    ec = env.get_run_context(g, current_runtime=rt, target_storage=rt.as_storage())
+    source = g.create_node(key="source", pipe=pipe_dl_source)
+    batched = g.create_node(
+        key="batched", pipe=pipe_t1_sink, upstream="source", batch_size=2
+    )
+    em = ExecutionManager(ec)
+    for _ in range(3):
+        em.execute(source)
+    worker = Worker(ec.clone(current_runtime=rt))
+    results = em._execute(batched, worker)
+    assert len(results) == 2
+    assert all(r.input_blocks_processed == {"input": 1} for r in results)
+    em.execute(batched, to_exhaustion=True)
+    with env.session_scope() as sess:
+        pipe_logs = sess.query(PipeLog).filter(PipeLog.node_key == "batched").all()
+        assert len(pipe_logs) == 3
+        input_block_ids = [
+            dbl.data_block_id
+            for pl in pipe_logs
+            for dbl in pl.data_block_logs
+            if dbl.direction == Direction.INPUT
+        ]
+        assert len(set(input_block_ids)) == 3
+
+
+@pytest.mark.parametrize("idempotent", [True, False])
+def test_retry_on_busy_only_idempotent(monkeypatch, idempotent: bool):
+    env = make_test_env()
+    g = Graph(env)
+    rt = env.runtimes[0]
+    ec = env.get_run_context(g, current_runtime=rt)
+    pipe = pipe_factory(pipe_dl_source, idempotent=idempotent)
+    assert PipeSpec.from_pipe(pipe).as_pipe().idempotent == idempotent
+    source = g.create_node(key="source", pipe=pipe)
+    calls = []
+    execute = Worker.execute
+
+    def busy_once(self, executable):
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationalError("COMMIT", {}, Exception("database is locked"))
+        return execute(self, executable)
+
+    monkeypatch.setattr(Worker, "execute", busy_once)
+    worker = Worker(ec)
+    if idempotent:
+        results = ExecutionManager(ec)._execute(source, worker)
+        assert results[0].output_block is not None
+        assert len(calls) == 2
+    else:
+        # Not re-run, that would repeat its side effects
+        with pytest.raises(OperationalError):
+            ExecutionManager(ec)._execute(source, worker)
+        assert len(calls) == 1
+
+
+@pytest.mark.parametrize("to_exhaustion,n_produced", [(True, 4), (False, 1)])
+def test_pipelined_scheduler(to_exhaustion: bool, n_produced: int):
+    env = make_test_env(metadata_storage=get_tmp_sqlite_db_url())
+    g = Graph(env)
+    rt = env.runtimes[0]
+    ec = env.get_run_context(g, current_runtime=rt, target_storage=rt.as_storage())
+    source = g.create_node(key="source", pipe=pipe_dl_source)
+    g.create_node(key="passthrough", pipe=pipe_passthrough, upstream="source")
+    g.create_node(key="sink", pipe=pipe_t1_sink, upstream="passthrough")
+    em = ExecutionManager(ec)
+    for _ in range(3):
+        em.execute(source)
+    outputs = em.execute_many(
+        g.get_all_nodes_in_execution_order(),
+        to_exhaustion=to_exhaustion,
+        max_workers=3,
+        pipelined=True,
+    )
+    assert outputs["passthrough"] is not None
+    with env.session_scope() as sess:
+        processed = (
+            sess.query(DataBlockLog)
+            .join(PipeLog)
+            .filter(
+                PipeLog.node_key == "sink", DataBlockLog.direction == Direction.INPUT
+            )
+            .count()
+        )
+        produced = (
+            sess.query(DataBlockLog)
+            .join(PipeLog)
+            .filter(
+                PipeLog.node_key == "passthrough",
+                DataBlockLog.direction == Direction.OUTPUT,
+            )
+            .count()
+        )
+    # Without `to_exhaustion` each node runs once
+    assert produced == n_produced
+    assert processed == produced
+
+
+streamed_handoffs = []
+streamed_block_received = Event()
+
+
+def pipe_streamed_source() -> RecordsIterator[TestSchema4]:
+    for i in range(3):
+        yield [{"f1": str(i)}]
+        # Downstream gets each block while we are still producing
+        streamed_handoffs.append(streamed_block_received.wait(timeout=10))
+
+
+def pipe_streamed_passthrough(input: DataBlock[TestSchema4]) -> Records[TestSchema4]:
+    streamed_block_received.set()
+    return input.as_records()
+
+
+def test_pipelined_generator_handoff():
+    env = make_test_env(metadata_storage=get_tmp_sqlite_db_url())
+    g = Graph(env)
+    rt = env.runtimes[0]
+    ec = env.get_run_context(g, current_runtime=rt, target_storage=rt.as_storage())
+    g.create_node(key="source", pipe=pipe_streamed_source)
+    g.create_node(key="passthrough", pipe=pipe_streamed_passthrough, upstream="source")
+    g.create_node(key="sink", pipe=pipe_t1_sink, upstream="passthrough")
+    em = ExecutionManager(ec)
+    # Fewer workers than nodes, the sink starts once the source is done
+    em.execute_many(
+        g.get_all_nodes_in_execution_order(),
+        to_exhaustion=True,
+        max_workers=2,
+        pipelined=True,
+    )
+    assert streamed_handoffs == [True, True, True]
+    with env.session_scope() as sess:
+        outputs = (
+            sess.query(DataBlockLog)
+            .join(PipeLog)
+            .filter(
+                PipeLog.node_key == "passthrough",
+                DataBlockLog.direction == Direction.OUTPUT,
+            )
+            .count()
+        )
+        processed = (
+            sess.query(DataBlockLog)
+            .join(PipeLog)
+            .filter(
+                PipeLog.node_key == "sink", DataBlockLog.direction == Direction.INPUT
+            )
+            .count()
+        )
+    # One block per yielded object
+    assert outputs == 3
+    assert processed == 3
+
+
+def test_block_channel_backpressure():
+    channel = BlockChannel(n_producers=1, maxsize=1)
+    # Consumer not running yet, producers never block
+    channel.put("a")
+    channel.put("b")
+    assert channel.queue.full()
+    channel.open()
+    channel.close()
+    # Closed channels drop items rather than block producers
+    channel.put("c")
+    assert channel.wait_for_items() == ["a"]
+    assert not channel.producers_done()
+    channel.producer_done()
+    assert channel.producers_done()
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_fused_python_chain(in_memory: bool):
+    env, g, ec = make_test_graph_context(
+        fuse_python_chains=True, fused_python_in_memory=in_memory
+    )
+    target_url = ec.target_storage.url
+    g.create_node(key="source", pipe=pipe_dl_source)
+    g.create_node(key="step1", pipe=pipe_passthrough, upstream="source")
+    g.create_node(key="step2", pipe=pipe_passthrough, upstream="step1")
+    assert g.get_fusable_python_chains() == [["source", "step1", "step2"]]
+    em = ExecutionManager(ec)
+    outputs = em.execute_many(g.get_all_nodes_in_execution_order(), to_exhaustion=True)
+    with env.session_scope() as sess:
+        for key in ("source", "step1"):
+            block = sess.merge(outputs[key])
+            urls = [sdb.storage_url for sdb in block.stored_data_blocks]
+            assert ec.local_python_storage.url in urls
+            # Intermediates are persisted unless kept in memory only (still logged)
+            assert (target_url in urls) != in_memory
+        tail = sess.merge(outputs["step2"])
+        assert target_url in [sdb.storage_url for sdb in tail.stored_data_blocks]
+        mdb = tail.as_managed_data_block(ec, sess)
+        assert len(mdb.as_records()) == len(mock_dl_output)
+        assert (
+            sess.query(PipeLog).filter(PipeLog.node_key.in_(["step1", "step2"])).count()
+            == 2
+        )
+
+
+@pytest.mark.parametrize("materialize", ["lazy", "never"])
+def test_lazy_materialization(materialize: str):
+    env, g, ec = make_test_graph_context()
+    target_url = ec.target_storage.url
+    g.create_node(key="source", pipe=pipe_dl_source, materialize=materialize)
+    g.create_node(key="passthrough", pipe=pipe_passthrough, upstream="source")
+    em = ExecutionManager(ec)
+    outputs = em.execute_many(g.get_all_nodes_in_execution_order(), to_exhaustion=True)
+    assert len(ec.pending_materializations) == 0
+    with env.session_scope() as sess:
+        source = sess.merge(outputs["source"])
+        urls = set(sdb.storage_url for sdb in source.stored_data_blocks)
+        assert ec.local_python_storage.url in urls
+        # Lazy outputs are copied to the target storage at the end of the run
+        assert (target_url in urls) == (materialize == "lazy")
+        passthrough = sess.merge(outputs["passthrough"])
+        assert target_url in [sdb.storage_url for sdb in passthrough.stored_data_blocks]
+
+
+def test_bad_materialize_option():
+    env = make_test_env()
+    g = Graph(env)
+    with pytest.raises(ValueError):
+        g.create_node(key="source", pipe=pipe_dl_source, materialize="sometimes")
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+import pytest
+from snapflow.core.data_block import DataBlock, DataBlockMetadata
+from snapflow.core.execution import ExecutionManager
+from snapflow.core.gc import DataBlockLogSummary, RetentionPolicy
+from snapflow.core.graph import Graph
+from snapflow.core.node import DataBlockLog
+from snapflow.storage.data_formats import Records
+from snapflow.storage.db.utils import get_tmp_sqlite_db_url
+from snapflow.storage.storage import clear_local_storage
+from sqlalchemy import inspect
+from tests.utils import TestSchema4, make_test_env
+
+
+def pipe_source() -> Records[TestSchema4]:
+    return [{"f1": "1", "f2": 2}]
+
+
+def pipe_passthrough(input: DataBlock[TestSchema4]) -> Records[TestSchema4]:
+    return input.as_records()
+
+
+def test_retention_policy_validation():
+    with pytest.raises(ValueError):
+        RetentionPolicy()
+    with pytest.raises(ValueError):
+        RetentionPolicy(keep_latest=-1)
+
+
+def test_garbage_collection():
+    env = make_test_env()
+    g = Graph(env)
+    target_url = get_tmp_sqlite_db_url()
+    target = env.add_storage(target_url)
+    ec = env.get_run_context(g, target_storage=target)
+    source = g.create_node(key="source", pipe=pipe_source)
+    sink = g.create_node(key="sink", pipe=pipe_passthrough, upstream="source")
+    em = ExecutionManager(ec)
+    block_ids = [inspect(em.execute_to_output(source)).identity[0] for _ in range(4)]
+    # Only the first block is processed downstream
+    em.execute(sink)
+
+    with env.session_scope() as sess:
+        block = sess.query(DataBlockMetadata).get(block_ids[0])
+        table_names = [
+            sdb.get_name()
+            for sdb in block.stored_data_blocks
+            if sdb.storage_url == target_url
+        ]
+    assert len(table_names) == 1
+    assert target.get_api().exists(table_names[0])
+
+    policies = {"source": RetentionPolicy(keep_latest=1)}
+    result = env.collect_garbage(g, node_policies=policies, dry_run=True)
+    assert result.deleted_block_ids == [block_ids[0]]
+    with env.session_scope() as sess:
+        assert not sess.query(DataBlockMetadata).get(block_ids[0]).deleted
+
+    result = env.collect_garbage(g, node_policies=policies)
+    assert result.deleted_block_ids == [block_ids[0]]
+    # Output and input logs of the block
+    assert result.compacted_log_count == 2
+    with env.session_scope() as sess:
+        block = sess.query(DataBlockMetadata).get(block_ids[0])
+        assert block.deleted
+        assert block.stored_data_blocks.count() == 0
+        assert (
+            sess.query(DataBlockLog)
+            .filter(DataBlockLog.data_block_id == block_ids[0])
+            .count()
+            == 0
+        )
+        assert sum(s.log_count for s in sess.query(DataBlockLogSummary)) == 2
+        for block_id in block_ids[1:]:
+            assert not sess.query(DataBlockMetadata).get(block_id).deleted
+    assert not target.get_api().exists(table_names[0])
+
+    # Once processed, the rest (but the latest) are collected
+    em.execute(sink, to_exhaustion=True)
+    result = env.collect_garbage(g, node_policies=policies)
+    assert sorted(result.deleted_block_ids) == sorted(block_ids[1:3])
+    # TTL: nothing old enough yet
+    result = env.collect_garbage(
+        g, default_policy=RetentionPolicy(max_age=timedelta(days=1))
+    )
+    assert result.deleted_block_ids == []
+
+
+def test_dead_memory_blocks_removed_at_startup():
+    metadata_url = get_tmp_sqlite_db_url()
+    env = make_test_env(metadata_storage=metadata_url)
+    g = Graph(env)
+    source = g.create_node(key="source", pipe=pipe_source)
+    em = ExecutionManager(env.get_run_context(g))
+    block_id = inspect(em.execute_to_output(source)).identity[0]
+
+    # Still held by this process
+    env = make_test_env(metadata_storage=metadata_url, remove_dead_memory_blocks=True)
+    with env.session_scope() as sess:
+        assert not sess.query(DataBlockMetadata).get(block_id).deleted
+
+    clear_local_storage()
+    # Off by default, the block may belong to another live process
+    env = make_test_env(metadata_storage=metadata_url)
+    with env.session_scope() as sess:
+        assert not sess.query(DataBlockMetadata).get(block_id).deleted
+    env = make_test_env(metadata_storage=metadata_url, remove_dead_memory_blocks=True)
+    with env.session_scope() as sess:
+        block = sess.query(DataBlockMetadata).get(block_id)
+        assert block.deleted
+        assert block.stored_data_blocks.count() == 0
+
+
+def test_latest_output_kept_regardless_of_id_order(monkeypatch):
+    env = make_test_env()
+    g = Graph(env)
+    ec = env.get_run_context(g, target_storage=env.add_storage(get_tmp_sqlite_db_url()))
+    source = g.create_node(key="source", pipe=pipe_source)
+    em = ExecutionManager(ec)
+    # Ids of other processes need not sort by time
+    descending_ids = (f"{i:03}" for i in range(999, 0, -1))
+    monkeypatch.setattr(
+        "snapflow.core.data_block.timestamp_increment_key",
+        lambda: next(descending_ids),
+    )
+    block_ids = [inspect(em.execute_to_output(source)).identity[0] for _ in range(3)]
+    assert block_ids == sorted(block_ids, reverse=True)
+    result = env.collect_garbage(
+        g, node_policies={"source": RetentionPolicy(keep_latest=1)}
+    )
+    assert sorted(result.deleted_block_ids) == sorted(block_ids[:2])
+
+
+def test_python_blocks_collected_by_policy():
+    env = make_test_env()
+    g = Graph(env)
+    source = g.create_node(key="source", pipe=pipe_source)
+    g.create_node(key="sink", pipe=pipe_passthrough, upstream="source")
+    em = ExecutionManager(env.get_run_context(g))
+    block_ids = [inspect(em.execute_to_output(source)).identity[0] for _ in range(3)]
+    # Records gone (eg stored by another process)
+    clear_local_storage()
+    # Not processed downstream yet, so kept
+    result = env.collect_garbage(g, default_policy=RetentionPolicy(keep_latest=1))
+    assert result.deleted_block_ids == []
+    with env.session_scope() as sess:
+        for block_id in block_ids:
+            block = sess.query(DataBlockMetadata).get(block_id)
+            assert not block.deleted
+            assert block.stored_data_blocks.count() == 1
+
+
+def test_memoized_output_kept_for_all_producers_consumers():
+    env = make_test_env()
+    g = Graph(env)
+    ec = env.get_run_context(
+        g,
+        target_storage=env.add_storage(get_tmp_sqlite_db_url()),
+        memoize_outputs=True,
+    )
+    source = g.create_node(key="source", pipe=pipe_source)
+    n1 = g.create_node(key="n1", pipe=pipe_passthrough, upstream="source")
+    n2 = g.create_node(key="n2", pipe=pipe_passthrough, upstream="source")
+    g.create_node(key="sink", pipe=pipe_passthrough, upstream="n2")
+    em = ExecutionManager(ec)
+    block_ids = []
+    for _ in range(2):
+        em.execute(source)
+        block_ids.append(inspect(em.execute_to_output(n1)).identity[0])
+        # Same output as n1, from the cache
+        assert inspect(em.execute_to_output(n2)).identity[0] == block_ids[-1]
+    # Not yet processed by the sink, downstream of n2 (not of n1, its creator)
+    policies = {"n1": RetentionPolicy(keep_latest=1)}
+    result = env.collect_garbage(g, node_policies=policies)
+    assert result.deleted_block_ids == []
+    em.execute(g.get_node("sink"), to_exhaustion=True)
+    result = env.collect_garbage(g, node_policies=policies)
+    assert result.deleted_block_ids == [block_ids[0]]
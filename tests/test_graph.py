@@ -92,3 +92,56 @@ def test_make_graph():
     for ordering in expected_orderings:
         for i, n in enumerate(ordering[:-1]):
             assert execution_order.index(n) < execution_order.index(ordering[i + 1])
+
+
+def test_execution_plan_cached_and_invalidated():
+    g = make_graph()
+    plan = g.get_execution_plan()
+    assert g.get_execution_plan() is plan
+    assert g.get_metadata_obj().hash == plan.hash
+    assert plan.upstream_in_execution_order("node7") == (
+        "node2",
+        "node4",
+        "node1",
+        "node3",
+        "node7",
+    )
+    g.create_node(key="node8", pipe=pipe_t1_to_t2, upstream="node1")
+    new_plan = g.get_execution_plan()
+    assert new_plan is not plan
+    assert new_plan.hash != plan.hash
+    assert "node8" in new_plan.execution_order
+    g.remove_node(g.get_node("node8"))
+    assert g.get_execution_plan().hash == plan.hash
+
+
+def test_upstream_dependencies_diamond_chain():
+    env = make_test_env()
+    g = Graph(env)
+    g.create_node(key="d0_a", pipe=pipe_t1_source)
+    prev = "d0_a"
+    depth = 40
+    for i in range(1, depth):
+        # Each layer is a diamond of two nodes depending on the previous layer
+        g.create_node(key=f"d{i}_a", pipe=pipe_generic, upstream=prev)
+        g.create_node(
+            key=f"d{i}_b",
+            pipe=pipe_multiple_input,
+            upstream={"input": prev, "other_t2": f"d{i}_a"},
+        )
+        prev = f"d{i}_b"
+    deps = g.get_all_upstream_dependencies_in_execution_order(g.get_node(prev))
+    assert len(deps) == 2 * depth - 1
+    assert deps[0].key == "d0_a"
+    assert deps[-1].key == prev
+
+
+def test_fusable_python_chains():
+    g = make_graph()
+    chains = g.get_fusable_python_chains()
+    assert sorted(chains) == [["node1", "node3"], ["node2", "node4"]]
+    # Restricting to a subset of nodes breaks chains at the boundary
+    assert g.get_fusable_python_chains(["node2", "node4", "node5"]) == [
+        ["node2", "node4"]
+    ]
+    assert g.get_fusable_python_chains(["node1"]) == []
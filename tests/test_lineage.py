@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from typing import List, Tuple
+
+import pytest
+from snapflow.core.data_block import DataBlock, DataBlockMetadata
+from snapflow.core.environment import Environment
+from snapflow.core.execution import ExecutionManager
+from snapflow.core.graph import Graph
+from snapflow.core.lineage import BlockLineage, build_block_lineage
+from snapflow.storage.db.utils import get_tmp_sqlite_db_url
+from sqlalchemy import inspect
+from tests.utils import (
+    TestSchema4,
+    make_test_env,
+    make_test_graph_context,
+    pipe_dl_source,
+    pipe_passthrough,
+)
+
+
+def test_block_lineage():
+    env, g, ec = make_test_graph_context()
+    g.create_node(key="source", pipe=pipe_dl_source)
+    g.create_node(key="step1", pipe=pipe_passthrough, upstream="source")
+    g.create_node(key="step2", pipe=pipe_passthrough, upstream="step1")
+    em = ExecutionManager(ec)
+    outputs = em.execute_many(g.get_all_nodes_in_execution_order(), to_exhaustion=True)
+    source_id, step1_id, step2_id = [
+        inspect(outputs[k]).identity[0] for k in ("source", "step1", "step2")
+    ]
+    assert [b.id for b in env.block_ancestors(step2_id)] == [step1_id, source_id]
+    assert [b.id for b in env.block_ancestors(step2_id, max_depth=1)] == [step1_id]
+    assert [b.id for b in env.block_descendants(source_id)] == [step1_id, step2_id]
+    assert env.block_descendants(step2_id) == []
+    # Rebuilt from the log
+    with env.session_scope() as sess:
+        rows = set(
+            (r.ancestor_block_id, r.descendant_block_id, r.depth)
+            for r in sess.query(BlockLineage)
+        )
+        assert len(rows) == 3
+        sess.query(BlockLineage).delete()
+        build_block_lineage(sess.connection())
+        rebuilt = set(
+            (r.ancestor_block_id, r.descendant_block_id, r.depth)
+            for r in sess.query(BlockLineage)
+        )
+        assert rebuilt == rows
+
+
+generator_calls = []
+generator_fails = False
+
+
+def pipe_generator(input: DataBlock[TestSchema4]):
+    generator_calls.append(input.data_block_id)
+    for i in range(3):
+        if i == 1 and len(generator_calls) == 1 and generator_fails:
+            raise Exception("generator FAIL")
+        yield [{"f1": str(i)}]
+
+
+def make_generator_graph(
+    fails: bool,
+) -> Tuple[Environment, Graph, ExecutionManager, str]:
+    global generator_fails
+    generator_fails = fails
+    generator_calls.clear()
+    env = make_test_env(metadata_storage=get_tmp_sqlite_db_url())
+    g = Graph(env)
+    ec = env.get_run_context(g, target_storage=get_tmp_sqlite_db_url())
+    source = g.create_node(key="source", pipe=pipe_dl_source)
+    g.create_node(key="generator", pipe=pipe_generator, upstream="source")
+    g.create_node(key="passthrough", pipe=pipe_passthrough, upstream="generator")
+    em = ExecutionManager(ec)
+    source_id = inspect(em.execute_to_output(source)).identity[0]
+    return env, g, em, source_id
+
+
+def run_generator_graph(g: Graph, em: ExecutionManager):
+    # Pipelined, so each yielded block is committed and handed off as its own
+    nodes = [g.get_node("generator"), g.get_node("passthrough")]
+    em.execute_many(nodes, to_exhaustion=True, max_workers=2, pipelined=True)
+
+
+def get_generator_outputs(env: Environment) -> List[str]:
+    with env.session_scope() as sess:
+        return [
+            b.id
+            for b in sess.query(DataBlockMetadata).filter(
+                DataBlockMetadata.created_by_node_key == "generator"
+            )
+        ]
+
+
+def test_streamed_output_lineage():
+    env, g, em, source_id = make_generator_graph(fails=False)
+    run_generator_graph(g, em)
+    # Input processed once, every yielded block descends from it
+    assert generator_calls == [source_id]
+    outputs = get_generator_outputs(env)
+    assert len(outputs) == 3
+    for block_id in outputs:
+        assert [b.id for b in env.block_ancestors(block_id)] == [source_id]
+
+
+def test_streamed_output_failure_retried():
+    env, g, em, source_id = make_generator_graph(fails=True)
+    with pytest.raises(Exception):
+        run_generator_graph(g, em)
+    # Blocks yielded before the failure are kept, but the input is unprocessed
+    assert len(get_generator_outputs(env)) == 1
+    run_generator_graph(g, em)
+    assert generator_calls == [source_id, source_id]
+    assert len(get_generator_outputs(env)) == 4
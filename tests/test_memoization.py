@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from snapflow.core.data_block import DataBlock
+from snapflow.core.execution import ExecutionManager, PipeContext
+from snapflow.core.memoization import OutputCacheEntry
+from snapflow.storage.data_formats import Records
+from tests.utils import TestSchema4, make_test_graph_context, pipe_dl_source
+
+passthrough_calls = []
+
+
+def pipe_counted_passthrough(input: DataBlock[TestSchema4]) -> Records[TestSchema4]:
+    passthrough_calls.append(input.data_block_id)
+    return input.as_records()
+
+
+def pipe_counted_stateful_passthrough(
+    ctx: PipeContext, input: DataBlock[TestSchema4]
+) -> Records[TestSchema4]:
+    passthrough_calls.append(input.data_block_id)
+    ctx.emit_state_value("calls", ctx.get_state_value("calls", 0) + 1)
+    return input.as_records()
+
+
+def test_memoized_outputs():
+    env, g, ec = make_test_graph_context(memoize_outputs=True)
+    source = g.create_node(key="source", pipe=pipe_dl_source)
+    n1 = g.create_node(key="n1", pipe=pipe_counted_passthrough, upstream="source")
+    n2 = g.create_node(key="n2", pipe=pipe_counted_passthrough, upstream="source")
+    n3 = g.create_node(
+        key="n3", pipe=pipe_counted_passthrough, upstream="source", config={"a": 1}
+    )
+    n4 = g.create_node(
+        key="n4",
+        pipe=pipe_counted_passthrough,
+        upstream="source",
+        schema_translation={"f1": "f2"},
+    )
+    n5 = g.create_node(
+        key="n5", pipe=pipe_counted_stateful_passthrough, upstream="source"
+    )
+    n6 = g.create_node(
+        key="n6", pipe=pipe_counted_stateful_passthrough, upstream="source"
+    )
+    em = ExecutionManager(ec)
+    em.execute(source)
+    passthrough_calls.clear()
+    with env.session_scope() as sess:
+        out1 = em.execute(n1, output_session=sess)
+        out2 = em.execute(n2, output_session=sess)
+        assert len(passthrough_calls) == 1
+        assert out1.data_block_id == out2.data_block_id
+        assert sess.query(OutputCacheEntry).count() == 1
+        # Different config, different key
+        out3 = em.execute(n3, output_session=sess)
+        assert len(passthrough_calls) == 2
+        assert out3.data_block_id != out1.data_block_id
+        # Different schema translation, different key
+        out4 = em.execute(n4, output_session=sess)
+        assert len(passthrough_calls) == 3
+        assert out4.data_block_id != out1.data_block_id
+        # Pipes taking a context may update state, never memoized
+        em.execute(n5)
+        em.execute(n6)
+        assert len(passthrough_calls) == 5
+        assert n6.get_state(sess) == {"calls": 1}
+        assert sess.query(OutputCacheEntry).count() == 3
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import pytest
+from snapflow.core.execution import ExecutionManager
+from snapflow.core.metadata.writer import get_metadata_writer
+from snapflow.core.node import DataBlockLog, Direction, NodeBlockIndex
+from sqlalchemy import inspect
+from tests.utils import make_test_graph_context, pipe_dl_source, pipe_t1_sink
+
+
+def test_buffered_data_block_logs():
+    env, g, ec = make_test_graph_context()
+    source = g.create_node(key="source", pipe=pipe_dl_source)
+    sink = g.create_node(key="sink", pipe=pipe_t1_sink, upstream="source")
+    block = ExecutionManager(ec).execute_to_output(source)
+    block_id = inspect(block).identity[0]
+    with env.session_scope() as sess:
+        with ec.start_pipe_log(sink, sess) as execution_session:
+            execution_session.log_input(sess.merge(block))
+        # Buffered until commit
+        assert (
+            sess.query(DataBlockLog)
+            .filter(DataBlockLog.direction == Direction.INPUT)
+            .count()
+            == 0
+        )
+    with env.session_scope() as sess:
+        dbls = (
+            sess.query(DataBlockLog)
+            .filter(DataBlockLog.direction == Direction.INPUT)
+            .all()
+        )
+        assert len(dbls) == 1
+        assert dbls[0].pipe_log.node_key == "sink"
+        assert dbls[0].data_block_id == block_id
+        assert sess.query(NodeBlockIndex).get(("sink", block_id, Direction.INPUT))
+    # Discarded on rollback
+    with pytest.raises(Exception):
+        with env.session_scope() as sess:
+            with ec.start_pipe_log(sink, sess) as execution_session:
+                execution_session.log_input(sess.merge(block))
+                raise Exception("pipe FAIL")
+    with env.session_scope() as sess:
+        assert (
+            sess.query(DataBlockLog)
+            .filter(DataBlockLog.direction == Direction.INPUT)
+            .count()
+            == 1
+        )
+    # Kept when only a savepoint rolls back
+    with env.session_scope() as sess:
+        with ec.start_pipe_log(sink, sess) as execution_session:
+            execution_session.log_input(sess.merge(block))
+            with pytest.raises(Exception):
+                with sess.begin_nested():
+                    raise Exception("savepoint FAIL")
+    with env.session_scope() as sess:
+        assert (
+            sess.query(DataBlockLog)
+            .filter(DataBlockLog.direction == Direction.INPUT)
+            .count()
+            == 2
+        )
+
+
+def test_buffered_data_block_logs_not_flushed_by_savepoint():
+    env, g, ec = make_test_graph_context()
+    source = g.create_node(key="source", pipe=pipe_dl_source)
+    sink = g.create_node(key="sink", pipe=pipe_t1_sink, upstream="source")
+    block = ExecutionManager(ec).execute_to_output(source)
+    with env.session_scope() as sess:
+        with ec.start_pipe_log(sink, sess) as execution_session:
+            execution_session.log_input(sess.merge(block))
+            with sess.begin_nested():
+                pass
+            # Still buffered, only written by the outermost commit
+            assert len(get_metadata_writer(sess).logs) == 1
+            assert (
+                sess.query(DataBlockLog)
+                .filter(DataBlockLog.direction == Direction.INPUT)
+                .count()
+                == 0
+            )
+    with env.session_scope() as sess:
+        assert (
+            sess.query(DataBlockLog)
+            .filter(DataBlockLog.direction == Direction.INPUT)
+            .count()
+            == 1
+        )
@@ -271,6 +271,9 @@ def test_pipe_interface(pipe: PipeLike, expected: PipeInterface):
     else:
         raise
     assert val == expected
+    if isinstance(pipe, Pipe):
+        # Cached
+        assert pipe.get_interface() is val
     node = DeclaredNode(key="_test", pipe=pipe, upstream={"input": "mock"}).instantiate(
         env
     )
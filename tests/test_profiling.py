@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from snapflow.core.execution import ExecutionManager
+from snapflow.core.node import PipeLog
+from tests.utils import make_test_graph_context, mock_dl_output, pipe_dl_source
+
+
+def test_pipe_log_timings():
+    env, g, ec = make_test_graph_context()
+    source = g.create_node(key="source", pipe=pipe_dl_source)
+    em = ExecutionManager(ec)
+    em.execute(source)
+    with env.session_scope() as sess:
+        pl = sess.query(PipeLog).filter(PipeLog.node_key == "source").one()
+        timings = pl.timings
+    for phase in (
+        "bind_inputs",
+        "pipe_call",
+        "handle_output",
+        "conform_to_schema",
+        "validate",
+    ):
+        assert timings[phase]["calls"] >= 1
+        assert timings[phase]["seconds"] >= 0
+    # Only the output flush, validation is timed on its own
+    assert timings["metadata_flush"]["calls"] == 1
+    assert timings["conform_to_schema"]["records"] == len(mock_dl_output)
+    assert timings["convert"]["records"] == len(mock_dl_output)
@@ -7,8 +7,16 @@ from sys import implementation
 
 import pandas as pd
 import pytest
+from snapflow.core.data_block import DataBlock, DataBlockMetadata
+from snapflow.core.graph import Graph
 from snapflow.core.module import DEFAULT_LOCAL_MODULE_NAME
+from snapflow.core.metadata.writer import get_metadata_writer
+from snapflow.core.node import Direction, PipeLog
 from snapflow.core.pipe_interface import get_schema_translation
+from snapflow.core.typing.casting import (
+    cast_to_realized_schema,
+    update_matching_field_definitions,
+)
 from snapflow.core.typing.inference import (
     cast_python_object_to_sqlalchemy_type,
     infer_schema_fields_from_records,
@@ -25,7 +33,9 @@ from snapflow.schema.base import (
     is_generic,
     schema_from_yaml,
 )
-from tests.utils import make_test_env, sample_records
+from snapflow.storage.db.utils import get_tmp_sqlite_db_url
+from sqlalchemy.exc import IntegrityError
+from tests.utils import TestSchema4, make_test_env, pipe_dl_source, sample_records
 
 test_schema_yml = """
 name: TestSchema
@@ -137,6 +147,122 @@ def test_generated_schema():
         assert env.get_generated_schema("pizza", sess) is None
 
 
+def test_generated_schemas_interned():
+    s1 = infer_schema_from_records(sample_records)
+    s2 = infer_schema_from_records(list(sample_records))
+    assert s1.key == s2.key
+    assert s1.fingerprint() == s2.fingerprint()
+    other = infer_schema_from_records([{"other": 1}])
+    assert other.key != s1.key
+    db_url = get_tmp_sqlite_db_url()
+    env = make_test_env(metadata_storage=db_url)
+    with env.session_scope() as sess:
+        env.add_new_generated_schema(s1, sess)
+        env.add_new_generated_schema(s2, sess)
+    # Fresh environment on same metadata: stored schema is reused
+    env = make_test_env(metadata_storage=db_url)
+    with env.session_scope() as sess:
+        env.add_new_generated_schema(s2, sess)
+        assert sess.query(GeneratedSchema).count() == 1
+    env = make_test_env(metadata_storage=db_url)
+    with env.session_scope() as sess:
+        assert env.get_schema(s1.key, sess) == s1
+        assert env.get_schema(s1.key, sess) == s1
+    assert env.schema_cache.hits == 1
+    assert s1.key in env.schema_cache
+
+
+def test_realized_schema_memoized():
+    env = make_test_env()
+    inferred = infer_schema_from_records([{"a": 1, "b": "x"}])
+    nominal = create_quick_schema("Nominal", [("a", "Integer")])
+    with env.session_scope() as sess:
+        realized = cast_to_realized_schema(env, sess, inferred, nominal)
+        assert realized.key != inferred.key
+        assert cast_to_realized_schema(env, sess, inferred, nominal) is realized
+        assert sess.query(GeneratedSchema).get(realized.key) is not None
+        # Only memoized for other sessions once committed
+        assert len(env.realized_schemas) == 0
+    assert len(env.realized_schemas) == 1
+
+
+def test_realized_schema_named_by_fields():
+    env = make_test_env()
+    inferred = infer_schema_from_records([{"a": 1, "b": "x"}])
+    nominal = create_quick_schema("Nominal", [("a", "Integer")])
+    # Same name, changed definition
+    changed = create_quick_schema("Nominal", [("a", "BigInteger")])
+    with env.session_scope() as sess:
+        realized = update_matching_field_definitions(env, sess, inferred, nominal)
+        realized_changed = update_matching_field_definitions(
+            env, sess, inferred, changed
+        )
+        assert realized_changed.key != realized.key
+        assert realized_changed.get_field("a").field_type == "BigInteger"
+        assert env.get_schema(realized_changed.key, sess) == realized_changed
+
+
+def test_schema_cache_rolled_back():
+    env = make_test_env()
+    s1 = infer_schema_from_records(sample_records)
+    with pytest.raises(ValueError):
+        with env.session_scope() as sess:
+            env.add_new_generated_schema(s1, sess)
+            assert env.get_schema(s1.key, sess) == s1
+            raise ValueError("Roll back")
+    # The schema was never stored, so must not be cached either
+    assert s1.key not in env.schema_cache
+    with env.session_scope() as sess:
+        with pytest.raises(KeyError):
+            env.get_schema(s1.key, sess)
+        env.add_new_generated_schema(s1, sess)
+        assert sess.query(GeneratedSchema).count() == 1
+    assert s1.key in env.schema_cache
+
+
+def test_generated_schema_unrelated_integrity_error():
+    env = make_test_env(metadata_storage=get_tmp_sqlite_db_url())
+    s1 = infer_schema_from_records(sample_records)
+    with pytest.raises(IntegrityError):
+        with env.session_scope() as sess:
+            # Not a schema conflict, so must not be swallowed (with the schema)
+            pipe_log = PipeLog(node_key="node")  # Never added, so has no id
+            block = DataBlockMetadata(id="block")
+            get_metadata_writer(sess).log(pipe_log, block, Direction.INPUT)
+            env.add_new_generated_schema(s1, sess)
+    assert s1.key not in env.schema_cache
+    with env.session_scope() as sess:
+        env.add_new_generated_schema(s1, sess)
+        env.add_new_generated_schema(s1, sess)
+        assert sess.query(GeneratedSchema).count() == 1
+    assert s1.key in env.schema_cache
+
+
+def pipe_generator(input: DataBlock[TestSchema4]):
+    for i in range(3):
+        yield [{"a": i}]
+
+
+def test_pending_generated_schema_no_autoflush():
+    # Looking up a schema stored (but not committed) by the session must not
+    # flush the generator output's pending stored blocks mid copy
+    env = make_test_env(metadata_storage=get_tmp_sqlite_db_url())
+    g = Graph(env)
+    g.create_node(key="source", pipe=pipe_dl_source)
+    g.create_node(key="generator", pipe=pipe_generator, upstream="source")
+    env.run_graph(g, target_storage=get_tmp_sqlite_db_url())
+    with env.session_scope() as sess:
+        block = (
+            sess.query(DataBlockMetadata)
+            .filter(DataBlockMetadata.created_by_node_key == "generator")
+            .one()
+        )
+        assert sess.query(GeneratedSchema).get(block.realized_schema_key)
+        assert block.as_managed_data_block(
+            env.get_run_context(g), sess
+        ).as_records() == [{"a": i} for i in range(3)]
+
+
 def test_any_schema():
     env = make_test_env()
     env.add_module(core)
@@ -1,7 +1,19 @@
 from __future__ import annotations
 
+import pytest
+from snapflow.core.execution import ExecutionManager
+from snapflow.core.graph import Graph
+from snapflow.core.node import PipeLog
+from snapflow.core.sql.fusion import compile_fused_sql
 from snapflow.core.sql.pipe import sql_pipe
-from tests.utils import make_test_env
+from snapflow.storage.data_formats import Records
+from snapflow.storage.db.utils import get_tmp_sqlite_db_url
+from sqlalchemy import inspect
+from tests.utils import TestSchema4, make_test_env
+
+
+def pipe_source() -> Records[TestSchema4]:
+    return [{"f1": "a", "f2": 1}, {"f1": "b", "f2": 2}, {"f1": "c", "f2": 3}]
 
 
 def test_sql_pipe_interface():
@@ -122,3 +134,75 @@ def test_sql_pipe_interface_complex_jinja():
     assert pi.inputs[0].schema_like == "T"
     assert pi.output.is_generic
     assert pi.output is not None
+
+
+def test_compile_fused_sql():
+    stmts = compile_fused_sql(
+        "select * from t1;",
+        [
+            ("input", "select a from input where a > 1"),
+            ("input", "select count(*) as c from input"),
+        ],
+    )
+    assert len(stmts) == 3
+    assert stmts[0] == "select * from t1"
+    assert stmts[-1].startswith("with _fused_0 as (\nselect * from t1\n),\n_fused_1 as")
+    assert "from _fused_0 as input where a > 1" in stmts[-1]
+    assert stmts[-1].endswith("select count(*) as c from _fused_1 as input")
+
+
+@pytest.mark.parametrize("fused_sql_views", [False, True])
+def test_fused_sql_chain(fused_sql_views: bool):
+    env = make_test_env()
+    db_url = get_tmp_sqlite_db_url()
+    env.add_storage(db_url)
+    g = Graph(env)
+    g.create_node(key="source", pipe=pipe_source)
+    g.create_node(
+        key="filtered",
+        pipe=sql_pipe("filtered", "select * from input where f2 > 1"),
+        upstream="source",
+    )
+    g.create_node(
+        key="doubled",
+        pipe=sql_pipe("doubled", "select f1, f2 * 2 as f2 from input"),
+        upstream="filtered",
+    )
+    g.create_node(
+        key="total",
+        pipe=sql_pipe("total", "select sum(f2) as total from input"),
+        upstream="doubled",
+    )
+    assert g.get_fusable_sql_chains() == [["filtered", "doubled", "total"]]
+    ec = env.get_run_context(
+        g,
+        target_storage=db_url,
+        fuse_sql_chains=True,
+        fused_sql_views=fused_sql_views,
+    )
+    em = ExecutionManager(ec)
+    outputs = em.execute_many(g.get_all_nodes_in_execution_order(), to_exhaustion=True)
+    db_api = env.add_storage(db_url).get_api()
+    with env.session_scope() as sess:
+        total = sess.merge(outputs["total"])
+        assert total.record_count == 1
+        sdb = total.stored_data_blocks[0]
+        with db_api.execute_sql_result(f"select total from {sdb.get_name()}") as res:
+            assert res.fetchall() == [(10,)]
+        assert sess.query(PipeLog).filter(PipeLog.node_key != "source").count() == 3
+        for key in ("filtered", "doubled"):
+            if fused_sql_views:
+                block = sess.merge(outputs[key])
+                # Views are queryable, but not materialized
+                assert block.record_count is None
+                sdb = block.stored_data_blocks[0]
+                assert db_api.count(sdb.get_name()) == 2
+            else:
+                assert outputs[key] is None
+    # The tail descends from the head's inputs, with or without views
+    source_id, total_id = [inspect(outputs[k]).identity[0] for k in ("source", "total")]
+    assert source_id in [b.id for b in env.block_ancestors(total_id)]
+    # Nothing left to process
+    chain = [g.get_node(k) for k in ("filtered", "doubled", "total")]
+    outputs = em.execute_many(chain, to_exhaustion=True)
+    assert outputs["total"] is None
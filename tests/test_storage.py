@@ -1,25 +1,37 @@
 from __future__ import annotations
 
+import gc
 import os
 import tempfile
 from typing import Type
 
 import pytest
 from snapflow.storage.data_records import MemoryDataRecords, as_records
-from snapflow.storage.db.api import DatabaseApi, DatabaseStorageApi
+from snapflow.storage.db.api import (
+    DatabaseApi,
+    DatabaseStorageApi,
+    dispose_all,
+    get_engine_pool_settings,
+)
 from snapflow.storage.db.mysql import MysqlDatabaseStorageApi
 from snapflow.storage.db.postgres import PostgresDatabaseStorageApi
+from snapflow.storage.db.sqlite import retry_on_busy
+from snapflow.storage.db.utils import get_tmp_sqlite_db_url
 from snapflow.storage.file_system import FileSystemStorageApi
 from snapflow.storage.storage import (
     LOCAL_PYTHON_STORAGE,
     LocalFileSystemStorageEngine,
     LocalPythonStorageEngine,
+    MemoryStorageManager,
     MysqlStorageEngine,
     PostgresStorageEngine,
     PythonStorageApi,
     SqliteStorageEngine,
     Storage,
+    estimate_memory_size,
 )
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
 
 
 def test_storage():
@@ -112,3 +124,122 @@ def test_filesystem_api_core_operations(url):
     assert api.record_count(name + "alias") == 2
     api.copy(name, name + "copy")
     assert api.record_count(name + "copy") == 2
+
+
+def test_memory_storage_manager():
+    mgr = MemoryStorageManager(budget_bytes=None, spill=False)
+    records = as_records([{"a": i} for i in range(100)])
+    mgr.put("python://s/a", records)
+    mgr.put("python://s/a_alias", records)
+    size = estimate_memory_size(records.records_object)
+    # Aliases share the object's size
+    assert mgr.total_bytes == size
+    mgr.budget_bytes = size * 2
+    mgr.put("python://s/b", as_records([{"a": i} for i in range(100)]))
+    assert len(mgr) == 3
+    # Over budget: least recently used object evicted with all its paths
+    mgr.put("python://s/c", as_records([{"a": i} for i in range(100)]))
+    assert "python://s/a" not in mgr
+    assert "python://s/a_alias" not in mgr
+    assert mgr.evicted_count == 2
+    assert mgr.total_bytes <= mgr.budget_bytes
+
+    # Objects used by an active run are pinned
+    with mgr.run_scope():
+        assert mgr.get("python://s/b") is not None
+        mgr.put("python://s/d", as_records([{"a": i} for i in range(100)]))
+        assert "python://s/b" in mgr
+        assert "python://s/c" not in mgr
+        assert mgr.is_pinned("python://s/d")
+        mgr.put("python://s/e", as_records([{"a": i} for i in range(100)]))
+        assert len(mgr) == 3
+    # Evicted once unpinned
+    assert not mgr.is_pinned("python://s/d")
+    assert mgr.total_bytes <= mgr.budget_bytes
+    assert "python://s/b" not in mgr
+    mgr.remove("python://s/e")
+    mgr.clear()
+    assert mgr.total_bytes == 0
+
+
+def test_memory_storage_spill():
+    mgr = MemoryStorageManager(budget_bytes=None, spill_dir=tempfile.mkdtemp())
+    records = as_records([{"a": i} for i in range(100)])
+    mgr.put("python://s/a", records)
+    mgr.put("python://s/a_alias", records)
+    mgr.budget_bytes = estimate_memory_size(records.records_object)
+    mgr.put("python://s/b", as_records([{"b": i} for i in range(100)]))
+    assert mgr.is_spilled("python://s/a")
+    assert mgr.is_spilled("python://s/a_alias")
+    assert "python://s/a" in mgr
+    assert len(os.listdir(mgr.spill_dir)) == 1
+    assert mgr.spilled_count == 1
+
+    # Reloaded on read, with its aliases, spilling the other object
+    mdr = mgr.get("python://s/a_alias")
+    assert mdr.records_object == records.records_object
+    assert mgr.get("python://s/a") is mdr
+    assert mgr.is_spilled("python://s/b")
+    mgr.remove("python://s/b")
+    assert os.listdir(mgr.spill_dir) == []
+    mgr.clear()
+
+
+def test_memory_storage_spill_dir_removed():
+    mgr = MemoryStorageManager(budget_bytes=0)
+    mgr.put("python://s/a", as_records([{"a": i} for i in range(100)]))
+    spill_dir = mgr.spill_dir
+    assert os.path.isdir(spill_dir)
+    del mgr
+    gc.collect()
+    assert not os.path.exists(spill_dir)
+
+
+def test_sqlite_engine_profile():
+    api = Storage.from_url(get_tmp_sqlite_db_url()).get_api()
+    eng = api.get_engine()
+    assert isinstance(eng.pool, QueuePool)
+    with eng.connect() as conn:
+        assert conn.execute("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.execute("PRAGMA busy_timeout").scalar() == 30000
+    # In-memory databases keep the default (per connection) setup
+    eng = Storage.from_url("sqlite://").get_api().get_engine()
+    assert not isinstance(eng.pool, QueuePool)
+
+
+def test_retry_on_busy():
+    calls = []
+
+    def locked_once():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationalError("insert", {}, Exception("database is locked"))
+        return len(calls)
+
+    assert retry_on_busy(locked_once, backoff_seconds=0) == 2
+    calls.clear()
+    with pytest.raises(OperationalError):
+        retry_on_busy(locked_once, retries=0)
+
+    def other_error():
+        calls.append(1)
+        raise OperationalError("insert", {}, Exception("no such table"))
+
+    calls.clear()
+    with pytest.raises(OperationalError):
+        retry_on_busy(other_error, backoff_seconds=0)
+    assert len(calls) == 1
+
+
+def test_shared_engines():
+    url = get_tmp_sqlite_db_url()
+    eng = Storage.from_url(url).get_api().get_engine()
+    assert Storage.from_url(url).get_api().get_engine() is eng
+    assert eng.pool._pre_ping
+    assert eng.pool.size() == get_engine_pool_settings().pool_size
+    # Each in-memory engine is its own database, so is never shared
+    api = Storage.from_url("sqlite://").get_api()
+    assert api.get_engine() is not Storage.from_url("sqlite://").get_api().get_engine()
+
+    dispose_all(url)
+    assert Storage.from_url(url).get_api().get_engine() is not eng
@@ -2,7 +2,13 @@ from __future__ import annotations
 
 from snapflow.core.data_block import DataBlockMetadata
 from snapflow.core.graph import Graph
-from snapflow.core.node import DataBlockLog, Direction, PipeLog
+from snapflow.core.node import (
+    DataBlockLog,
+    Direction,
+    NodeBlockIndex,
+    PipeLog,
+    ensure_node_block_index,
+)
 from snapflow.core.operators import filter, latest, operator
 from snapflow.core.streams import DataBlockStream, StreamBuilder
 from tests.utils import (
@@ -214,3 +220,28 @@ class TestStreams:
             )
         )
         assert self._cnt == 0
+
+    def test_node_block_index(self):
+        dfl = PipeLog(
+            graph_id=self.graph.hash,
+            node_key=self.node_source.key,
+            pipe_key=self.node_source.pipe.key,
+            runtime_url="test",
+        )
+        # Logged twice, indexed once
+        drls = [
+            DataBlockLog(
+                pipe_log=dfl, data_block=self.dr1t1, direction=Direction.OUTPUT
+            )
+            for _ in range(2)
+        ]
+        self.sess.add_all([dfl] + drls)
+        self.sess.flush()
+        entries = self.sess.query(NodeBlockIndex).all()
+        assert [(e.node_key, e.data_block_id, e.direction) for e in entries] == [
+            (self.node_source.key, self.dr1t1.id, Direction.OUTPUT)
+        ]
+        # Rebuilt from the log if missing
+        self.sess.query(NodeBlockIndex).delete()
+        ensure_node_block_index(self.sess.connection())
+        assert self.sess.query(NodeBlockIndex).count() == 1
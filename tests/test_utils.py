@@ -7,6 +7,7 @@ import pytest
 from numpy import NaN
 from pandas import DataFrame
 from snapflow.utils.common import (
+    LRUCache,
     SnapflowJSONEncoder,
     StringEnum,
     is_datetime_str,
@@ -141,3 +142,20 @@ def test_with_header():
 #     df = coerce_dataframe_to_schema(df, TestSchema4)
 #     dfe = DataFrame({"f1": [str(i) for i in range(10)], "f2": range(10)})
 #     assert_dataframes_are_almost_equal(df, dfe, TestSchema4)
+
+
+def test_lru_cache():
+    cache: LRUCache[str, int] = LRUCache(maxsize=2)
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    # `b` least recently used
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+    assert cache.stats() == dict(hits=3, misses=1, size=2, maxsize=2)
+    cache.clear()
+    assert len(cache) == 0
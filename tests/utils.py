@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Tuple
+
 from pandas import DataFrame
 from snapflow.core.data_block import DataBlock
 from snapflow.core.environment import Environment
@@ -9,6 +11,8 @@ from snapflow.core.module import SnapflowModule
 from snapflow.core.runtime import Runtime, RuntimeClass, RuntimeEngine
 from snapflow.core.streams import DataBlockStream
 from snapflow.schema.base import create_quick_schema
+from snapflow.storage.data_formats import Records
+from snapflow.storage.db.utils import get_tmp_sqlite_db_url
 from snapflow.storage.storage import Storage, StorageClass, StorageEngine
 from snapflow.utils.common import rand_str
 from snapflow.utils.typing import T
@@ -66,6 +70,19 @@ def make_test_execution_manager(**kwargs) -> ExecutionManager:
     return ExecutionManager(make_test_run_context(**kwargs))
 
 
+def make_test_graph_context(**kwargs) -> Tuple[Environment, Graph, RunContext]:
+    """
+    A test environment, with an empty graph and a run context for it (on the
+    environment's first runtime and targeting a fresh sqlite database, unless
+    given others).
+    """
+    env = make_test_env()
+    g = Graph(env)
+    kwargs.setdefault("current_runtime", env.runtimes[0])
+    kwargs.setdefault("target_storage", get_tmp_sqlite_db_url())
+    return env, g, env.get_run_context(g, **kwargs)
+
+
 def pipe_t1_sink(ctx: PipeContext, input: DataBlock[TestSchema1]):
     pass
 
@@ -86,6 +103,17 @@ def pipe_stream(input: DataBlockStream) -> DataBlock:
     pass
 
 
+mock_dl_output = [{"f1": "2"}, {"f2": 3}]
+
+
+def pipe_dl_source() -> Records[TestSchema4]:
+    return mock_dl_output
+
+
+def pipe_passthrough(input: DataBlock[TestSchema4]) -> Records[TestSchema4]:
+    return input.as_records()
+
+
 pipe_chain_t1_to_t2 = (
     pipe_t1_to_t2  # pipe_chain("pipe_chain_t1_to_t2", [pipe_t1_to_t2, pipe_generic])
 )